@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+"""
+async_enrichment.py
+
+Motor asíncrono de enriquecimiento: reemplaza el recorrido pista-a-pista de
+enrich_challenge_set_accousticbrainzOptimized.py por un único cliente aiohttp
+con pool de conexiones que consulta Spotify, Last.fm, MusicBrainz y
+AcousticBrainz en paralelo.
+
+Cada servicio tiene su propio token bucket, que se adapta en caliente a los
+headers X-RateLimit-Remaining / X-RateLimit-Reset-In / Retry-After.
+
+Las respuestas GET pasan por la caché en disco de http_cache.py, así que
+una re-ejecución apenas toca la red. Para probar sin red, las respuestas
+también pueden grabarse (--record) en un JSONL y
+reproducirse luego con mock_replay_server.py (--mock-url).
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from dotenv import load_dotenv
+
+import aiohttp
+
+from challenge_stream import iter_unique_track_ids
+from checkpoint_store import CheckpointStore
+from http_cache import ResponseCache, cache_key
+from mbid_resolver import (PAGE_SIZE, ISRC_BATCH, normalize_isrc, normalize_text,
+                           isrc_query, name_query, pick_recording, group_by_isrc,
+                           mb_record, rating_from_doc)
+from removeAMBVersions import strip_highlevel_versions
+
+# ------------------------------------------------------------
+# 1) Configuración de servicios y límites de tasa
+# ------------------------------------------------------------
+# rate = peticiones/segundo sostenidas, burst = capacidad del bucket
+SERVICES = {
+    "spotify_auth":   {"base": "https://accounts.spotify.com/api", "rate": 1.0, "burst": 1},
+    "spotify":        {"base": "https://api.spotify.com/v1",       "rate": 10.0, "burst": 10},
+    "lastfm":         {"base": "http://ws.audioscrobbler.com/2.0", "rate": 5.0, "burst": 5},
+    "musicbrainz":    {"base": "https://musicbrainz.org/ws/2",     "rate": 1.0, "burst": 1},
+    "acousticbrainz": {"base": "https://acousticbrainz.org/api/v1", "rate": 1.0, "burst": 10},
+}
+
+# Parámetros que nunca deben formar parte de la clave de una grabación
+SECRET_PARAMS = {"api_key", "client_id", "client_secret"}
+# Campos de respuesta que no se escriben en la grabación (el mock devuelve el marcador)
+SECRET_FIELDS = {"access_token", "refresh_token"}
+REDACTED = "<redactado>"
+
+USER_AGENT = "AsyncEnrichment/1.0 ( micorreo@ejemplo.com )"
+
+
+def chunk_list(lst, n):
+    """Divide una lista en trozos de tamaño máximo n."""
+    for i in range(0, len(lst), n):
+        yield lst[i:i+n]
+
+
+def request_key(method, service, path, params=None, data=None):
+    """
+    Clave normalizada de una petición (usada para grabar y reproducir):
+    query string + cuerpo de formulario (POST), sin SECRET_PARAMS.
+    """
+    fields = {**(params or {}), **(data or {})}
+    items = sorted(
+        (str(k), str(v)) for k, v in fields.items()
+        if k not in SECRET_PARAMS
+    )
+    return json.dumps([method.upper(), service, path, items], ensure_ascii=False)
+
+
+def _header_number(headers, name):
+    raw = headers.get(name)
+    if raw is None:
+        return None
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+# ------------------------------------------------------------
+# 2) Token bucket adaptativo por servicio
+# ------------------------------------------------------------
+class TokenBucket:
+    """
+    Limitador token bucket para asyncio.
+
+    - acquire() espera hasta que haya un token disponible.
+    - update_from_headers() ajusta la tasa con lo que informa el servidor:
+      con X-RateLimit-Remaining/Reset-In reparte los tokens restantes en la
+      ventana; con 429/503 + Retry-After bloquea el bucket hasta que expire.
+    """
+
+    def __init__(self, rate, burst=1, min_rate=0.1):
+        self.base_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds):
+        """Detiene el bucket durante `seconds` segundos (p.ej. tras un 429)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    def update_from_headers(self, status, headers):
+        retry_after = _header_number(headers, "Retry-After")
+        reset_in = _header_number(headers, "X-RateLimit-Reset-In")
+        remaining = _header_number(headers, "X-RateLimit-Remaining")
+
+        if status in (429, 503):
+            wait = retry_after if retry_after is not None else (reset_in or 10)
+            self.block(wait + 1)
+            # Penaliza la tasa sostenida hasta que el servidor vuelva a holgar
+            self.rate = max(self.min_rate, self.rate / 2)
+            return
+
+        if remaining is None:
+            # Sin información del servidor: recupera poco a poco la tasa base
+            self.rate = min(self.base_rate, self.rate * 1.1)
+            return
+
+        if remaining < 1:
+            self.block((reset_in if reset_in is not None else 1) + 0.5)
+        elif reset_in:
+            # Reparte los tokens restantes a lo largo de la ventana
+            window_rate = remaining / max(reset_in, 0.5)
+            self.rate = max(self.min_rate, min(self.base_rate, window_rate))
+            self.tokens = min(self.tokens, remaining)
+
+
+# ------------------------------------------------------------
+# 3) Cliente HTTP compartido
+# ------------------------------------------------------------
+class AsyncEnricher:
+    """
+    Cliente único (aiohttp + TCPConnector con keep-alive) para los cuatro
+    servicios. Usar como `async with AsyncEnricher(...) as engine:`.
+    """
+
+    def __init__(self, spotify_id=None, spotify_secret=None, lastfm_key=None,
+                 mock_url=None, record_path=None, max_connections=32,
+                 max_retries=4, timeout=20, cache=None):
+        self.spotify_id = spotify_id
+        self.spotify_secret = spotify_secret
+        self.lastfm_key = lastfm_key
+        self.mock_url = mock_url.rstrip("/") if mock_url else None
+        self.record_path = record_path
+        self.cache = cache
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.buckets = {
+            name: TokenBucket(cfg["rate"], cfg["burst"])
+            for name, cfg in SERVICES.items()
+        }
+        self.stats = {name: {"requests": 0, "errors": 0, "throttled": 0}
+                      for name in SERVICES}
+        self.session = None
+        self._spotify_token = None
+        self._spotify_token_exp = 0.0
+        self._token_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                         limit_per_host=8, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(
+            connector=connector, timeout=self.timeout,
+            headers={"User-Agent": USER_AGENT},
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def _url(self, service, path):
+        if self.mock_url:
+            return f"{self.mock_url}/{service}{path}"
+        return SERVICES[service]["base"] + path
+
+    def _record(self, method, service, path, params, data, status, headers, body):
+        if not self.record_path:
+            return
+        if isinstance(body, dict) and SECRET_FIELDS & body.keys():
+            body = {k: REDACTED if k in SECRET_FIELDS else v for k, v in body.items()}
+        entry = {
+            "key": request_key(method, service, path, params, data),
+            "status": status,
+            "headers": {k: v for k, v in headers.items()
+                        if k.lower().startswith(("x-ratelimit", "retry-after"))},
+            "body": body,
+        }
+        with open(self.record_path, "a", encoding="utf-8") as frec:
+            frec.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    async def request_json(self, service, path, params=None, method="GET",
+                           data=None, headers=None):
+        """
+        Petición con token bucket, reintentos y adaptación por headers.
+        Retorna el JSON decodificado o None si falla definitivamente.
+        """
+        bucket = self.buckets[service]
+        stats = self.stats[service]
+        url = self._url(service, path)
+
+        # La caché se indexa por la URL real del servicio (no la del mock)
+        cacheable = self.cache is not None and method == "GET"
+        if cacheable:
+            ckey = cache_key(service, SERVICES[service]["base"] + path, params)
+            hit = self.cache.get(ckey)
+            if hit is not None:
+                return json.loads(hit[2]) if hit[0] == 200 else None
+            if self.cache.offline:
+                return None
+        elif self.cache is not None and self.cache.offline:
+            return None
+
+        for attempt in range(self.max_retries):
+            await bucket.acquire()
+            stats["requests"] += 1
+            try:
+                async with self.session.request(method, url, params=params, data=data,
+                                                headers=headers) as resp:
+                    bucket.update_from_headers(resp.status, resp.headers)
+                    if resp.status in (429, 503):
+                        stats["throttled"] += 1
+                        continue
+                    if resp.status == 404:
+                        self._record(method, service, path, params, data, 404, resp.headers, None)
+                        if cacheable:
+                            # Un 404 también es una respuesta estable: no se vuelve a pedir
+                            self.cache.set(ckey, service, 404, {}, b"null")
+                        return None
+                    resp.raise_for_status()
+                    raw = await resp.read()
+                    body = json.loads(raw)
+                    self._record(method, service, path, params, data, resp.status, resp.headers, body)
+                    if cacheable:
+                        self.cache.set(ckey, service, 200, {}, raw)
+                    return body
+            except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+                stats["errors"] += 1
+                if attempt == self.max_retries - 1:
+                    print(f"  ❌ {service} {path}: {e}")
+                await asyncio.sleep(2 ** attempt)
+        return None
+
+    # --------------------------------------------------------
+    # 3.1) Spotify
+    # --------------------------------------------------------
+    async def _spotify_auth_header(self):
+        async with self._token_lock:
+            if not self._spotify_token or time.time() > self._spotify_token_exp:
+                auth = await self.request_json(
+                    "spotify_auth", "/token", method="POST",
+                    data={"grant_type": "client_credentials",
+                          "client_id": self.spotify_id,
+                          "client_secret": self.spotify_secret},
+                )
+                if not auth:
+                    return {}
+                self._spotify_token = auth["access_token"]
+                self._spotify_token_exp = time.time() + auth.get("expires_in", 3600) - 60
+        return {"Authorization": f"Bearer {self._spotify_token}"}
+
+    async def spotify_tracks(self, track_ids):
+        """Metadata de hasta 50 pistas por petición (mismo formato que spotify_metadata.json)."""
+        headers = await self._spotify_auth_header()
+        res = await self.request_json("spotify", "/tracks",
+                                      params={"ids": ",".join(track_ids)},
+                                      headers=headers)
+        meta = {}
+        for tr in (res or {}).get("tracks", []):
+            if tr is None:
+                continue
+            meta[tr["id"]] = {
+                "track_name":   tr["name"],
+                "artist_name":  tr["artists"][0]["name"],
+                "duration_ms":  tr["duration_ms"],
+                "explicit":     tr["explicit"],
+                "popularity":   tr["popularity"],
+                "release_date": tr["album"]["release_date"],
+                "isrc":         tr.get("external_ids", {}).get("isrc"),
+            }
+        return meta
+
+    # --------------------------------------------------------
+    # 3.2) Last.fm
+    # --------------------------------------------------------
+    async def lastfm_tags(self, track_name, artist_name):
+        if not (self.lastfm_key and track_name and artist_name):
+            return []
+        params = {"method": "track.getInfo", "track": track_name,
+                  "artist": artist_name, "api_key": self.lastfm_key,
+                  "format": "json", "autocorrect": 1}
+        res = await self.request_json("lastfm", "/", params=params)
+        tags = (res or {}).get("track", {}).get("toptags", {}).get("tag", [])
+        if isinstance(tags, dict):
+            tags = [tags]
+        return [t["name"] for t in tags if "name" in t]
+
+    # --------------------------------------------------------
+    # 3.3) MusicBrainz (API JSON de ws/2)
+    # --------------------------------------------------------
+    async def mb_search_isrcs(self, isrcs):
+        """{isrc: [docs]} para un lote de ISRCs con una búsqueda (más páginas si hacen falta)."""
+        docs, offset = [], 0
+        while True:
+            res = await self.request_json("musicbrainz", "/recording", params={
+                "query": isrc_query(isrcs), "limit": PAGE_SIZE, "offset": offset, "fmt": "json"})
+            page = (res or {}).get("recordings", [])
+            docs.extend(page)
+            offset += len(page)
+            if not page or offset >= res.get("count", 0):
+                return group_by_isrc(docs, set(isrcs))
+
+    async def mb_search_recording(self, track_name, artist_name):
+        """Documento de la mejor grabación por nombre (incluye tags)."""
+        if not track_name or not artist_name:
+            return None
+        res = await self.request_json("musicbrainz", "/recording", params={
+            "query": name_query(track_name, artist_name), "limit": 1, "fmt": "json"})
+        recs = (res or {}).get("recordings", [])
+        return recs[0] if recs else None
+
+    async def mb_rating(self, mbid):
+        res = await self.request_json("musicbrainz", f"/recording/{mbid}",
+                                      params={"inc": "ratings", "fmt": "json"})
+        return rating_from_doc(res)
+
+    # --------------------------------------------------------
+    # 3.4) AcousticBrainz (bulk de 25 MBIDs)
+    # --------------------------------------------------------
+    async def acousticbrainz_bulk(self, mbids):
+        ids = ";".join(mbids)
+        ll_json, hl_json = await asyncio.gather(
+            self.request_json("acousticbrainz", "/low-level", params={"recording_ids": ids}),
+            self.request_json("acousticbrainz", "/high-level", params={"recording_ids": ids}),
+        )
+        return ll_json or {}, hl_json or {}
+
+
+# ------------------------------------------------------------
+# 4) Composición del registro por pista
+# ------------------------------------------------------------
+def first_doc(bulk_json, mbid):
+    """AcousticBrainz devuelve {mbid: {"0": doc, ...}}; tomamos el primer documento."""
+    raw = bulk_json.get(mbid, {})
+    return next(iter(raw.values()), {}) if isinstance(raw, dict) else {}
+
+
+def build_record(mb, ll, hl, lfm_tags):
+    return strip_highlevel_versions({
+        "mbid":            mb["mbid"],
+        "resolved_by":     mb["resolved_by"],
+        "genre_mb":        mb["genre_mb"],
+        "bpm":             ll.get("rhythm", {}).get("bpm"),
+        "energy":          ll.get("lowlevel", {}).get("dynamic_complexity"),
+        "danceability_ll": ll.get("rhythm", {}).get("danceability"),
+        "loudness":        ll.get("lowlevel", {}).get("average_loudness"),
+        "rating_value":    mb["rating_value"],
+        "rating_votes":    mb["rating_votes"],
+        "highlevel":       hl.get("highlevel", {}),
+        "lastfm_tags":     lfm_tags,
+    })
+
+
+async def resolve_mbids(engine, metas, fetch_ratings=False):
+    """
+    MBIDs ISRC primero (ver mbid_resolver.py): una búsqueda por lote de
+    ISRCs y búsqueda por nombre solo para lo no resuelto, una vez por par
+    (pista, artista). Retorna {tid: registro MusicBrainz}.
+    """
+    by_isrc = {}
+    for tid, meta in metas.items():
+        isrc = normalize_isrc(meta.get("isrc"))
+        if isrc:
+            by_isrc.setdefault(isrc, []).append(tid)
+    isrcs = sorted(by_isrc)
+    found = {}
+    for part in await asyncio.gather(*(engine.mb_search_isrcs(c)
+                                       for c in chunk_list(isrcs, ISRC_BATCH))):
+        found.update(part)
+
+    out = {}
+    for isrc, tids in by_isrc.items():
+        for tid in tids:
+            doc = pick_recording(found.get(isrc), metas[tid].get("track_name"))
+            if doc:
+                out[tid] = mb_record(doc, "isrc")
+
+    pairs = {}
+    for tid, meta in metas.items():
+        if tid not in out:
+            key = (normalize_text(meta.get("track_name")), normalize_text(meta.get("artist_name")))
+            pairs.setdefault(key, []).append(tid)
+    pair_tids = list(pairs.values())
+    docs = await asyncio.gather(*(
+        engine.mb_search_recording(metas[t[0]].get("track_name"), metas[t[0]].get("artist_name"))
+        for t in pair_tids))
+    for tids, doc in zip(pair_tids, docs):
+        for tid in tids:
+            out[tid] = mb_record(doc, "name_search" if doc else None)
+
+    if fetch_ratings:
+        mbids = sorted({r["mbid"] for r in out.values() if r["mbid"] and r["rating_value"] is None})
+        ratings = dict(zip(mbids, await asyncio.gather(*(engine.mb_rating(m) for m in mbids))))
+        for record in out.values():
+            if record["mbid"] in ratings:
+                record["rating_value"], record["rating_votes"] = ratings[record["mbid"]]
+    return out
+
+
+async def enrich_batch(engine, batch, sp_meta, fetch_ratings=False):
+    """Enriquece un batch de Spotify IDs y retorna {tid: registro}."""
+    # 4.1 Metadata de Spotify que falte (50 IDs por petición)
+    missing = [tid for tid in batch if tid not in sp_meta]
+    if missing:
+        metas = await asyncio.gather(*(engine.spotify_tracks(c) for c in chunk_list(missing, 50)))
+        for m in metas:
+            sp_meta.update(m)
+
+    # 4.2 MusicBrainz (ISRC primero) + Last.fm, todas las pistas del batch a la vez
+    metas = {tid: sp_meta.get(tid, {}) for tid in batch}
+    mb_map, tags = await asyncio.gather(
+        resolve_mbids(engine, metas, fetch_ratings),
+        asyncio.gather(*(engine.lastfm_tags(m.get("track_name", ""), m.get("artist_name", ""))
+                         for m in metas.values())),
+    )
+    tags_map = dict(zip(metas, tags))
+
+    # 4.3 AcousticBrainz bulk, chunks de 25 en paralelo
+    mbids = sorted({r["mbid"] for r in mb_map.values() if r["mbid"]})
+    chunks = list(chunk_list(mbids, 25))
+    bulks = await asyncio.gather(*(engine.acousticbrainz_bulk(c) for c in chunks))
+    ll_map, hl_map = {}, {}
+    for ll_json, hl_json in bulks:
+        ll_map.update(ll_json)
+        hl_map.update(hl_json)
+
+    out = {}
+    for tid in batch:
+        mb = mb_map[tid]
+        ll = first_doc(ll_map, mb["mbid"]) if mb["mbid"] else {}
+        hl = first_doc(hl_map, mb["mbid"]) if mb["mbid"] else {}
+        out[tid] = build_record(mb, ll, hl, tags_map[tid])
+    return out
+
+
+# ------------------------------------------------------------
+# 5) Programa principal con reanudación
+# ------------------------------------------------------------
+async def run(args):
+    load_dotenv()
+    all_ids = list(iter_unique_track_ids(args.challenge))
+    total = len(all_ids)
+    print(f"➡️  {total} pistas únicas encontradas.")
+
+    sp_meta = {}
+    if os.path.exists(args.spotify_metadata):
+        with open(args.spotify_metadata, "r", encoding="utf-8") as f:
+            sp_meta = json.load(f)
+
+    store = CheckpointStore(args.store)
+    if len(store):
+        print(f"🔄 Reanudando: {len(store)}/{total} procesadas.")
+    pending = [tid for tid in all_ids if tid not in store]
+    print(f"⏳ Quedan {len(pending)}/{total} por procesar.\n")
+
+    cache = ResponseCache(args.cache)
+    start_time = time.time()
+    async with AsyncEnricher(
+        spotify_id=os.getenv("SPOTIPY_CLIENT_ID"),
+        spotify_secret=os.getenv("SPOTIPY_CLIENT_SECRET"),
+        lastfm_key=os.getenv("LASTFM_API_KEY"),
+        mock_url=args.mock_url,
+        record_path=args.record,
+        max_connections=args.max_connections,
+        cache=cache,
+    ) as engine:
+        try:
+            for b, batch in enumerate(chunk_list(pending, args.batch_size), start=1):
+                t0 = time.time()
+                store.put_many(await enrich_batch(engine, batch, sp_meta, args.ratings))
+                print(f"✅ Batch {b}: {len(store)}/{total} pistas "
+                      f"({len(batch) / (time.time() - t0):.1f} pistas/s)")
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            print(f"\n⏸️ Interrumpido. Progreso guardado en '{args.store}'.")
+            return
+        finally:
+            with open(args.spotify_metadata, "w", encoding="utf-8") as fout:
+                json.dump(sp_meta, fout, indent=2, ensure_ascii=False)
+
+        print("\n📊 Peticiones por servicio:")
+        for name, st in engine.stats.items():
+            print(f"   {name:<15} {st}")
+        cache.report()
+
+    n = store.compact(args.output)
+    print(f"📁 '{args.output}' generado con {n} pistas.")
+    print(f"\n✅ Completado en {(time.time() - start_time) / 60:.1f} min.")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Enriquecimiento asíncrono del challenge set")
+    parser.add_argument("--challenge", default="challenge_set.json")
+    parser.add_argument("--spotify-metadata", default="spotify_metadata.json")
+    parser.add_argument("--store", default="acousticbrainz_data.sqlite",
+                        help="CheckpointStore donde se confirma cada batch")
+    parser.add_argument("--output", default="acousticbrainz_data.json",
+                        help="JSON compactado al terminar")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--max-connections", type=int, default=32)
+    parser.add_argument("--mock-url", default=None,
+                        help="URL de mock_replay_server.py (p.ej. http://127.0.0.1:8765)")
+    parser.add_argument("--cache", default=None,
+                        help="Archivo de la caché HTTP (por defecto http_cache.sqlite)")
+    parser.add_argument("--ratings", action="store_true",
+                        help="Consulta ratings de MusicBrainz (un lookup por MBID)")
+    parser.add_argument("--record", default=None,
+                        help="JSONL donde grabar las respuestas para reproducirlas luego")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run(parse_args()))
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+challenge_stream.py
+
+Lectura incremental de challenge_set.json (y de los slices del MPD, que
+tienen la misma forma {"info"/..., "playlists": [...]}) sin json.load del
+archivo completo: las playlists se decodifican de una en una, con memoria
+acotada por el tamaño de la playlist más grande y no por el del archivo.
+
+El parser es propio (no requiere ijson): recorre el objeto de primer nivel
+y decodifica cada valor con json.JSONDecoder.raw_decode (en C) sobre un
+buffer que se va rellenando por bloques.
+
+Uso:
+    for pl in iter_playlists("challenge_set.json"):
+        ...
+    all_ids = list(iter_unique_track_ids("challenge_set.json"))
+    n = sum(1 for _ in iter_items("acousticbrainz_data.json"))   # {clave: registro}
+"""
+
+import os
+import re
+import json
+import argparse
+
+CHUNK_SIZE = 1 << 20  # 1 MiB por lectura
+
+_WS = re.compile(r"[ \t\n\r]*")
+# Caracteres que pueden formar parte de un número JSON
+_NUMBER = re.compile(r"[-+0-9.eE]*")
+_decoder = json.JSONDecoder()
+
+
+class _StreamReader:
+    """Buffer de texto sobre un archivo con decodificación de valores JSON sueltos."""
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, min_size=0):
+        """Descarta lo ya consumido y lee otro bloque; False si no queda nada."""
+        if self.eof:
+            return False
+        data = self.f.read(max(self.chunk_size, min_size))
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Siguiente carácter no blanco (sin consumirlo)."""
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("JSON truncado: fin de archivo inesperado")
+
+    def expect(self, chars):
+        """Consume el siguiente carácter no blanco, que debe estar en `chars`."""
+        c = self.peek()
+        if c not in chars:
+            raise ValueError(f"JSON inválido: se esperaba {chars!r} y se encontró {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self):
+        """Decodifica el siguiente valor JSON completo."""
+        self.peek()
+        while True:
+            # Un número que llega al final del buffer puede seguir en el
+            # siguiente bloque ("-2" de "-2.5e3"): se lee más antes de decodificar
+            if (_NUMBER.match(self.buf, self.pos).end() == len(self.buf)
+                    and self._fill(min_size=len(self.buf) - self.pos)):
+                continue
+            try:
+                val, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Valor partido entre bloques: leer más (el doble, para no
+                # re-decodificar muchas veces un valor muy grande)
+                if not self._fill(min_size=len(self.buf) - self.pos):
+                    raise
+                continue
+            self.pos = end
+            return val
+
+
+# ------------------------------------------------------------
+# 1) Recorrido del documento
+# ------------------------------------------------------------
+def iter_document(path, stream_key="playlists", chunk_size=CHUNK_SIZE):
+    """
+    Recorre el objeto de primer nivel de `path` emitiendo eventos:
+      ("key",  clave, valor)     para cada clave ordinaria;
+      ("item", clave, elemento)  para cada elemento del array `stream_key`,
+                                 que nunca se materializa completo.
+    Con stream_key=None todas las claves son ordinarias (archivos {clave: registro}).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        r = _StreamReader(f, chunk_size)
+        r.expect("{")
+        if r.peek() == "}":
+            return
+        while True:
+            key = r.value()
+            r.expect(":")
+            if key == stream_key and r.peek() == "[":
+                r.expect("[")
+                if r.peek() == "]":
+                    r.expect("]")
+                else:
+                    while True:
+                        yield "item", key, r.value()
+                        if r.expect(",]") == "]":
+                            break
+            else:
+                yield "key", key, r.value()
+            if r.expect(",}") == "}":
+                return
+
+
+def iter_items(path, chunk_size=CHUNK_SIZE):
+    """(clave, valor) del objeto de primer nivel, de uno en uno."""
+    for _, key, value in iter_document(path, stream_key=None, chunk_size=chunk_size):
+        yield key, value
+
+
+def read_header(path):
+    """Claves de primer nivel distintas de "playlists" (version, date, info...)."""
+    return {key: value for kind, key, value in iter_document(path) if kind == "key"}
+
+
+def iter_playlists(path, min_samples=0):
+    """Playlists de una en una; min_samples>0 descarta las que tienen menos pistas semilla."""
+    for kind, _, pl in iter_document(path):
+        if kind == "item" and pl.get("num_samples", len(pl.get("tracks", []))) >= min_samples:
+            yield pl
+
+
+def track_id(track):
+    """'spotify:track:XYZ' → 'XYZ'."""
+    uri = track.get("track_uri", "")
+    return uri.split(":")[-1] if ":" in uri else uri
+
+
+def iter_tracks(path):
+    """(pid, track) para cada pista de cada playlist."""
+    for pl in iter_playlists(path):
+        for tr in pl.get("tracks", []):
+            yield pl["pid"], tr
+
+
+def iter_unique_track_ids(path):
+    """Spotify IDs únicos en orden de primera aparición."""
+    seen = set()
+    for _, tr in iter_tracks(path):
+        tid = track_id(tr)
+        if tid not in seen:
+            seen.add(tid)
+            yield tid
+
+
+# ------------------------------------------------------------
+# 2) Escritura en streaming
+# ------------------------------------------------------------
+def dump_document(events, output_path, stream_key="playlists"):
+    """
+    Escribe en `output_path` un documento a partir de eventos como los de
+    iter_document, sin tenerlo completo en memoria. Atómico (tmp + os.replace).
+    Retorna el número de elementos escritos en `stream_key`.
+    """
+    tmp_path = output_path + ".tmp"
+    n_keys = n_items = 0
+    in_array = False
+    with open(tmp_path, "w", encoding="utf-8") as fout:
+        fout.write("{")
+        for kind, key, value in events:
+            if kind == "item":
+                if not in_array:
+                    if n_keys:
+                        fout.write(",")
+                    fout.write(f"\n{json.dumps(stream_key)}: [")
+                    in_array, n_keys = True, n_keys + 1
+                fout.write(",\n" if n_items else "\n")
+                fout.write(json.dumps(value, ensure_ascii=False))
+                n_items += 1
+                continue
+            if in_array:
+                fout.write("\n]")
+                in_array = False
+            fout.write(",\n" if n_keys else "\n")
+            fout.write(f"{json.dumps(key, ensure_ascii=False)}: {json.dumps(value, ensure_ascii=False)}")
+            n_keys += 1
+        if in_array:
+            fout.write("\n]")
+        fout.write("\n}\n")
+        fout.flush()
+        os.fsync(fout.fileno())
+    os.replace(tmp_path, output_path)
+    return n_items
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumen en streaming de un challenge set / slice del MPD")
+    parser.add_argument("path", nargs="?", default="challenge_set.json")
+    args = parser.parse_args()
+
+    n_playlists = n_tracks = 0
+    unique = set()
+    for pl in iter_playlists(args.path):
+        n_playlists += 1
+        for tr in pl.get("tracks", []):
+            n_tracks += 1
+            unique.add(track_id(tr))
+    print(f"📂 '{args.path}': {n_playlists} playlists, {n_tracks} pistas, {len(unique)} únicas.")
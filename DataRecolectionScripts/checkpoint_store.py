@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+checkpoint_store.py
+
+Almacén de resultados por pista, persistente y de escritura incremental,
+basado en SQLite en modo WAL. Sustituye el patrón "reescribir todo el JSON
+tras cada batch" (coste cuadrático con el progreso) por:
+
+  - put / put_many: cada batch se confirma en una sola transacción; solo se
+    escriben las filas nuevas, por lo que el coste por batch es constante.
+  - `tid in store`: búsqueda O(1) para reanudar (las claves se cachean
+    la primera vez que se necesitan).
+  - get_many: búsqueda por lotes directamente en SQLite, sin cargar las
+    claves, para usar el store como índice en disco.
+  - Escrituras seguras ante caídas: una transacción confirmada sobrevive a
+    un kill; una a medias se descarta entera.
+  - compact(): vuelca el contenido a un JSON final {clave: registro} en
+    streaming y de forma atómica (archivo temporal + os.replace).
+
+Uso:
+    store = CheckpointStore("acousticbrainz_data.sqlite")
+    store.put_many({tid: registro, ...})
+    store.compact("acousticbrainz_data.json")
+"""
+
+import os
+import json
+import sqlite3
+import argparse
+
+
+class CheckpointStore:
+    """Diccionario persistente {clave: objeto JSON} respaldado por SQLite (WAL)."""
+
+    def __init__(self, path, table="records"):
+        if not table.isidentifier():
+            raise ValueError(f"Nombre de tabla inválido: {table!r}")
+        self.path = path
+        self.table = table
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "  key   TEXT PRIMARY KEY,"
+            "  value TEXT NOT NULL"
+            ")"
+        )
+        self.conn.commit()
+        self._key_cache = None
+
+    @property
+    def _keys(self):
+        if self._key_cache is None:
+            self._key_cache = {row[0] for row in self.conn.execute(f"SELECT key FROM {self.table}")}
+        return self._key_cache
+
+    # --------------------------------------------------------
+    # Lectura
+    # --------------------------------------------------------
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def keys(self):
+        return set(self._keys)
+
+    def get(self, key, default=None):
+        if key not in self._keys:
+            return default
+        row = self.conn.execute(
+            f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def get_many(self, keys, chunk_size=900):
+        """{clave: registro} para las claves presentes, consultando SQLite por lotes."""
+        keys = list(dict.fromkeys(keys))
+        out = {}
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            marks = ",".join("?" * len(chunk))
+            for key, value in self.conn.execute(
+                f"SELECT key, value FROM {self.table} WHERE key IN ({marks})", chunk
+            ):
+                out[key] = json.loads(value)
+        return out
+
+    def items(self):
+        """Itera (clave, registro) en orden de clave sin cargar todo en memoria."""
+        cur = self.conn.execute(f"SELECT key, value FROM {self.table} ORDER BY key")
+        for key, value in cur:
+            yield key, json.loads(value)
+
+    # --------------------------------------------------------
+    # Escritura
+    # --------------------------------------------------------
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def put_many(self, records):
+        """Inserta/actualiza un batch completo en una única transacción."""
+        rows = [(k, json.dumps(v, ensure_ascii=False)) for k, v in records.items()]
+        if not rows:
+            return
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)", rows
+            )
+        if self._key_cache is not None:
+            self._key_cache.update(k for k, _ in rows)
+
+    def add_keys(self, keys):
+        """Marca claves como procesadas sin valor asociado (p.ej. MBIDs ya consultados)."""
+        self.put_many({k: True for k in keys})
+
+    def import_json(self, json_path):
+        """Importa un JSON {clave: registro} de ejecuciones antiguas (solo claves nuevas)."""
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {k: True for k in data}
+        new = {k: v for k, v in data.items() if k not in self._keys}
+        self.put_many(new)
+        return len(new)
+
+    # --------------------------------------------------------
+    # Compactación
+    # --------------------------------------------------------
+    def compact(self, output_path, base=None, transform=None):
+        """
+        Escribe {clave: registro} en `output_path` en streaming.
+
+        - base: dict opcional con registros previos; los del store tienen
+          prioridad y las claves de base conservan su orden original.
+        - transform: función opcional registro -> registro aplicada al volcar.
+        Retorna el número de registros escritos.
+        """
+        tmp_path = output_path + ".tmp"
+        written = 0
+
+        def entries():
+            if base is None:
+                yield from self.items()
+                return
+            for key, value in base.items():
+                yield key, self.get(key, value)
+            for key, value in self.items():
+                if key not in base:
+                    yield key, value
+
+        with open(tmp_path, "w", encoding="utf-8") as fout:
+            fout.write("{")
+            for key, value in entries():
+                if transform is not None:
+                    value = transform(value)
+                fout.write(",\n" if written else "\n")
+                fout.write(json.dumps(key, ensure_ascii=False))
+                fout.write(": ")
+                fout.write(json.dumps(value, ensure_ascii=False))
+                written += 1
+            fout.write("\n}\n")
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.replace(tmp_path, output_path)
+        return written
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compacta un CheckpointStore a JSON")
+    parser.add_argument("store", help="Archivo .sqlite")
+    parser.add_argument("output", help="JSON de salida")
+    parser.add_argument("--table", default="records")
+    args = parser.parse_args()
+
+    store = CheckpointStore(args.store, table=args.table)
+    n = store.compact(args.output)
+    print(f"✅ {n} registros escritos en '{args.output}'.")
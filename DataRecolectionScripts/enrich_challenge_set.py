@@ -6,7 +6,8 @@ Fase 1: Extrae y guarda metadata de Spotify (popularity, duration_ms, explicit,
 Fase 2: Lee ese JSON intermedio y recupera tags de Last.fm.
 Finalmente construye enriched_challenge_set.json.
 
-Añade logging por batches en Last.fm y guarda archivos parciales si hay fallo.
+Añade logging por batches en Last.fm; cada batch se confirma en
+lastfm_tags.sqlite (CheckpointStore) para reanudar tras un fallo.
 """
 
 import os
@@ -16,10 +17,13 @@ import json
 from math import ceil
 from dotenv import load_dotenv
 
-import requests
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 
+from challenge_stream import iter_document, iter_playlists, track_id, dump_document
+from checkpoint_store import CheckpointStore
+from http_cache import ResponseCache, CachedSession, spotify_tracks
+
 # ------------------------------------------------------------
 # 1) Carga de credenciales
 # ------------------------------------------------------------
@@ -37,6 +41,10 @@ sp    = spotipy.Spotify(client_credentials_manager=creds)
 
 LASTFM_URL = "http://ws.audioscrobbler.com/2.0/"
 
+# Caché HTTP en disco: una re-ejecución no repite consultas a Spotify ni a Last.fm
+cache = ResponseCache()
+lastfm_http = CachedSession(cache, "lastfm")
+
 # ------------------------------------------------------------
 # 2) Funciones Last.fm
 # ------------------------------------------------------------
@@ -49,7 +57,7 @@ def lastfm_search(track_name, artist_name):
         "format": "json",
         "limit": 1
     }
-    r = requests.get(LASTFM_URL, params=params)
+    r = lastfm_http.get(LASTFM_URL, params=params)
     r.raise_for_status()
     matches = r.json()["results"]["trackmatches"].get("track", [])
     return matches[0] if isinstance(matches, list) and matches else None
@@ -61,23 +69,24 @@ def lastfm_get_tags(mbid=None, track_name=None, artist_name=None):
     else:
         params["track"]  = track_name
         params["artist"] = artist_name
-    r = requests.get(LASTFM_URL, params=params)
+    r = lastfm_http.get(LASTFM_URL, params=params)
     r.raise_for_status()
     tags = r.json().get("track", {}).get("toptags", {}).get("tag", [])
     return [t["name"] for t in tags if "name" in t]
 
 # ------------------------------------------------------------
-# 3) Cargar challenge_set y extraer track IDs únicos
+# 3) Leer challenge_set en streaming y extraer track IDs únicos
 # ------------------------------------------------------------
-with open("challenge_set.json", "r") as f:
-    challenge = json.load(f)
-
-playlists = challenge["playlists"]
-playlist_tracks = {
-    pl["pid"]: [t["track_uri"].split(":")[-1] for t in pl["tracks"]]
-    for pl in playlists if pl.get("num_samples", 0) > 0
-}
-all_ids = list({tid for tids in playlist_tracks.values() for tid in tids})
+header, all_ids, seen = {}, [], set()
+for kind, key, value in iter_document("challenge_set.json"):
+    if kind == "key":
+        header[key] = value          # version, date, name...
+    elif value.get("num_samples", 0) > 0:
+        for t in value["tracks"]:
+            tid = track_id(t)
+            if tid not in seen:
+                seen.add(tid)
+                all_ids.append(tid)
 print(f"➡️  {len(all_ids)} pistas únicas encontradas.\n")
 
 # ------------------------------------------------------------
@@ -89,7 +98,7 @@ try:
     for idx in range(batches):
         start = idx * 50
         batch = all_ids[start : start + 50]
-        resp = sp.tracks(batch)["tracks"]
+        resp, from_cache = spotify_tracks(cache, sp, batch)
         for tr in resp:
             if tr is None:
                 continue
@@ -102,7 +111,8 @@ try:
                 "release_date": tr["album"]["release_date"]
             }
         print(f"[Spotify] Procesado batch {idx+1}/{batches}")
-        time.sleep(0.3)
+        if not from_cache:
+            time.sleep(0.3)
 except Exception as e:
     print(f"\n❌ Error en fase Spotify: {e}")
 finally:
@@ -121,17 +131,22 @@ print("✅ Fase 1 completada: 'spotify_metadata.json' generado.\n")
 # with open("spotify_metadata.json", "r") as fin:
 #     sp_metadata = json.load(fin)
 
-lfm_tags = {}
+lfm_store = CheckpointStore("lastfm_tags.sqlite")
 total = len(all_ids)
 l_fm_batch_size = 500
 batches_lfm = ceil(total / l_fm_batch_size)
+if len(lfm_store):
+    print(f"🔄 Reanudando Last.fm: {len(lfm_store)}/{total} pistas ya consultadas.")
 
 try:
     for bidx in range(batches_lfm):
         start = bidx * l_fm_batch_size
         end   = min(start + l_fm_batch_size, total)
-        batch_ids = all_ids[start:end]
+        batch_ids = [tid for tid in all_ids[start:end] if tid not in lfm_store]
+        if not batch_ids:
+            continue
         print(f"[Last.fm] Iniciando batch {bidx+1}/{batches_lfm} ({start+1}-{end})")
+        batch_tags = {}
         for tid in batch_ids:
             meta = sp_metadata.get(tid, {})
             match = lastfm_search(meta.get("track_name",""), meta.get("artist_name",""))
@@ -140,42 +155,40 @@ try:
                 tags = lastfm_get_tags(mbid, meta["track_name"], meta["artist_name"])
             else:
                 tags = []
-            lfm_tags[tid] = tags
+            batch_tags[tid] = tags
             # opcional: logging cada 100
+        lfm_store.put_many(batch_tags)
         print(f"[Last.fm] Completado batch {bidx+1}/{batches_lfm}")
-        with open("lastfm_tags.json", "w", encoding="utf-8") as fout:
-            json.dump(lfm_tags, fout, indent=2, ensure_ascii=False)
-        print(f"📁 lastfm_tags.json guardado tras batch {bidx+1}.")
+        print(f"📁 lastfm_tags.sqlite actualizado tras batch {bidx+1}.")
         time.sleep(0.2)
 except Exception as e:
     print(f"\n❌ Error en fase Last.fm: {e}")
-    with open("lastfm_tags.json", "w", encoding="utf-8") as fout:
-        json.dump(lfm_tags, fout, indent=2, ensure_ascii=False)
-    print("📁 lastfm_tags.json guardado tras interrupción en fase 2.\n")
+    print("📁 Progreso guardado en lastfm_tags.sqlite; se reanudará desde ahí.\n")
     sys.exit(1)
 
+cache.report()
+lfm_store.compact("lastfm_tags.json")
+lfm_tags = dict(lfm_store.items())
 print("✅ Fase 2 completada: 'lastfm_tags.json' generado.\n")
 
 # ------------------------------------------------------------
 # 6) Construir enriched_challenge_set.json
 # ------------------------------------------------------------
-enriched = {
-    "version": challenge.get("version"),
-    "date":    challenge.get("date"),
-    "playlists": []
-}
-for pl in playlists:
-    new_pl = pl.copy()
-    new_tracks = []
-    for tr in pl["tracks"]:
-        tid = tr["track_uri"].split(":")[-1]
-        new_tr = tr.copy()
-        new_tr.update(sp_metadata.get(tid, {}))
-        new_tr["lastfm_tags"] = lfm_tags.get(tid, [])
-        new_tracks.append(new_tr)
-    new_pl["tracks"] = new_tracks
-    enriched["playlists"].append(new_pl)
-
-with open("enriched_challenge_set.json", "w", encoding="utf-8") as fout:
-    json.dump(enriched, fout, indent=2, ensure_ascii=False)
+# Segunda pasada en streaming: cada playlist se enriquece y se escribe sin
+# acumular el challenge set completo en memoria
+def enriched_events():
+    yield "key", "version", header.get("version")
+    yield "key", "date",    header.get("date")
+    for pl in iter_playlists("challenge_set.json"):
+        new_tracks = []
+        for tr in pl["tracks"]:
+            tid = track_id(tr)
+            new_tr = tr.copy()
+            new_tr.update(sp_metadata.get(tid, {}))
+            new_tr["lastfm_tags"] = lfm_tags.get(tid, [])
+            new_tracks.append(new_tr)
+        pl["tracks"] = new_tracks
+        yield "item", "playlists", pl
+
+dump_document(enriched_events(), "enriched_challenge_set.json")
 print("✅ enriched_challenge_set.json generado.\n")
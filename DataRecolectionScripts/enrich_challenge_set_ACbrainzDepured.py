@@ -22,6 +22,8 @@ from dotenv import load_dotenv
 
 import requests
 import musicbrainzngs
+
+from http_cache import ResponseCache, CachedSession, CacheMissError
 # spotipy no es necesario para este script modificado que opera sobre acousticbrainz_data.json
 
 # ------------------------------------------------------------
@@ -42,6 +44,10 @@ try:
 except Exception as e:
     sys.exit(f"❌ Error configurando MusicBrainz: {e}")
 
+# Caché HTTP en disco compartida (MusicBrainz + AcousticBrainz)
+cache = ResponseCache()
+ab_http = CachedSession(cache, "acousticbrainz")
+
 # ------------------------------------------------------------
 # 2) Funciones para MusicBrainz
 # ------------------------------------------------------------
@@ -51,8 +57,12 @@ def get_mbid_from_name(track_name, artist_name):
     if not track_name or not artist_name:
         return None
     try:
-        res = musicbrainzngs.search_recordings(
-            recording=track_name, artist=artist_name, limit=1
+        res = cache.cached_call(
+            "musicbrainz",
+            {"op": "search_recordings", "recording": track_name, "artist": artist_name, "limit": 1},
+            lambda: musicbrainzngs.search_recordings(
+                recording=track_name, artist=artist_name, limit=1
+            ),
         )
         recs = res.get("recording-list", [])
         return recs[0]["id"] if recs else None
@@ -69,8 +79,10 @@ def fetch_mb_genre_and_rating(mbid):
     if not mbid:
         return None, None, None
     try:
-        rec = musicbrainzngs.get_recording_by_id(
-            mbid, includes=["tags", "ratings"] # 'ratings' es correcto para la inclusión
+        rec = cache.cached_call(
+            "musicbrainz",
+            {"op": "get_recording_by_id", "mbid": mbid, "includes": "tags,ratings"},
+            lambda: musicbrainzngs.get_recording_by_id(mbid, includes=["tags", "ratings"]),
         )["recording"]
         
         genre = None
@@ -142,7 +154,7 @@ def fetch_acousticbrainz_bulk(mbids):
 
         while retries < max_retries:
             try:
-                resp = requests.get(url, timeout=20) # Timeout un poco más largo para bulk
+                resp = ab_http.get(url, timeout=20) # Timeout un poco más largo para bulk
                 if resp.status_code == 429: # Too Many Requests
                     reset_in = int(resp.headers.get("X-RateLimit-Reset-In", 10))
                     retry_after = int(resp.headers.get("Retry-After", reset_in)) + 1 # Usar Retry-After si está, sino X-RateLimit-Reset-In
@@ -153,6 +165,8 @@ def fetch_acousticbrainz_bulk(mbids):
                 
                 resp.raise_for_status() # Lanza HTTPError para otros errores 4xx/5xx
                 current_json = resp.json()
+                if resp.from_cache:
+                    break
                 
                 # Chequeo opcional de remaining requests, aunque ya manejamos 429
                 remaining = int(resp.headers.get("X-RateLimit-Remaining", 1))
@@ -162,6 +176,8 @@ def fetch_acousticbrainz_bulk(mbids):
                     time.sleep(wait_time)
                 break # Petición exitosa para este nivel
 
+            except CacheMissError:
+                break # Modo offline: no tiene sentido reintentar
             except requests.exceptions.Timeout:
                 retries += 1
                 print(f"  ⌛ Timeout en AcousticBrainz ({level_type}) para chunk. Intento {retries}/{max_retries}.")
@@ -289,7 +305,7 @@ def main():
             
             # Pausa proactiva para respetar el rate limit de AcousticBrainz (10 queries / 10s)
             # fetch_acousticbrainz_bulk hace 2 queries. Esperar 1 segundo aquí mantiene ~2 queries/segundo.
-            if chunk_idx < num_chunks -1 : # No dormir después del último chunk
+            if chunk_idx < num_chunks -1 and not cache.offline: # No dormir después del último chunk
                  time.sleep(1) 
             
             # Mostrar tiempo transcurrido para este chunk
@@ -334,6 +350,8 @@ def main():
         print("✅ AcousticBrainz: No hay MBIDs para procesar.")
 
 
+    cache.report()
+
     # --- 4.3 Guardar archivo actualizado ---
     print(f"\n💾 Guardando datos actualizados en '{output_file}'...")
     try:
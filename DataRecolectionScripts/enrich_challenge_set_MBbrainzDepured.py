@@ -19,6 +19,8 @@ from dotenv import load_dotenv
 import requests # Keep for fetch_mb_genre_and_rating in case of direct calls, though musicbrainzngs handles it.
 import musicbrainzngs
 
+from http_cache import ResponseCache
+
 # ------------------------------------------------------------
 # 1) Credenciales y user-agent
 # ------------------------------------------------------------
@@ -45,6 +47,9 @@ except TypeError as e:
 # lo cual es la política recomendada por MusicBrainz para usuarios anónimos.
 musicbrainzngs.set_rate_limit(True)
 
+# Caché HTTP en disco: las consultas ya hechas no vuelven a pagar el 1 req/s
+cache = ResponseCache()
+
 
 # ------------------------------------------------------------
 # 2) Funciones para MusicBrainz
@@ -60,8 +65,10 @@ def fetch_mb_genre_and_rating(mbid):
         return None, None, None
     try:
         # Incluye 'tags' para el género y 'ratings' para la calificación.
-        rec = musicbrainzngs.get_recording_by_id(
-            mbid, includes=["tags", "ratings"]
+        rec = cache.cached_call(
+            "musicbrainz",
+            {"op": "get_recording_by_id", "mbid": mbid, "includes": "tags,ratings"},
+            lambda: musicbrainzngs.get_recording_by_id(mbid, includes=["tags", "ratings"]),
         )["recording"]
         
         # Procesar tags para obtener el género
@@ -207,6 +214,7 @@ def main():
     print(f"\n✅ Proceso de MusicBrainz completado.")
     print(f"   {entries_checked_for_update} entradas necesitaron revisión de datos en MusicBrainz.")
     print(f"   Se rellenaron un total de {fields_updated_count} campos (genre_mb, rating_value, rating_votes).")
+    cache.report()
 
     # --- Guardar datos ---
     print(f"\n💾 Guardando datos actualizados en '{output_data_file}'...")
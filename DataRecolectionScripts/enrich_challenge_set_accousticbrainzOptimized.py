@@ -3,12 +3,13 @@
 enrich_challenge_set_acousticbrainz.py
 
 Lee spotify_metadata.json (fase 1 ya ejecutada),
-luego consulta MusicBrainz (solo por nombre+artista) y AcousticBrainz
+luego consulta MusicBrainz (ISRC en lote primero, nombre+artista como
+respaldo; ver mbid_resolver.py) y AcousticBrainz
 para extraer únicamente los campos requeridos:
-  - MusicBrainz: primer tag (genre) y rating (value + votes-count)
+  - MusicBrainz: tag principal (genre) y cómo se resolvió el MBID (resolved_by)
   - AcousticBrainz low-level y high-level en lote (bulk) para hasta 25 recordings por petición
-Logea progreso, guarda al detectar interrupción o fallo,
-y reanuda desde el JSON parcial.
+Logea progreso, confirma cada batch en un CheckpointStore (SQLite WAL)
+y reanuda desde él; al terminar compacta el resultado a acousticbrainz_data.json.
 """
 
 import os
@@ -18,11 +19,14 @@ import json
 from math import ceil
 from dotenv import load_dotenv
 
-import requests
-import musicbrainzngs
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 
+from challenge_stream import iter_unique_track_ids
+from checkpoint_store import CheckpointStore
+from http_cache import ResponseCache, CachedSession
+from mbid_resolver import MBIDResolver
+
 # ------------------------------------------------------------
 # 1) Credenciales y user-agent
 # ------------------------------------------------------------
@@ -36,43 +40,13 @@ sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials(
     client_id=SPOTI_ID, client_secret=SPOTI_SECRET
 ))
 
-musicbrainzngs.set_useragent("enrichAB", "1.0", "tu_email@dominio.com")
-
-# ------------------------------------------------------------
-# 2) Funciones para MusicBrainz
-# ------------------------------------------------------------
-
-def get_mbid_from_name(track_name, artist_name):
-    try:
-        res = musicbrainzngs.search_recordings(
-            recording=track_name, artist=artist_name, limit=1
-        )
-        recs = res.get("recording-list", [])
-        return recs[0]["id"] if recs else None
-    except Exception:
-        return None
-
-
-def fetch_mb_genre_and_rating(mbid):
-    try:
-        rec = musicbrainzngs.get_recording_by_id(
-            mbid, includes=["tags", "rating"]
-        )["recording"]
-        raw = rec.get("tag-list", [])
-        tags_list = [raw] if isinstance(raw, dict) else raw
-        tags_sorted = sorted(
-            tags_list,
-            key=lambda t: int(t.get("count", 0)),
-            reverse=True
-        )
-        genre = tags_sorted[0].get("name") if tags_sorted else None
-        rating = rec.get("rating", {})
-        return genre, rating.get("value"), rating.get("votes-count")
-    except Exception:
-        return None, None, None
+# Caché HTTP en disco compartida (MusicBrainz + AcousticBrainz)
+cache = ResponseCache()
+ab_http = CachedSession(cache, "acousticbrainz")
+mb_resolver = MBIDResolver(cache=cache, fetch_ratings=True)   # rellena rating_value / rating_votes
 
 # ------------------------------------------------------------
-# 3) Funciones para AcousticBrainz en lote (bulk)
+# 2) Funciones para AcousticBrainz en lote (bulk)
 # ------------------------------------------------------------
 
 def chunk_list(lst, n):
@@ -92,13 +66,15 @@ def fetch_acousticbrainz_bulk(mbids):
     # Bulk low-level
     ll_url = f"{base}/low-level?recording_ids={ids}"
     while True:
-        resp = requests.get(ll_url, timeout=10)
+        resp = ab_http.get(ll_url, timeout=10)
         if resp.status_code == 429:
             reset = int(resp.headers.get("X-RateLimit-Reset-In", 10))
             time.sleep(reset)
             continue
         resp.raise_for_status()
         ll_json = resp.json()
+        if resp.from_cache:
+            break
         headers = resp.headers
         remaining = int(headers.get("X-RateLimit-Remaining", 0))
         if remaining < 1:
@@ -109,13 +85,15 @@ def fetch_acousticbrainz_bulk(mbids):
     # Bulk high-level
     hl_url = f"{base}/high-level?recording_ids={ids}"
     while True:
-        resp = requests.get(hl_url, timeout=10)
+        resp = ab_http.get(hl_url, timeout=10)
         if resp.status_code == 429:
             reset = int(resp.headers.get("X-RateLimit-Reset-In", 10))
             time.sleep(reset)
             continue
         resp.raise_for_status()
         hl_json = resp.json()
+        if resp.from_cache:
+            break
         headers = resp.headers
         remaining = int(headers.get("X-RateLimit-Remaining", 0))
         if remaining < 1:
@@ -126,7 +104,7 @@ def fetch_acousticbrainz_bulk(mbids):
     return ll_json, hl_json
 
 # ------------------------------------------------------------
-# 4) Función para seleccionar género top de high-level
+# 3) Función para seleccionar género top de high-level
 # ------------------------------------------------------------
 def select_top_genre(highlevel_data_dict):
     if not isinstance(highlevel_data_dict, dict):
@@ -147,19 +125,9 @@ def select_top_genre(highlevel_data_dict):
     return max(genre_probabilities, key=genre_probabilities.get)
 
 # ------------------------------------------------------------
-# 5) Carga challenge_set y spotify_metadata
+# 4) Carga challenge_set y spotify_metadata
 # ------------------------------------------------------------
-with open("challenge_set.json", "r", encoding="utf-8") as f:
-    challenge = json.load(f)
-playlists = challenge["playlists"]
-
-all_ids, seen = [], set()
-for pl in playlists:
-    for tr in pl["tracks"]:
-        tid = tr["track_uri"].split(":")[-1]
-        if tid not in seen:
-            seen.add(tid)
-            all_ids.append(tid)
+all_ids = list(iter_unique_track_ids("challenge_set.json"))
 total = len(all_ids)
 print(f"➡️  {total} pistas únicas encontradas.\n")
 
@@ -167,26 +135,25 @@ with open("spotify_metadata.json", "r", encoding="utf-8") as f:
     sp_meta = json.load(f)
 
 # ------------------------------------------------------------
-# 6) Reanudación desde archivo parcial
+# 5) Reanudación desde el checkpoint store
 # ------------------------------------------------------------
-data_file = "acousticbrainz_data.json"
-if os.path.exists(data_file):
-    with open(data_file, "r", encoding="utf-8") as fin:
-        abz_data = json.load(fin)
-    processed = set(abz_data.keys())
-    print(f"🔄 Reanudando: {len(processed)}/{total} procesadas.")
-else:
-    abz_data = {}
-    processed = set()
-print(f"⏳ Quedan {total - len(processed)}/{total} por procesar.\n")
-
-remaining = [tid for tid in all_ids if tid not in processed]
+data_file  = "acousticbrainz_data.json"
+store_file = "acousticbrainz_data.sqlite"
+abz_store  = CheckpointStore(store_file)
+if not len(abz_store) and os.path.exists(data_file):
+    # Migración desde un JSON parcial de ejecuciones anteriores
+    abz_store.import_json(data_file)
+if len(abz_store):
+    print(f"🔄 Reanudando: {len(abz_store)}/{total} procesadas.")
+print(f"⏳ Quedan {total - len(abz_store)}/{total} por procesar.\n")
+
+remaining = [tid for tid in all_ids if tid not in abz_store]
 batch_size = 100
 batches    = ceil(len(remaining) / batch_size)
 start_time = time.time()
 
 # ------------------------------------------------------------
-# 7) Procesar cada batch
+# 6) Procesar cada batch
 # ------------------------------------------------------------
 try:
     for b in range(batches):
@@ -194,28 +161,13 @@ try:
         batch = remaining[start : start + batch_size]
         print(f"[Batch {b+1}/{batches}] pistas {start+1}-{start+len(batch)}")
 
-        # 7.1 MusicBrainz: obtener mbid, género y rating
-        mbid_map = {}
-        meta_map = {}
-        for i, tid in enumerate(batch, start=start+1):
-            elapsed = time.time() - start_time
-            print(f" ▶ MB [{i}/{total}] {tid} – {elapsed:.1f}s")
-
-            meta = sp_meta.get(tid, {})
-            name = meta.get("track_name", "")
-            artist = meta.get("artist_name", "")
-
-            mbid = get_mbid_from_name(name, artist)
-            mbid_map[tid] = mbid
+        # 6.1 MusicBrainz: ISRC en lote, nombre+artista solo para lo no resuelto
+        elapsed = time.time() - start_time
+        print(f" ▶ MB [{start+1}-{start+len(batch)}/{total}] – {elapsed:.1f}s")
+        mb_records = mb_resolver.resolve({tid: sp_meta.get(tid, {}) for tid in batch})
+        mbid_map = {tid: r["mbid"] for tid, r in mb_records.items()}
 
-            if mbid:
-                genre_mb, rating_val, rating_cnt = fetch_mb_genre_and_rating(mbid)
-            else:
-                genre_mb = rating_val = rating_cnt = None
-
-            meta_map[tid] = (genre_mb, rating_val, rating_cnt)
-
-        # 7.2 AcousticBrainz en lote (chunks de 25)
+        # 6.2 AcousticBrainz en lote (chunks de 25)
         ll_data_map = {}
         hl_data_map = {}
         acoustic_tids = [tid for tid, m in mbid_map.items() if m]
@@ -231,15 +183,17 @@ try:
                 ll_data_map[tid] = doc_ll
                 hl_data_map[tid] = doc_hl
 
-        # 7.3 Combinar y guardar
+        # 6.3 Combinar y guardar (solo las filas del batch)
+        batch_records = {}
         for tid in batch:
-            genre_mb, rating_val, rating_cnt = meta_map[tid]
+            mb = mb_records[tid]
             ll = ll_data_map.get(tid, {})
             hl = hl_data_map.get(tid, {})
 
-            abz_data[tid] = {
-                "mbid":            mbid_map.get(tid),
-                "genre_mb":        genre_mb,
+            batch_records[tid] = {
+                "mbid":            mb["mbid"],
+                "resolved_by":     mb["resolved_by"],
+                "genre_mb":        mb["genre_mb"],
                 "top_genre_hl":    select_top_genre(hl.get("highlevel", {})),
                 "bpm":             ll.get("rhythm", {}).get("bpm"),
                 "energy":          ll.get("lowlevel", {}).get("dynamic_complexity"),
@@ -248,25 +202,27 @@ try:
                 "loudness":        ll.get("lowlevel", {}).get("average_loudness"),
                 "mood_happy":      hl.get("highlevel", {}).get("mood_happy", {}).get("value"),
                 "acousticness":    hl.get("highlevel", {}).get("acousticness", {}).get("value"),
-                "rating_value":    rating_val,
-                "rating_votes":    rating_cnt
+                "rating_value":    mb["rating_value"],
+                "rating_votes":    mb["rating_votes"]
             }
 
-        with open(data_file, "w", encoding="utf-8") as fout:
-            json.dump(abz_data, fout, indent=2, ensure_ascii=False)
-        print(f"✅ Guardado '{data_file}' tras batch {b+1}\n")
+        abz_store.put_many(batch_records)
+        print(f"✅ Guardado batch {b+1} en '{store_file}'\n")
         time.sleep(0.1)
 
 except KeyboardInterrupt:
-    print("\n⏸️ Interrumpido. Guardando…")
-    with open(data_file, "w", encoding="utf-8") as fout:
-        json.dump(abz_data, fout, indent=2, ensure_ascii=False)
+    # Los batches ya confirmados están en el store; basta con salir
+    print(f"\n⏸️ Interrumpido. Progreso guardado en '{store_file}'.")
     sys.exit(0)
 
 except Exception as e:
-    print(f"\n❌ Error inesperado: {e}\nGuardando…")
-    with open(data_file, "w", encoding="utf-8") as fout:
-        json.dump(abz_data, fout, indent=2, ensure_ascii=False)
+    print(f"\n❌ Error inesperado: {e}\nProgreso guardado en '{store_file}'.")
     sys.exit(1)
 
+# ------------------------------------------------------------
+# 7) Compactación final a JSON
+# ------------------------------------------------------------
+mb_resolver.report()
+n = abz_store.compact(data_file)
+print(f"📁 '{data_file}' generado con {n} pistas.")
 print(f"\n✅ Completado en {(time.time()-start_time)/60:.1f} min.")
@@ -19,11 +19,13 @@ import json
 from math import ceil
 from dotenv import load_dotenv
 
-import requests
 import musicbrainzngs
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 
+from challenge_stream import iter_unique_track_ids
+from http_cache import ResponseCache, CachedSession
+
 # ------------------------------------------------------------
 # 1) Credenciales y user-agent
 # ------------------------------------------------------------
@@ -39,13 +41,21 @@ sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials(
 
 musicbrainzngs.set_useragent("enrichAB", "1.0", "tu_email@dominio.com")
 
+# Caché HTTP en disco compartida (MusicBrainz + AcousticBrainz)
+cache = ResponseCache()
+ab_http = CachedSession(cache, "acousticbrainz")
+
 # ------------------------------------------------------------
 # 2) Funciones para MusicBrainz y AcousticBrainz
 # ------------------------------------------------------------
 def get_mbid_from_name(track_name, artist_name):
     try:
-        res = musicbrainzngs.search_recordings(
-            recording=track_name, artist=artist_name, limit=1
+        res = cache.cached_call(
+            "musicbrainz",
+            {"op": "search_recordings", "recording": track_name, "artist": artist_name, "limit": 1},
+            lambda: musicbrainzngs.search_recordings(
+                recording=track_name, artist=artist_name, limit=1
+            ),
         )
         recs = res.get("recording-list", [])
         return recs[0]["id"] if recs else None
@@ -55,8 +65,10 @@ def get_mbid_from_name(track_name, artist_name):
 
 def fetch_mb_genre_and_rating(mbid):
     try:
-        rec = musicbrainzngs.get_recording_by_id(
-            mbid, includes=["tags", "rating"]
+        rec = cache.cached_call(
+            "musicbrainz",
+            {"op": "get_recording_by_id", "mbid": mbid, "includes": "tags,rating"},
+            lambda: musicbrainzngs.get_recording_by_id(mbid, includes=["tags", "rating"]),
         )["recording"]
         raw = rec.get("tag-list", [])
         tags_list = [raw] if isinstance(raw, dict) else raw
@@ -75,9 +87,9 @@ def fetch_mb_genre_and_rating(mbid):
 def fetch_acousticbrainz(mbid):
     base = "https://acousticbrainz.org"
     try:
-        ll_resp = requests.get(f"{base}/{mbid}/low-level", timeout=10)
+        ll_resp = ab_http.get(f"{base}/{mbid}/low-level", timeout=10)
         ll_resp.raise_for_status()
-        hl_resp = requests.get(f"{base}/{mbid}/high-level", timeout=10)
+        hl_resp = ab_http.get(f"{base}/{mbid}/high-level", timeout=10)
         hl_resp.raise_for_status()
         return ll_resp.json(), hl_resp.json()
     except Exception:
@@ -123,17 +135,7 @@ def select_top_genre(highlevel_data_dict): # Renombrado el parámetro para mayor
 # ------------------------------------------------------------
 # 3) Carga challenge_set y spotify_metadata
 # ------------------------------------------------------------
-with open("challenge_set.json", "r", encoding="utf-8") as f:
-    challenge = json.load(f)
-playlists = challenge["playlists"]
-
-all_ids, seen = [], set()
-for pl in playlists:
-    for tr in pl["tracks"]:
-        tid = tr["track_uri"].split(":")[-1]
-        if tid not in seen:
-            seen.add(tid)
-            all_ids.append(tid)
+all_ids = list(iter_unique_track_ids("challenge_set.json"))
 total = len(all_ids)
 print(f"➡️  {total} pistas únicas encontradas.\n")
 
@@ -231,4 +233,5 @@ except Exception as e:
         json.dump(abz_data, fout, indent=2, ensure_ascii=False)
     sys.exit(1)
 
+cache.report()
 print(f"\n✅ Completado en {(time.time()-start_time)/60:.1f} min.")
@@ -19,6 +19,9 @@ from dotenv import load_dotenv
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 
+from challenge_stream import iter_unique_track_ids
+from http_cache import ResponseCache, spotify_tracks
+
 # ------------------------------------------------------------
 # 1) Carga de credenciales
 # ------------------------------------------------------------
@@ -33,23 +36,14 @@ creds = SpotifyClientCredentials(client_id=SPOTI_ID,
                                  client_secret=SPOTI_SECRET)
 sp    = spotipy.Spotify(client_credentials_manager=creds)
 
+# Caché HTTP en disco: una re-ejecución no vuelve a pedir los mismos lotes
+cache = ResponseCache()
+
 # ------------------------------------------------------------
-# 2) Carga challenge_set y construye lista de track IDs
+# 2) Lee challenge_set en streaming y construye lista de track IDs
 # ------------------------------------------------------------
-with open("challenge_set.json", "r", encoding="utf-8") as f:
-    challenge = json.load(f)
-
-playlists = challenge["playlists"]
-
 # IDs únicos de todas las pistas
-all_ids = []
-seen = set()
-for pl in playlists:
-    for tr in pl["tracks"]:
-        tid = tr["track_uri"].split(":")[-1]
-        if tid not in seen:
-            seen.add(tid)
-            all_ids.append(tid)
+all_ids = list(iter_unique_track_ids("challenge_set.json"))
 
 total = len(all_ids)
 print(f"➡️  {total} pistas únicas encontradas.\n")
@@ -65,7 +59,7 @@ start_time = time.time()
 for i in range(batches):
     start = i * batch_size
     batch = all_ids[start : start + batch_size]
-    resp  = sp.tracks(batch)["tracks"]
+    resp, from_cache = spotify_tracks(cache, sp, batch)
     for tr in resp:
         if tr is None:
             continue
@@ -81,7 +75,8 @@ for i in range(batches):
     elapsed = time.time() - start_time
     print(f"[Spotify] Batch {i+1}/{batches} procesado — {len(sp_metadata)}/{total} tracks "
           f"in {elapsed:.1f}s")
-    time.sleep(0.3)
+    if not from_cache:
+        time.sleep(0.3)
 
 # ------------------------------------------------------------
 # 4) Guardar JSON intermedio
@@ -92,3 +87,5 @@ with open("spotify_metadata.json", "w", encoding="utf-8") as fout:
 total_elapsed = time.time() - start_time
 print(f"\n✅ spotify_metadata.json generado con {len(sp_metadata)} records "
       f"en {total_elapsed/60:.1f} min.")
+
+cache.report()
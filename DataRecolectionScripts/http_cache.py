@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+http_cache.py
+
+Caché de respuestas HTTP en disco, compartida por todos los scripts de
+DataRecolectionScripts (MusicBrainz, Last.fm, AcousticBrainz, Spotify).
+
+  - Direccionada por contenido: la clave es el SHA-256 de la petición
+    normalizada (servicio, método, URL sin query, parámetros ordenados y sin
+    secretos como api_key), así que dos llamadas equivalentes comparten entrada.
+  - TTL por servicio (AcousticBrainz está congelado desde 2022: sin expiración).
+  - Tamaño acotado con expulsión LRU (por último acceso).
+  - Estadísticas de hits/misses/expiradas/expulsiones.
+  - Modo offline (HTTP_CACHE_OFFLINE=1): un miss lanza CacheMissError en vez
+    de salir a la red, de modo que una re-ejecución con caché caliente se
+    puede verificar sin conexión.
+
+Uso:
+    cache = ResponseCache()
+    http = CachedSession(cache, "lastfm")
+    r = http.get(LASTFM_URL, params=params)       # como requests.get
+    rec = cache.cached_call("musicbrainz", {"op": "lookup", "mbid": m},
+                            lambda: musicbrainzngs.get_recording_by_id(m))
+    tracks, from_cache = spotify_tracks(cache, sp, ids[:50])   # sp.tracks de spotipy
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import argparse
+from urllib.parse import urlsplit, parse_qsl, urlunsplit
+
+import requests
+
+DAY = 24 * 3600
+
+# TTL en segundos por servicio; None = no expira
+DEFAULT_TTLS = {
+    "musicbrainz":    30 * DAY,
+    "lastfm":         7 * DAY,
+    "spotify":        7 * DAY,
+    "acousticbrainz": None,
+}
+
+SECRET_PARAMS = {"api_key", "client_secret", "access_token"}
+
+
+class CacheMissError(requests.exceptions.ConnectionError):
+    """Miss en modo offline: la petición necesitaría salir a la red."""
+
+
+# ------------------------------------------------------------
+# 1) Normalización de peticiones
+# ------------------------------------------------------------
+def normalize_request(namespace, url, params=None, method="GET"):
+    """Representación canónica (texto) de una petición."""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query += [(str(k), str(v)) for k, v in (params or {}).items()]
+    query = sorted((k, v) for k, v in query if k not in SECRET_PARAMS)
+    base = urlunsplit((parts.scheme.lower(), parts.netloc.lower(),
+                       parts.path.rstrip("/") or "/", "", ""))
+    return json.dumps([namespace, method.upper(), base, query], ensure_ascii=False)
+
+
+def cache_key(namespace, url, params=None, method="GET"):
+    return hashlib.sha256(
+        normalize_request(namespace, url, params, method).encode("utf-8")
+    ).hexdigest()
+
+
+# ------------------------------------------------------------
+# 2) Almacén
+# ------------------------------------------------------------
+class ResponseCache:
+    """Caché persistente (SQLite WAL) con TTL, LRU acotado y estadísticas."""
+
+    def __init__(self, path=None, max_bytes=2 * 1024**3, ttls=None, offline=None):
+        self.path = path or os.getenv("HTTP_CACHE_PATH", "http_cache.sqlite")
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        if offline is None:
+            offline = os.getenv("HTTP_CACHE_OFFLINE", "0") == "1"
+        self.offline = offline
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0}
+
+        # Compartida entre hilos (p.ej. el ThreadPoolExecutor de update_acousticbrainz_data.py)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "  key         TEXT PRIMARY KEY,"
+            "  namespace   TEXT NOT NULL,"
+            "  status      INTEGER NOT NULL,"
+            "  headers     TEXT NOT NULL,"
+            "  body        BLOB NOT NULL,"
+            "  size        INTEGER NOT NULL,"
+            "  expires     REAL,"
+            "  last_access REAL NOT NULL"
+            ")"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_lru ON responses (last_access)"
+        )
+        self.conn.commit()
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def get(self, key):
+        """Retorna (status, headers, body) o None si no está / expiró."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT status, headers, body, size, expires FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            now = time.time()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            status, headers, body, size, expires = row
+            if expires is not None and expires < now:
+                with self.conn:
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.stats["hits"] += 1
+            return status, json.loads(headers), body
+
+    def set(self, key, namespace, status, headers, body, ttl="default"):
+        with self._lock:
+            if ttl == "default":
+                ttl = self.ttls.get(namespace)
+            now = time.time()
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            size = len(body)
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses "
+                    "(key, namespace, status, headers, body, size, expires, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, namespace, status, json.dumps(dict(headers)), body, size,
+                     now + ttl if ttl is not None else None, now),
+                )
+            self.total_bytes += size - (old[0] if old else 0)
+            self.stats["stores"] += 1
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self, target_ratio=0.9):
+        """Expulsa las entradas menos usadas hasta quedar bajo target_ratio * max_bytes."""
+        with self._lock:
+            target = self.max_bytes * target_ratio
+            with self.conn:
+                self.conn.execute("DELETE FROM responses WHERE expires IS NOT NULL AND expires < ?",
+                                  (time.time(),))
+                self.total_bytes = self.conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                cur = self.conn.execute("SELECT key, size FROM responses ORDER BY last_access")
+                doomed = []
+                for key, size in cur:
+                    if self.total_bytes <= target:
+                        break
+                    doomed.append((key,))
+                    self.total_bytes -= size
+                cur.close()
+                self.conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            self.stats["evictions"] += len(doomed)
+
+    def cached_call(self, namespace, params, fn, ttl="default"):
+        """
+        Memoiza en disco una llamada de librería (p.ej. musicbrainzngs) cuyo
+        resultado sea serializable a JSON. Las excepciones no se cachean.
+        """
+        key = cache_key(namespace, f"call://{namespace}", params)
+        hit = self.get(key)
+        if hit is not None:
+            return json.loads(hit[2])
+        if self.offline:
+            raise CacheMissError(f"Sin entrada en caché (offline): {namespace} {params}")
+        result = fn()
+        self.set(key, namespace, 200, {}, json.dumps(result, ensure_ascii=False), ttl=ttl)
+        return result
+
+    def report(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        rate = self.stats["hits"] / lookups * 100 if lookups else 0.0
+        print(f"🗄️  Caché HTTP '{self.path}': {rate:.1f}% hits "
+              f"({self.stats['hits']}/{lookups}), {self.stats['stores']} nuevas, "
+              f"{self.stats['expired']} expiradas, {self.stats['evictions']} expulsadas, "
+              f"{self.total_bytes / 1024**2:.1f} MB")
+
+    def close(self):
+        self.conn.close()
+
+
+# ------------------------------------------------------------
+# 3) Sesión compatible con requests
+# ------------------------------------------------------------
+class CachedResponse:
+    """Respuesta servida desde la caché con la interfaz mínima de requests.Response."""
+
+    from_cache = True
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} (caché) para {self.url}", response=self)
+
+
+class CachedSession:
+    """Envuelve requests.Session: GET con caché; solo se guardan respuestas 200."""
+
+    def __init__(self, cache, namespace, session=None, ttl="default"):
+        self.cache = cache
+        self.namespace = namespace
+        self.session = session or requests.Session()
+        self.ttl = ttl
+
+    def get(self, url, params=None, **kwargs):
+        key = cache_key(self.namespace, url, params)
+        hit = self.cache.get(key)
+        if hit is not None:
+            status, headers, body = hit
+            return CachedResponse(url, status, headers, body)
+        if self.cache.offline:
+            raise CacheMissError(f"Sin entrada en caché (offline): {url} {params or ''}")
+        resp = self.session.get(url, params=params, **kwargs)
+        resp.from_cache = False
+        if resp.status_code == 200:
+            self.cache.set(key, self.namespace, 200,
+                           {"Content-Type": resp.headers.get("Content-Type", "")},
+                           resp.content, ttl=self.ttl)
+        return resp
+
+
+def spotify_tracks(cache, sp, ids):
+    """
+    sp.tracks(ids)["tracks"] (spotipy, hasta 50 ids) memoizado en el namespace
+    "spotify"; también devuelve si salió de la caché (para no esperar entre lotes).
+    """
+    ids = list(ids)
+    hits = cache.stats["hits"]
+    res = cache.cached_call("spotify", {"op": "tracks", "ids": ",".join(ids)}, lambda: sp.tracks(ids))
+    return res["tracks"], cache.stats["hits"] > hits
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspecciona o recorta la caché HTTP")
+    parser.add_argument("--path", default=None)
+    parser.add_argument("--max-mb", type=float, default=None,
+                        help="Recorta la caché (LRU) hasta este tamaño")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.path)
+    if args.max_mb is not None:
+        cache.max_bytes = int(args.max_mb * 1024**2)
+        cache.evict(target_ratio=1.0)
+    for ns, n, size in cache.conn.execute(
+            "SELECT namespace, COUNT(*), SUM(size) FROM responses GROUP BY namespace"):
+        print(f"   {ns:<15} {n:>8} entradas  {size / 1024**2:8.1f} MB")
+    cache.report()
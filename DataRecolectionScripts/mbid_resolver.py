@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+mbid_resolver.py
+
+Resolución de MBIDs "ISRC primero" para las pistas del challenge set.
+
+El flujo anterior (get_mbid_from_name + fetch_mb_genre_and_rating) hacía,
+por cada pista, una búsqueda difusa por nombre y luego un lookup del MBID
+para género y rating: ~2 peticiones por pista a 1 req/s. Aquí:
+
+  1. Las pistas con ISRC (spotify_metadata.json ya lo trae) se resuelven en
+     lotes con una sola búsqueda `isrc:(A OR B OR ...)` por lote.
+  2. Solo las pistas sin ISRC o cuyo ISRC no está en MusicBrainz caen a la
+     búsqueda por nombre, deduplicando pares (pista, artista) idénticos.
+  3. Los tags salen del mismo documento de búsqueda, sin lookup adicional.
+     El índice de búsqueda no incluye ratings, así que solo se consultan
+     (un lookup por MBID único) si se pide con --ratings.
+
+Cada resultado registra cómo se resolvió en `resolved_by` ("isrc" o
+"name_search"; None si no se encontró) y se confirma en un CheckpointStore.
+Todas las peticiones pasan por la caché HTTP de http_cache.py.
+
+Uso:
+    python mbid_resolver.py                      # todo el challenge set
+    python mbid_resolver.py --limit 2000         # benchmark sobre una muestra
+"""
+
+import re
+import sys
+import json
+import time
+import argparse
+import unicodedata
+from itertools import islice
+
+import requests
+
+from challenge_stream import iter_unique_track_ids
+from checkpoint_store import CheckpointStore
+from http_cache import ResponseCache, CachedSession, CacheMissError
+
+MB_URL = "https://musicbrainz.org/ws/2/recording"
+USER_AGENT = "MBIDResolver/1.0 ( micorreo@ejemplo.com )"
+
+ISRC_RE = re.compile(r"^[A-Z]{2}[A-Z0-9]{3}\d{7}$")
+ISRC_BATCH = 50    # ISRCs por búsqueda (la query de Lucene crece con cada uno)
+PAGE_SIZE = 100    # máximo permitido por la API de búsqueda
+
+
+# ------------------------------------------------------------
+# 1) Helpers puros (compartidos con async_enrichment.py)
+# ------------------------------------------------------------
+def normalize_isrc(isrc):
+    """ISRC en mayúsculas y sin guiones; None si no tiene formato válido."""
+    if not isrc:
+        return None
+    isrc = str(isrc).replace("-", "").strip().upper()
+    return isrc if ISRC_RE.match(isrc) else None
+
+
+def normalize_text(text):
+    """Minúsculas, sin acentos ni espacios repetidos (para deduplicar y comparar)."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split())
+
+
+def lucene_phrase(text):
+    """Frase entre comillas con las comillas y barras escapadas."""
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def isrc_query(isrcs):
+    return "isrc:(" + " OR ".join(isrcs) + ")"
+
+
+def name_query(track_name, artist_name):
+    return f"recording:{lucene_phrase(track_name)} AND artist:{lucene_phrase(artist_name)}"
+
+
+def pick_recording(docs, track_name=None):
+    """Entre varias grabaciones con el mismo ISRC, prefiere la del mismo título."""
+    if not docs:
+        return None
+    if track_name:
+        wanted = normalize_text(track_name)
+        for doc in docs:
+            if normalize_text(doc.get("title")) == wanted:
+                return doc
+    return docs[0]
+
+
+def genre_from_tags(tags):
+    """Tag con más votos (el mismo criterio que fetch_mb_genre_and_rating)."""
+    tags = [t for t in (tags or []) if isinstance(t, dict) and t.get("name")]
+    if not tags:
+        return None
+    return max(tags, key=lambda t: int(t.get("count", 0) or 0))["name"]
+
+
+def rating_from_doc(doc):
+    rating = (doc or {}).get("rating") or {}
+    return rating.get("value"), rating.get("votes-count")
+
+
+def mb_record(doc, resolved_by):
+    """Registro por pista a partir de un documento de recording (búsqueda o lookup)."""
+    if not doc:
+        return {"mbid": None, "resolved_by": None, "genre_mb": None,
+                "rating_value": None, "rating_votes": None}
+    rating_value, rating_votes = rating_from_doc(doc)
+    return {
+        "mbid":         doc["id"],
+        "resolved_by":  resolved_by,
+        "genre_mb":     genre_from_tags(doc.get("tags")),
+        "rating_value": rating_value,
+        "rating_votes": rating_votes,
+    }
+
+
+def group_by_isrc(docs, wanted):
+    """{isrc: [docs]} para los ISRC pedidos, conservando el orden por score."""
+    out = {}
+    for doc in docs:
+        for isrc in doc.get("isrcs", []):
+            isrc = isrc.upper()
+            if isrc in wanted:
+                out.setdefault(isrc, []).append(doc)
+    return out
+
+
+# ------------------------------------------------------------
+# 2) Resolver síncrono (1 req/s, caché en disco, checkpoint)
+# ------------------------------------------------------------
+class MBIDResolver:
+    """Resuelve {spotify_id: metadata} → {spotify_id: registro MusicBrainz}."""
+
+    def __init__(self, cache=None, store=None, fetch_ratings=False,
+                 isrc_batch=ISRC_BATCH, min_interval=1.0, max_retries=3):
+        self.cache = cache or ResponseCache()
+        self.store = store
+        self.fetch_ratings = fetch_ratings
+        self.isrc_batch = isrc_batch
+        self.min_interval = min_interval
+        self.max_retries = max_retries
+
+        session = requests.Session()
+        session.headers["User-Agent"] = USER_AGENT
+        self.http = CachedSession(self.cache, "musicbrainz", session=session)
+        self._next_request = 0.0
+        # Peticiones lógicas por tipo y cuántas salieron realmente a la red
+        self.stats = {"isrc_search": 0, "name_search": 0, "lookup": 0, "network": 0}
+        # Pistas resueltas por método (None = sin resolver)
+        self.resolved = {"isrc": 0, "name_search": 0, None: 0}
+
+    # --------------------------------------------------------
+    # HTTP
+    # --------------------------------------------------------
+    def _get(self, kind, url, params):
+        self.stats[kind] += 1
+        params = dict(params, fmt="json")
+        for attempt in range(1, self.max_retries + 1):
+            wait = self._next_request - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                resp = self.http.get(url, params=params, timeout=20)
+            except CacheMissError:
+                return None
+            except requests.exceptions.RequestException as e:
+                print(f"  ⚠️ Error de MusicBrainz ({kind}): {e}. Intento {attempt}/{self.max_retries}.")
+                self._next_request = time.monotonic() + 5 * attempt
+                continue
+            if resp.from_cache:
+                return resp.json()
+            self.stats["network"] += 1
+            self._next_request = time.monotonic() + self.min_interval
+            if resp.status_code == 503:  # Rate limit de MusicBrainz
+                self._next_request += int(resp.headers.get("Retry-After", 1))
+                continue
+            if resp.status_code >= 500:
+                continue
+            if resp.status_code != 200:
+                print(f"  ⚠️ MusicBrainz respondió {resp.status_code} ({kind}).")
+                return None
+            return resp.json()
+        return None
+
+    def _search(self, kind, query, limit=PAGE_SIZE):
+        """Todas las páginas de una búsqueda de recordings."""
+        docs, offset = [], 0
+        while True:
+            res = self._get(kind, MB_URL, {"query": query, "limit": limit, "offset": offset})
+            if not res:
+                return docs
+            page = res.get("recordings", [])
+            docs.extend(page)
+            offset += len(page)
+            if not page or limit < PAGE_SIZE or offset >= res.get("count", 0):
+                return docs
+
+    # --------------------------------------------------------
+    # Etapas
+    # --------------------------------------------------------
+    def resolve_isrcs(self, isrcs):
+        """{isrc: [docs]} con una búsqueda por lote de ISRCs."""
+        isrcs = sorted(set(isrcs))
+        found = {}
+        for i in range(0, len(isrcs), self.isrc_batch):
+            chunk = isrcs[i:i + self.isrc_batch]
+            found.update(group_by_isrc(self._search("isrc_search", isrc_query(chunk)), set(chunk)))
+        return found
+
+    def search_by_name(self, track_name, artist_name):
+        docs = self._search("name_search", name_query(track_name, artist_name), limit=1)
+        return docs[0] if docs else None
+
+    def lookup_rating(self, mbid):
+        doc = self._get("lookup", f"{MB_URL}/{mbid}", {"inc": "ratings"})
+        return rating_from_doc(doc)
+
+    def resolve(self, tracks):
+        """
+        tracks: {spotify_id: {"track_name", "artist_name", "isrc"}}.
+        Retorna {spotify_id: registro} y, si hay store, lo confirma en él.
+        """
+        out = {}
+
+        # 2.1 ISRC en lotes
+        by_isrc = {}
+        for tid, meta in tracks.items():
+            isrc = normalize_isrc(meta.get("isrc"))
+            if isrc:
+                by_isrc.setdefault(isrc, []).append(tid)
+        docs_by_isrc = self.resolve_isrcs(by_isrc) if by_isrc else {}
+        for isrc, tids in by_isrc.items():
+            for tid in tids:
+                doc = pick_recording(docs_by_isrc.get(isrc), tracks[tid].get("track_name"))
+                if doc:
+                    out[tid] = mb_record(doc, "isrc")
+
+        # 2.2 Búsqueda por nombre solo para lo no resuelto, un par (pista, artista) una vez
+        pairs = {}
+        for tid, meta in tracks.items():
+            if tid in out:
+                continue
+            name, artist = meta.get("track_name"), meta.get("artist_name")
+            if not name or not artist:
+                out[tid] = mb_record(None, None)
+                continue
+            pairs.setdefault((normalize_text(name), normalize_text(artist)), []).append(tid)
+        for tids in pairs.values():
+            meta = tracks[tids[0]]
+            record = mb_record(self.search_by_name(meta["track_name"], meta["artist_name"]),
+                               "name_search")
+            for tid in tids:
+                out[tid] = dict(record)
+
+        # 2.3 Ratings (opcional): un lookup por MBID único
+        if self.fetch_ratings:
+            mbids = {r["mbid"] for r in out.values() if r["mbid"] and r["rating_value"] is None}
+            ratings = {m: self.lookup_rating(m) for m in sorted(mbids)}
+            for record in out.values():
+                if record["mbid"] in ratings:
+                    record["rating_value"], record["rating_votes"] = ratings[record["mbid"]]
+
+        for record in out.values():
+            self.resolved[record["resolved_by"] if record["mbid"] else None] += 1
+        if self.store is not None:
+            self.store.put_many(out)
+        return out
+
+    def report(self):
+        """Compara las peticiones hechas con las del flujo por pista."""
+        n_tracks = sum(self.resolved.values())
+        resolved = n_tracks - self.resolved[None]
+        # Flujo anterior: 1 búsqueda por pista + 1 lookup por MBID encontrado
+        legacy = n_tracks + resolved
+        done = self.stats["isrc_search"] + self.stats["name_search"] + self.stats["lookup"]
+        drop = (1 - done / legacy) * 100 if legacy else 0.0
+        print(f"\n📊 Resolución de MBIDs ({n_tracks} pistas):")
+        print(f"   por ISRC:        {self.resolved['isrc']}")
+        print(f"   por nombre:      {self.resolved['name_search']}")
+        print(f"   sin resolver:    {self.resolved[None]}")
+        print(f"📉 Peticiones a MusicBrainz: {done} "
+              f"(isrc={self.stats['isrc_search']}, nombre={self.stats['name_search']}, "
+              f"lookup={self.stats['lookup']}; {self.stats['network']} por red) "
+              f"vs ~{legacy} con búsqueda por pista → −{drop:.1f}%")
+        self.cache.report()
+
+
+# ------------------------------------------------------------
+# 3) CLI
+# ------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resuelve MBIDs por ISRC (y nombre como respaldo)")
+    parser.add_argument("--challenge", default="challenge_set.json")
+    parser.add_argument("--spotify-metadata", default="spotify_metadata.json")
+    parser.add_argument("--store", default="mbid_resolution.sqlite")
+    parser.add_argument("--output", default="mbid_resolution.json")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="Pistas confirmadas en el store por iteración")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="Procesa solo las primeras N pistas (benchmark)")
+    parser.add_argument("--ratings", action="store_true",
+                        help="Consulta también ratings (un lookup por MBID)")
+    parser.add_argument("--cache", default=None)
+    args = parser.parse_args(argv)
+
+    all_ids = list(islice(iter_unique_track_ids(args.challenge), args.limit))
+    with open(args.spotify_metadata, "r", encoding="utf-8") as f:
+        sp_meta = json.load(f)
+    print(f"➡️  {len(all_ids)} pistas únicas, "
+          f"{sum(1 for t in all_ids if normalize_isrc(sp_meta.get(t, {}).get('isrc')))} con ISRC.")
+
+    store = CheckpointStore(args.store)
+    resolver = MBIDResolver(cache=ResponseCache(args.cache), store=store,
+                            fetch_ratings=args.ratings)
+    pending = [tid for tid in all_ids if tid not in store]
+    if len(pending) < len(all_ids):
+        print(f"🔄 Reanudando: {len(all_ids) - len(pending)} ya resueltas.")
+
+    try:
+        for i in range(0, len(pending), args.batch_size):
+            batch = pending[i:i + args.batch_size]
+            t0 = time.time()
+            resolver.resolve({tid: sp_meta.get(tid, {}) for tid in batch})
+            print(f"✅ {i + len(batch)}/{len(pending)} pistas en {time.time() - t0:.1f}s")
+    except KeyboardInterrupt:
+        print(f"\n⏸️ Interrumpido. Progreso guardado en '{args.store}'.")
+        sys.exit(0)
+
+    resolver.report()
+    n = store.compact(args.output)
+    print(f"📁 '{args.output}' generado con {n} pistas.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+mock_replay_server.py
+
+Servidor HTTP local que reproduce respuestas grabadas con
+`async_enrichment.py --record respuestas.jsonl`, para probar el motor
+asíncrono sin red ni credenciales:
+
+    python mock_replay_server.py respuestas.jsonl --port 8765
+    python async_enrichment.py --mock-url http://127.0.0.1:8765
+
+Las rutas tienen la forma /<servicio>/<ruta original>. Las peticiones que no
+están en la grabación responden 404 (y se cuentan como 'misses').
+
+    python mock_replay_server.py --check     # grabar → reproducir → caché offline, sin red
+
+check() graba contra un servidor local que imita a Spotify/Last.fm/MusicBrainz,
+lo reproduce con este mock (otras credenciales, incluido el POST del token
+con su cuerpo de formulario) y repite sin ningún servidor con la caché en
+modo offline.
+"""
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+import tempfile
+
+from aiohttp import web
+
+from async_enrichment import SERVICES, AsyncEnricher, request_key
+from http_cache import ResponseCache
+
+
+def load_cassette(path):
+    """Lee el JSONL grabado → {clave: (status, headers, body)}."""
+    responses = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            responses[entry["key"]] = (entry["status"], entry.get("headers", {}), entry["body"])
+    return responses
+
+
+def make_app(responses):
+    stats = {"hits": 0, "misses": 0}
+
+    async def handle(request):
+        service = request.match_info["service"]
+        path = "/" + request.match_info["path"]
+        if service not in SERVICES:
+            raise web.HTTPNotFound(text=f"Servicio desconocido: {service}")
+        # Igual que al grabar: query string + cuerpo de formulario
+        data = dict(await request.post()) if request.method == "POST" else None
+        key = request_key(request.method, service, path, dict(request.query), data)
+        if key not in responses:
+            stats["misses"] += 1
+            return web.json_response({"error": "no grabado"}, status=404)
+        stats["hits"] += 1
+        status, headers, body = responses[key]
+        return web.json_response(body, status=status, headers=headers)
+
+    async def handle_stats(request):
+        return web.json_response(stats)
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_get("/_stats", handle_stats)
+    app.router.add_route("*", "/{service}/{path:.*}", handle)
+    return app
+
+
+# ------------------------------------------------------------
+# Comprobación de extremo a extremo (sin red)
+# ------------------------------------------------------------
+def make_upstream_app(secrets):
+    """Imita las APIs reales (mismas rutas que el mock) y exige las credenciales de `secrets`."""
+
+    async def token(request):
+        form = await request.post()
+        if form.get("client_secret") != secrets["spotify_secret"]:
+            return web.json_response({"error": "invalid_client"}, status=400)
+        return web.json_response({"access_token": secrets["token"], "token_type": "Bearer", "expires_in": 3600})
+
+    async def tracks(request):
+        if request.headers.get("Authorization") != f"Bearer {secrets['token']}":
+            return web.json_response({"error": "unauthorized"}, status=401)
+        return web.json_response({"tracks": [
+            {"id": t, "name": f"Song {t}", "artists": [{"name": "Artist"}], "duration_ms": 200_000,
+             "explicit": False, "popularity": 50, "album": {"release_date": "2015-01-01"},
+             "external_ids": {"isrc": f"ISRC{t}"}}
+            for t in request.query["ids"].split(",")]})
+
+    async def lastfm(request):
+        if request.query.get("api_key") != secrets["lastfm_key"]:
+            return web.json_response({"error": 10}, status=403)
+        return web.json_response({"track": {"toptags": {"tag": [{"name": "rock"}, {"name": "indie"}]}}})
+
+    async def recording(request):
+        return web.json_response({"id": request.match_info["mbid"], "rating": {"value": 4.5, "votes-count": 3}})
+
+    app = web.Application()
+    app.router.add_post("/spotify_auth/token", token)
+    app.router.add_get("/spotify/tracks", tracks)
+    app.router.add_get("/lastfm/", lastfm)
+    app.router.add_get("/musicbrainz/recording/{mbid}", recording)
+    return app
+
+
+async def _workload(engine):
+    return {"spotify": await engine.spotify_tracks(["t1", "t2"]),
+            "lastfm": await engine.lastfm_tags("Song t1", "Artist"),
+            "rating": list(await engine.mb_rating("mbid-1"))}
+
+
+async def _serve(app, port):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def _check(port):
+    secrets = {"spotify_secret": "sekret-A", "lastfm_key": "lfm-key-A", "token": "tok-A"}
+    workdir = tempfile.mkdtemp(prefix="mock_check_")
+    cassette = os.path.join(workdir, "respuestas.jsonl")
+    url = f"http://127.0.0.1:{port}"
+
+    # 1) Grabación contra el "servicio real" (servidor local con las credenciales A)
+    upstream = await _serve(make_upstream_app(secrets), port)
+    try:
+        async with AsyncEnricher("id-A", secrets["spotify_secret"], secrets["lastfm_key"],
+                                 mock_url=url, record_path=cassette, max_retries=1) as engine:
+            recorded = await _workload(engine)
+    finally:
+        await upstream.cleanup()
+    assert recorded["spotify"] and recorded["lastfm"] and recorded["rating"][0] == 4.5, recorded
+    with open(cassette, encoding="utf-8") as f:
+        text = f.read()
+    leaked = [v for v in secrets.values() if v in text]
+    assert not leaked, f"secretos en la grabación: {leaked}"
+    print(f"✅ Grabadas {text.count(chr(10))} respuestas, sin credenciales ni token")
+
+    # 2) Reproducción con el mock y otras credenciales: el POST del token se
+    #    encuentra por su cuerpo de formulario (sin client_id/client_secret)
+    responses = load_cassette(cassette)
+    app = make_app(responses)
+    mock = await _serve(app, port)
+    cache = ResponseCache(os.path.join(workdir, "http_cache.sqlite"))
+    try:
+        async with AsyncEnricher("id-B", "sekret-B", "lfm-key-B", mock_url=url, cache=cache,
+                                 max_retries=1) as engine:
+            replayed = await _workload(engine)
+        stats = app["stats"]
+    finally:
+        await mock.cleanup()
+    assert replayed == recorded, (replayed, recorded)
+    assert stats == {"hits": len(responses), "misses": 0}, stats
+    print(f"✅ Reproducidas con el mock: {stats['hits']} hits, 0 misses (POST del token incluido)")
+
+    # 3) Sin servidor y con la caché en modo offline: los GET salen de la caché
+    offline = ResponseCache(cache.path, offline=True)
+    async with AsyncEnricher("id-B", "sekret-B", "lfm-key-B", mock_url=url, cache=offline,
+                             max_retries=1) as engine:
+        cached = await _workload(engine)
+    assert cached == recorded, (cached, recorded)
+    print(f"✅ Re-ejecución offline desde la caché: {offline.stats['hits']} hits, "
+          f"{offline.stats['misses']} misses, sin red")
+
+
+def check(port=8766):
+    asyncio.run(_check(port))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproduce respuestas HTTP grabadas")
+    parser.add_argument("cassette", nargs="?", help="JSONL generado con async_enrichment.py --record")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--check", action="store_true",
+                        help="Grabar, reproducir y re-ejecutar offline contra servidores locales")
+    args = parser.parse_args()
+
+    if args.check:
+        check()
+        sys.exit(0)
+    if not args.cassette:
+        parser.error("falta el archivo de grabación (cassette)")
+
+    responses = load_cassette(args.cassette)
+    if not responses:
+        sys.exit(f"❌ '{args.cassette}' no contiene respuestas grabadas.")
+    print(f"🎞️  {len(responses)} respuestas cargadas desde '{args.cassette}'.")
+    web.run_app(make_app(responses), host=args.host, port=args.port)
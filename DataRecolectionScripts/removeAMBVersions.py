@@ -2,6 +2,19 @@
 import json
 import sys
 
+def strip_highlevel_versions(track_data: dict) -> dict:
+    """
+    Elimina (in-place) las claves "version" de cada subobjeto de "highlevel"
+    de una pista y retorna la misma pista.
+    """
+    hl = track_data.get("highlevel")
+    if isinstance(hl, dict):
+        for feature_name, feature_data in hl.items():
+            if isinstance(feature_data, dict) and "version" in feature_data:
+                del feature_data["version"]
+    return track_data
+
+
 def remove_versions_from_highlevel(input_path: str, output_path: str):
     """
     Carga el JSON de AcousticBrainz, elimina todas las claves "version"
@@ -11,16 +24,11 @@ def remove_versions_from_highlevel(input_path: str, output_path: str):
     with open(input_path, "r", encoding="utf-8") as f:
         data = json.load(f)
 
-    # 2) Iterar por cada pista
+    # 2) Para cada pista, borrar la clave "version" de sus características highlevel
     for track_id, track_data in data.items():
-        hl = track_data.get("highlevel")
-        if isinstance(hl, dict):
-            # 3) Para cada característica en highlevel, borrar la clave "version"
-            for feature_name, feature_data in hl.items():
-                if isinstance(feature_data, dict) and "version" in feature_data:
-                    del feature_data["version"]
+        strip_highlevel_versions(track_data)
 
-    # 4) Volcar el JSON modificado
+    # 3) Volcar el JSON modificado
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
@@ -6,7 +6,9 @@ Lee un archivo acousticbrainz_data.json existente,
 actualiza MusicBrainz (opcional) y AcousticBrainz en bulk,
 mostrando tiempo por chunk, reutilizando conexiones,
 paralelizando solicitudes low/high-level y permitiendo
-reanudar tras interrupción guardando checkpoints.
+reanudar tras interrupción: cada chunk se confirma en un
+CheckpointStore (SQLite WAL) y al final se compacta en
+acousticbrainz_data_updated_clean.json.
 """
 
 import os
@@ -20,6 +22,10 @@ import requests
 import musicbrainzngs
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from checkpoint_store import CheckpointStore
+from http_cache import ResponseCache, CachedSession, CacheMissError
+from removeAMBVersions import strip_highlevel_versions
+
 # ------------------------------------------------------------
 # 1) Configuración inicial y sesión HTTP
 # ------------------------------------------------------------
@@ -33,6 +39,8 @@ except Exception as e:
     sys.exit(f"❌ Error configurando MusicBrainz: {e}")
 
 session = requests.Session()  # Keep-alive para acelerar peticiones HTTP
+cache = ResponseCache()       # Caché HTTP en disco compartida
+ab_http = CachedSession(cache, "acousticbrainz", session=session)
 
 # ------------------------------------------------------------
 # 2) Helpers para bulk y concurrencia
@@ -50,7 +58,7 @@ def fetch_chunk_level(level_type, ids_param, max_retries=3, timeout=20):
     retries = 0
     while retries < max_retries:
         try:
-            resp = session.get(url, timeout=timeout)
+            resp = ab_http.get(url, timeout=timeout)
             if resp.status_code == 429:
                 retry_after = int(resp.headers.get("Retry-After",
                                   resp.headers.get("X-RateLimit-Reset-In", 10))) + 1
@@ -59,12 +67,16 @@ def fetch_chunk_level(level_type, ids_param, max_retries=3, timeout=20):
                 continue
             resp.raise_for_status()
             data = resp.json()
+            if resp.from_cache:
+                return data
             # Control proactivo de rate-limit
             remaining = int(resp.headers.get("X-RateLimit-Remaining", 1))
             if remaining < 1:
                 wait = int(resp.headers.get("X-RateLimit-Reset-In", 2)) + 1
                 time.sleep(wait)
             return data
+        except CacheMissError:
+            break  # Modo offline: no tiene sentido reintentar
         except requests.exceptions.Timeout:
             retries += 1
             time.sleep(5 * retries)
@@ -100,26 +112,27 @@ def main():
     data_file = "acousticbrainz_data.json"
     output_file = "acousticbrainz_data_updated.json"
     checkpoint_file = "acousticbrainz_checkpoint.json"
-
-    # Cargar datos previos o del original
-    if os.path.exists(output_file):
-        print(f"🔄 Reanudando desde '{output_file}'...")
-        with open(output_file, "r", encoding="utf-8") as fin:
-            abz_data = json.load(fin)
-    elif os.path.exists(data_file):
-        print(f"🔄 Cargando '{data_file}'...")
-        with open(data_file, "r", encoding="utf-8") as fin:
-            abz_data = json.load(fin)
-    else:
-        sys.exit(f"❌ No se encontró ni '{output_file}' ni '{data_file}'")
-
-    # Cargar MBIDs ya procesados
-    if os.path.exists(checkpoint_file):
-        with open(checkpoint_file, "r", encoding="utf-8") as ckp:
-            processed_mbids = set(json.load(ckp))
+    clean_file = "acousticbrainz_data_updated_clean.json"
+    store_file = "acousticbrainz_data_updated.sqlite"
+
+    # El original se lee una sola vez; las pistas actualizadas van al store
+    if not os.path.exists(data_file):
+        sys.exit(f"❌ No se encontró '{data_file}'")
+    print(f"🔄 Cargando '{data_file}'...")
+    with open(data_file, "r", encoding="utf-8") as fin:
+        abz_data = json.load(fin)
+
+    updated = CheckpointStore(store_file, table="tracks")
+    processed_mbids = CheckpointStore(store_file, table="processed_mbids")
+
+    # Migración desde los archivos de ejecuciones anteriores
+    if not len(updated) and os.path.exists(output_file):
+        print(f"🔄 Importando progreso previo desde '{output_file}'...")
+        updated.import_json(output_file)
+    if not len(processed_mbids) and os.path.exists(checkpoint_file):
+        processed_mbids.import_json(checkpoint_file)
+    if len(processed_mbids):
         print(f"✅ Se retomarán {len(processed_mbids)} MBIDs ya procesados.")
-    else:
-        processed_mbids = set()
 
     # Mapear MBID -> lista de Spotify IDs
     mbid_map = {}
@@ -140,14 +153,15 @@ def main():
             t0 = time.time()
             ll_bulk, hl_bulk = fetch_acousticbrainz_bulk(chunk)
 
-            # Asignar resultados al JSON en memoria
+            # Construir solo los registros afectados por este chunk
+            chunk_records = {}
             for m in chunk:
                 ll_raw = ll_bulk.get(m, {})
                 ll = next(iter(ll_raw.values()), {}) if isinstance(ll_raw, dict) else {}
                 hl_raw = hl_bulk.get(m, {})
                 hl = next(iter(hl_raw.values()), {}).get("highlevel", {})
                 for sid in mbid_map.get(m, []):
-                    e = abz_data[sid]
+                    e = dict(abz_data[sid])
                     e["highlevel"] = hl
                     e["bpm"] = ll.get("rhythm", {}).get("bpm")
                     e["energy"] = ll.get("lowlevel", {}).get("dynamic_complexity")
@@ -155,29 +169,29 @@ def main():
                     e["loudness"] = ll.get("lowlevel", {}).get("average_loudness")
                     for old in ("top_genre_hl","danceability_hl","mood_happy","acousticness"):
                         e.pop(old, None)
+                    chunk_records[sid] = e
+
+            # Guardar progreso: registros y MBIDs procesados (una transacción cada uno)
+            updated.put_many(chunk_records)
+            processed_mbids.add_keys(chunk)
 
             elapsed = time.time() - t0
             print(f"  ⏱️ Chunk {idx}/{num_chunks} procesado en {elapsed:.2f}s.")
 
-            # Guardar checkpoint: actualizar lista de procesados
-            processed_mbids.update(chunk)
-            with open(checkpoint_file, "w", encoding="utf-8") as ckp:
-                json.dump(list(processed_mbids), ckp)
-            # Guardar progreso parcial
-            with open(output_file, "w", encoding="utf-8") as fout:
-                json.dump(abz_data, fout, indent=2, ensure_ascii=False)
-
             # Pausa mínima de seguridad
             # if idx < num_chunks:
             #     time.sleep(1)
     else:
         print("✅ No hay MBIDs pendientes.")
 
-    # Final: eliminar checkpoint y reporte
-    if os.path.exists(checkpoint_file):
-        os.remove(checkpoint_file)
+    cache.report()
+
+    # Final: compactar original + actualizaciones en el JSON limpio
+    print(f"💾 Compactando '{store_file}' en '{clean_file}'...")
+    n = updated.compact(clean_file, base=abz_data, transform=strip_highlevel_versions)
     total_min = (time.time() - start_script) / 60
-    print(f"\n🎉 Proceso completado en {total_min:.2f} minutos. Datos en '{output_file}'.")
+    print(f"\n🎉 Proceso completado en {total_min:.2f} minutos. "
+          f"{n} pistas en '{clean_file}'.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,273 @@
+"""
+cluster_sweep.py
+
+Barrido de hiperparámetros de clustering en paralelo, en vez del bucle del
+codo (KMeans k = 2..15) y de una sola configuración de DBSCAN / HDBSCAN
+en serie, con silhouette_score recalculando distancias en cada llamada.
+
+Lo caro se calcula una vez y se comparte con los procesos del pool con
+memory map (igual que parallel_rules.py). La base es el grafo kNN de
+knn_graph.py (se puede pasar uno ya guardado con graph=KNNGraph.load(...)):
+
+  - matriz de distancias de su muestra de evaluación: silhouette de todas
+    las configuraciones sale de ella con un producto D · one-hot, sin
+    volver a medir distancias.
+  - HDBSCAN: para cada min_samples se arma el MST de alcanzabilidad mutua
+    sobre el kNN y se pasa a HDBSCAN(metric="precomputed", min_samples=1).
+  - DBSCAN: grafo de vecinos en radio max(eps) (exacto para cada eps ≤
+    max(eps) y cada min_samples). Los eps cuyo grafo de radio no cabe en
+    max_graph_nnz aristas usan el kNN recortado a eps: los puntos núcleo
+    salen igual (min_samples ≤ k + 1), pero se pierden las aristas más
+    allá del k-ésimo vecino; la columna "exact" lo indica.
+
+El resultado es una tabla comparable (una fila por configuración: clusters,
+% de ruido, inercia, silhouette, Davies-Bouldin, Calinski-Harabasz y
+tiempos) y las etiquetas de cada configuración.
+
+Uso:
+    table, labels = run_sweep(X_playlist_numeric, k_range=range(2, 16),
+                              dbscan_eps=(0.5, 1.0, 2.5), dbscan_min_samples=(10, 20),
+                              hdbscan_min_cluster_size=(10, 20, 50))
+    table.sort_values("silhouette", ascending=False)
+    labels["kmeans k=6"]
+
+    python cluster_sweep.py data/processed_for_modeling/playlist_umap_embedding.parquet --jobs 4
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.cluster import DBSCAN, KMeans
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score
+from sklearn.neighbors import NearestNeighbors
+
+from knn_graph import KNNGraph, mutual_reachability_mst, silhouette_from_distances  # noqa: F401 (re-export)
+
+# Arrays compartidos del proceso worker (se abren en el initializer)
+_SHARED = {}
+
+
+# ------------------------------------------------------------
+# 1) Artefactos compartidos (una vez por barrido)
+# ------------------------------------------------------------
+def dump_shared(X, directory, graph, max_eps=None):
+    """Datos, grafo kNN (con su muestra de evaluación) y, si hace falta, grafo de radio exacto."""
+    np.save(os.path.join(directory, "X.npy"), X)
+    graph.save(os.path.join(directory, "knn"))
+    if max_eps is not None:
+        nn = NearestNeighbors().fit(X)
+        g = nn.radius_neighbors_graph(radius=max_eps, mode="distance", sort_results=True)
+        for name in ("data", "indices", "indptr"):
+            np.save(os.path.join(directory, f"radius_{name}.npy"), getattr(g, name))
+        np.save(os.path.join(directory, "radius_eps.npy"), np.float64(max_eps))
+    return directory
+
+
+def estimate_radius_nnz(X, eps_values, sample_size=1000, seed=0):
+    """Aristas estimadas del grafo de radio para cada eps (vecinos de una muestra × n)."""
+    rng = np.random.default_rng(seed)
+    sample = X[rng.choice(len(X), min(sample_size, len(X)), replace=False)]
+    nn = NearestNeighbors().fit(X)
+    return {eps: int(np.mean([len(i) for i in nn.radius_neighbors(sample, radius=eps, return_distance=False)]) * len(X))
+            for eps in eps_values}
+
+
+def _open_shared(directory):
+    for f in os.listdir(directory):
+        if f.endswith(".npy"):
+            _SHARED[f[:-4]] = np.load(os.path.join(directory, f), mmap_mode="r")
+    _SHARED["graph"] = KNNGraph.load(os.path.join(directory, "knn"), mmap=True)
+
+
+def _dbscan_graph(eps):
+    """(grafo, exacto): el de radio si cubre eps; si no, el kNN recortado a eps."""
+    if "radius_eps" in _SHARED and eps <= _SHARED["radius_eps"]:
+        n = len(_SHARED["X"])
+        return sp.csr_matrix((_SHARED["radius_data"], _SHARED["radius_indices"], _SHARED["radius_indptr"]),
+                             shape=(n, n)), True
+    graph = _SHARED["graph"]
+    return graph.to_csr(eps), graph.saturated(eps) == 0
+
+
+# ------------------------------------------------------------
+# 2) Métricas sobre artefactos compartidos
+# ------------------------------------------------------------
+def _metrics(X, labels):
+    """Silhouette (muestra de evaluación, sin ruido), Davies-Bouldin y Calinski-Harabasz (sin ruido)."""
+    sil = _SHARED["graph"].silhouette(labels)
+    inliers = labels >= 0
+    n_clusters = len(np.unique(labels[inliers]))
+    ok = 1 < n_clusters < inliers.sum()
+    return {
+        "silhouette": sil,
+        "davies_bouldin": davies_bouldin_score(X[inliers], labels[inliers]) if ok else np.nan,
+        "calinski_harabasz": calinski_harabasz_score(X[inliers], labels[inliers]) if ok else np.nan,
+    }
+
+
+# ------------------------------------------------------------
+# 3) Una configuración
+# ------------------------------------------------------------
+def config_name(algorithm, params):
+    return f"{algorithm} " + " ".join(f"{k}={v}" for k, v in params.items())
+
+
+def _run_one(algorithm, params, random_state=42):
+    X = np.asarray(_SHARED["X"])
+    t0 = time.perf_counter()
+    inertia, extra = np.nan, {}
+    if algorithm == "kmeans":
+        km = KMeans(n_clusters=params["k"], n_init=10, random_state=random_state).fit(X)
+        labels, inertia = km.labels_, km.inertia_
+    elif algorithm == "dbscan":
+        graph, extra["exact"] = _dbscan_graph(params["eps"])
+        labels = DBSCAN(eps=params["eps"], min_samples=params["min_samples"],
+                        metric="precomputed").fit_predict(graph)
+    elif algorithm == "hdbscan":
+        labels = _SHARED["graph"].hdbscan(params["min_cluster_size"], params["min_samples"])
+    else:
+        raise ValueError(f"Algoritmo desconocido: {algorithm}")
+    fit_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    row = {"config": config_name(algorithm, params), "algorithm": algorithm, **params,
+           "n_clusters": len(np.unique(labels[labels >= 0])), "noise_frac": float(np.mean(labels < 0)),
+           "inertia": inertia, **extra, **_metrics(X, labels)}
+    row["fit_s"], row["eval_s"] = fit_s, time.perf_counter() - t0
+    return row, labels.astype(np.int32)
+
+
+# ------------------------------------------------------------
+# 4) Driver
+# ------------------------------------------------------------
+def sweep_tasks(k_range=range(2, 16), dbscan_eps=(), dbscan_min_samples=(20,),
+                hdbscan_min_cluster_size=(), hdbscan_min_samples=(10,)):
+    tasks = [("kmeans", {"k": int(k)}) for k in k_range]
+    tasks += [("dbscan", {"eps": float(e), "min_samples": int(m)}) for e in dbscan_eps for m in dbscan_min_samples]
+    tasks += [("hdbscan", {"min_cluster_size": int(c), "min_samples": int(m)})
+              for c in hdbscan_min_cluster_size for m in hdbscan_min_samples]
+    return tasks
+
+
+def run_sweep(X, k_range=range(2, 16), dbscan_eps=(), dbscan_min_samples=(20,), hdbscan_min_cluster_size=(),
+              hdbscan_min_samples=(10,), eval_size=10_000, knn_k=30, max_graph_nnz=50_000_000, graph=None, n_jobs=None,
+              seed=0, verbose=True):
+    """
+    Evalúa todas las configuraciones en un pool de n_jobs procesos (None =
+    todos los núcleos). `graph` es un KNNGraph de X ya construido (si no, se
+    construye con k=knn_k y eval_size). Retorna (tabla, {config: etiquetas}).
+    """
+    if isinstance(X, pd.DataFrame):
+        X = X.select_dtypes(include=np.number)
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    n_jobs = n_jobs or os.cpu_count()
+    tasks = sweep_tasks(k_range, dbscan_eps, dbscan_min_samples, hdbscan_min_cluster_size, hdbscan_min_samples)
+    knn_k = max([knn_k] + [p["min_samples"] - 1 for a, p in tasks if a != "kmeans"])
+    t0 = time.perf_counter()
+    if graph is None:
+        graph = KNNGraph.build(X, k=knn_k, eval_size=eval_size, seed=seed, verbose=False)
+    elif graph.k < knn_k:
+        raise ValueError(f"El grafo tiene k={graph.k}; min_samples={knn_k + 1} necesita k >= {knn_k}")
+    if len(graph) != len(X):
+        raise ValueError(f"El grafo tiene {len(graph):,} puntos y X {len(X):,}")
+    # DBSCAN guarda todas las vecindades: el grafo de radio exacto solo cubre los eps
+    # que caben; el resto usa el kNN (exacto si ningún punto tiene los k vecinos dentro de eps)
+    approx = [eps for eps in dbscan_eps if graph.saturated(eps) > 0]
+    nnz = estimate_radius_nnz(X, approx, seed=seed)
+    radius_eps = [eps for eps in approx if nnz[eps] <= max_graph_nnz]
+    too_dense = [eps for eps in approx if nnz[eps] > max_graph_nnz]
+    if too_dense:
+        print(f"⚠️ DBSCAN aproximado con el kNN (k={graph.k}) para eps={too_dense}: grafo de radio de "
+              f"~{max(nnz[eps] for eps in too_dense):,} aristas (límite {max_graph_nnz:,})")
+    order = {config_name(a, p): i for i, (a, p) in enumerate(tasks)}
+    # K-Means (lo más lento) primero, para balancear el pool
+    tasks.sort(key=lambda t: t[0] != "kmeans")
+
+    shared_dir = tempfile.mkdtemp(prefix="sweep_shm_", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    rows, labels = [], {}
+
+    def collect(row, lab):
+        rows.append(row)
+        labels[row["config"]] = lab
+        if verbose:
+            print(f"✓ {row['config']}: {row['n_clusters']} clusters, silhouette {row['silhouette']:.3f} "
+                  f"({row['fit_s']:.2f}s + {row['eval_s']:.2f}s)")
+
+    try:
+        dump_shared(X, shared_dir, graph, max(radius_eps) if radius_eps else None)
+        if verbose:
+            print(f"📊 {graph!r} y grafo de radio: {time.perf_counter() - t0:.1f}s")
+        if n_jobs == 1:
+            _open_shared(shared_dir)
+            for algorithm, params in tasks:
+                collect(*_run_one(algorithm, params))
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_open_shared,
+                                     initargs=(shared_dir,)) as pool:
+                futures = [pool.submit(_run_one, algorithm, params) for algorithm, params in tasks]
+                for f in as_completed(futures):
+                    collect(*f.result())
+    finally:
+        _SHARED.clear()
+        shutil.rmtree(shared_dir, ignore_errors=True)
+
+    table = pd.DataFrame(rows).sort_values("config", key=lambda s: s.map(order)).set_index("config")
+    params = [c for c in ("k", "eps", "min_samples", "min_cluster_size") if c in table]
+    table = table[["algorithm"] + params + [c for c in table if c not in params and c != "algorithm"]]
+    return table.astype({c: "Int64" for c in params if c != "eps"}), labels
+
+
+# ------------------------------------------------------------
+# 5) Benchmark vs. el notebook
+# ------------------------------------------------------------
+def benchmark(X, k_range=range(2, 16), eval_size=10_000, **kwargs):
+    """Bucle serie del notebook (KMeans + silhouette_score por k) vs. run_sweep."""
+    from sklearn.metrics import silhouette_score
+
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    t0 = time.perf_counter()
+    for k in k_range:
+        km = KMeans(n_clusters=k, random_state=42, n_init=10).fit(X)
+        silhouette_score(X, km.labels_, sample_size=min(eval_size, len(X)), random_state=0)
+    t_serial = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    table, _ = run_sweep(X, k_range=k_range, eval_size=eval_size, verbose=False, **kwargs)
+    t_sweep = time.perf_counter() - t0
+    print(f"📊 {len(table)} configuraciones K-Means sobre {len(X):,} puntos")
+    print(f"   notebook (serie, silhouette_score por k): {t_serial:.1f}s")
+    print(f"   run_sweep: {t_sweep:.1f}s (silhouette total {table['eval_s'].sum():.1f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Barrido paralelo de K-Means / DBSCAN / HDBSCAN")
+    parser.add_argument("input", nargs="?", default="data/processed_for_modeling/playlist_umap_embedding.parquet")
+    parser.add_argument("--k", type=int, nargs=2, default=(2, 15), metavar=("MIN", "MAX"))
+    parser.add_argument("--eps", type=float, nargs="*", default=[0.5, 1.0, 2.5])
+    parser.add_argument("--min-samples", type=int, nargs="*", default=[10, 20])
+    parser.add_argument("--min-cluster-size", type=int, nargs="*", default=[10, 20, 50])
+    parser.add_argument("--eval-size", type=int, default=10_000)
+    parser.add_argument("--graph", default=None, help="Directorio de un KNNGraph ya guardado de los mismos puntos")
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--output", default="data/processed_for_modeling/cluster_sweep.csv")
+    parser.add_argument("--benchmark", action="store_true", help="Comparar con el bucle serie del notebook")
+    args = parser.parse_args()
+
+    X = pd.read_parquet(args.input).select_dtypes(include=np.number).to_numpy()
+    k_range = range(args.k[0], args.k[1] + 1)
+    if args.benchmark:
+        benchmark(X, k_range, args.eval_size, n_jobs=args.jobs)
+    else:
+        table, _ = run_sweep(X, k_range, args.eps, args.min_samples, args.min_cluster_size,
+                             hdbscan_min_samples=args.min_samples, eval_size=args.eval_size, n_jobs=args.jobs,
+                             graph=KNNGraph.load(args.graph) if args.graph else None)
+        table.to_csv(args.output)
+        print(table.round(4).to_string())
+        print(f"✅ {len(table)} configuraciones → '{args.output}'")
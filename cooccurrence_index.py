@@ -0,0 +1,239 @@
+"""
+cooccurrence_index.py
+
+Índice persistente de co-ocurrencias pista → pista para responder "qué
+suena junto a esta canción" / "siguiente pista" sin volver a minar reglas.
+
+  - Conteos exactos: n playlists, conteo por ítem y matriz dispersa
+    simétrica de co-ocurrencias C = XᵀX (sin diagonal).
+  - Para cada ítem, sus top-k vecinos por lift (o confidence / support) con
+    support, confidence y lift de la regla A → B ya calculados, en tablas
+    de ancho fijo (ítems × k): una consulta es un lookup en un dict y un
+    slice de numpy.
+  - Actualización incremental: al agregar playlists se suman sus
+    co-ocurrencias a C y se recalculan solo los top-k de los ítems que
+    aparecen en ellas (refresh() recalcula todo, p.ej. tras muchas altas,
+    porque n cambia el lift de todas las filas).
+  - Persistencia en .npz (sin pickle).
+
+Uso:
+    idx = CooccurrenceIndex.build(TransactionMatrix.load(".../transactions_matrix.npz"), k=20)
+    idx.neighbors("4uLU6hMCjMI75M1A2tKUQC")           # (ítems, support, confidence, lift)
+    idx.recommend(["id1", "id2"], n=10)               # siguiente pista para una semilla
+    idx.add([["id1", "id9"], ["id3", "id4", "id5"]])  # nuevas playlists
+    idx.save("data/processed_for_modeling/cooccurrence_index.npz")
+"""
+
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from transaction_matrix import TransactionMatrix
+
+METRICS = ("support", "confidence", "lift")
+
+
+class CooccurrenceIndex:
+    """Top-k vecinos por ítem con métricas de regla A → B precalculadas."""
+
+    def __init__(self, items, item_counts, cooc, n_transactions, k=20, metric="lift", min_count=2):
+        if metric not in METRICS:
+            raise ValueError(f"metric debe ser uno de {METRICS}, no {metric!r}")
+        self.items = np.asarray(items)
+        if self.items.dtype.kind == "U":      # ancho fijo truncaría ítems nuevos más largos
+            self.items = self.items.astype(object)
+        self.position = {item: i for i, item in enumerate(self.items.tolist())}
+        self.item_counts = np.asarray(item_counts, dtype=np.int64)
+        self.cooc = cooc.tocsr()
+        self.n = int(n_transactions)
+        self.k = k
+        self.metric = metric
+        self.min_count = min_count
+        # Tablas top-k (ítems × k); -1 = hueco
+        self.neighbor = np.full((len(self.items), k), -1, dtype=np.int32)
+        self.count = np.zeros((len(self.items), k), dtype=np.int32)
+        self.values = {m: np.zeros((len(self.items), k), dtype=np.float32) for m in METRICS}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return (f"CooccurrenceIndex({len(self)} ítems, {self.n} playlists, "
+                f"{self.cooc.nnz // 2} pares, top-{self.k} por {self.metric})")
+
+    # --------------------------------------------------------
+    # Construcción
+    # --------------------------------------------------------
+    @staticmethod
+    def _cooccurrences(matrix):
+        x = matrix.astype(np.int32)
+        c = (x.T @ x).tocsr()
+        c.setdiag(0)
+        c.eliminate_zeros()
+        return c
+
+    @classmethod
+    def build(cls, tm, k=20, metric="lift", min_count=2):
+        """Índice a partir de una TransactionMatrix (columnas = ítems)."""
+        idx = cls(tm.items, tm.item_counts(), cls._cooccurrences(tm.matrix), tm.shape[0],
+                  k=k, metric=metric, min_count=min_count)
+        idx._update_rows(np.arange(len(idx)))
+        return idx
+
+    def _update_rows(self, rows):
+        """Recalcula los top-k de esas filas, vectorizado sobre todos sus pares."""
+        rows = np.asarray(rows, dtype=np.int64)
+        sub = self.cooc[rows]
+        row_of = np.repeat(np.arange(len(rows)), np.diff(sub.indptr))
+        a, b, c_ab = rows[row_of], sub.indices.astype(np.int64), sub.data.astype(np.float64)
+        keep = c_ab >= self.min_count
+        row_of, a, b, c_ab = row_of[keep], a[keep], b[keep], c_ab[keep]
+
+        n = float(self.n)
+        c_a, c_b = self.item_counts[a], self.item_counts[b]
+        values = {"support": c_ab / n, "confidence": c_ab / c_a, "lift": c_ab * n / (c_a * c_b)}
+
+        # Orden por fila y, dentro de cada fila, por métrica (desempate: co-ocurrencias)
+        order = np.lexsort((-c_ab, -values[self.metric], row_of))
+        row_sorted = row_of[order]
+        starts = np.searchsorted(row_sorted, np.arange(len(rows)))
+        rank = np.arange(len(order)) - starts[row_sorted]
+        top = order[rank < self.k]
+        r, col = row_of[top], rank[rank < self.k]
+
+        self.neighbor[rows] = -1
+        self.count[rows] = 0
+        for m in METRICS:
+            self.values[m][rows] = 0
+        self.neighbor[rows[r], col] = b[top]
+        self.count[rows[r], col] = c_ab[top]
+        for m in METRICS:
+            self.values[m][rows[r], col] = values[m][top]
+
+    def refresh(self):
+        """Recalcula todos los top-k (las métricas dependen de n)."""
+        self._update_rows(np.arange(len(self)))
+
+    # --------------------------------------------------------
+    # Actualización incremental
+    # --------------------------------------------------------
+    def _grow(self, new_items):
+        start = len(self.items)
+        self.items = np.concatenate([self.items, np.asarray(new_items, dtype=self.items.dtype)])
+        for i, item in enumerate(new_items, start=start):
+            self.position[item] = i
+        extra = len(new_items)
+        self.item_counts = np.concatenate([self.item_counts, np.zeros(extra, dtype=np.int64)])
+        self.cooc = sp.csr_matrix((self.cooc.data, self.cooc.indices,
+                                   np.r_[self.cooc.indptr, np.full(extra, self.cooc.indptr[-1])]),
+                                  shape=(len(self.items), len(self.items)))
+        self.neighbor = np.vstack([self.neighbor, np.full((extra, self.k), -1, dtype=np.int32)])
+        self.count = np.vstack([self.count, np.zeros((extra, self.k), dtype=np.int32)])
+        for m in METRICS:
+            self.values[m] = np.vstack([self.values[m], np.zeros((extra, self.k), dtype=np.float32)])
+
+    def add(self, playlists):
+        """Suma nuevas playlists (listas de ítems); recalcula los top-k de los ítems tocados."""
+        playlists = [list(dict.fromkeys(p)) for p in playlists]
+        new_items = list(dict.fromkeys(it for p in playlists for it in p if it not in self.position))
+        if new_items:
+            self._grow(new_items)
+        rows = np.repeat(np.arange(len(playlists)), [len(p) for p in playlists])
+        cols = np.fromiter((self.position[it] for p in playlists for it in p), dtype=np.int64, count=len(rows))
+        x = sp.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                          shape=(len(playlists), len(self.items)))
+        self.n += len(playlists)
+        self.item_counts += np.asarray(x.sum(axis=0)).ravel()
+        self.cooc = (self.cooc + self._cooccurrences(x)).tocsr()
+        touched = np.unique(cols)
+        self._update_rows(touched)
+        return len(touched)
+
+    # --------------------------------------------------------
+    # Consultas
+    # --------------------------------------------------------
+    def neighbors(self, item, k=None):
+        """(ítems, support, confidence, lift) de los top-k vecinos de `item` (vacío si no existe)."""
+        i = self.position.get(item)
+        if i is None:
+            empty = np.empty(0, dtype=np.float32)
+            return self.items[:0], empty, empty, empty
+        nb = self.neighbor[i, :k]
+        valid = nb >= 0
+        return (self.items[nb[valid]], self.values["support"][i, :k][valid],
+                self.values["confidence"][i, :k][valid], self.values["lift"][i, :k][valid])
+
+    def neighbors_frame(self, item, k=None, meta=None):
+        """Vecinos como DataFrame; `meta` (índice = ítem) añade nombre, artista, etc."""
+        items, support, confidence, lift = self.neighbors(item, k)
+        df = pd.DataFrame({"item": items, "support": support, "confidence": confidence, "lift": lift})
+        if meta is not None:
+            df = df.join(meta, on="item")
+        return df
+
+    def recommend(self, seeds, n=10, score="lift"):
+        """Siguientes pistas para una semilla: suma de `score` de los vecinos de cada semilla."""
+        rows = [self.position[s] for s in seeds if s in self.position]
+        if not rows:
+            return pd.Series(dtype=float)
+        nb = self.neighbor[rows].ravel()
+        val = self.values[score][rows].ravel().astype(np.float64)
+        valid = nb >= 0
+        totals = np.bincount(nb[valid], weights=val[valid], minlength=len(self.items))
+        totals[rows] = 0                      # no recomendar las propias semillas
+        best = np.argsort(-totals)[:n]
+        best = best[totals[best] > 0]
+        return pd.Series(totals[best], index=self.items[best], name=score)
+
+    # --------------------------------------------------------
+    # Persistencia
+    # --------------------------------------------------------
+    def save(self, path):
+        path = str(path)
+        tmp_path = path + ".tmp.npz"
+        c = self.cooc
+        items = self.items.astype(str) if self.items.dtype == object else self.items
+        np.savez(tmp_path, items=items, item_counts=self.item_counts,
+                 cooc_indptr=c.indptr, cooc_indices=c.indices, cooc_data=c.data,
+                 params=np.array([self.n, self.k, self.min_count], dtype=np.int64),
+                 metric=np.array(self.metric), neighbor=self.neighbor, count=self.count,
+                 **{f"value_{m}": v for m, v in self.values.items()})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            n_items = len(z["items"])
+            cooc = sp.csr_matrix((z["cooc_data"], z["cooc_indices"], z["cooc_indptr"]),
+                                 shape=(n_items, n_items))
+            n, k, min_count = (int(v) for v in z["params"])
+            idx = cls(z["items"], z["item_counts"], cooc, n, k=k, metric=str(z["metric"]), min_count=min_count)
+            idx.neighbor, idx.count = z["neighbor"], z["count"]
+            idx.values = {m: z[f"value_{m}"] for m in METRICS}
+        return idx
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice de co-ocurrencias top-k por pista")
+    parser.add_argument("matrix", nargs="?", default="data/processed_for_modeling/transactions_matrix.npz")
+    parser.add_argument("--output", default="data/processed_for_modeling/cooccurrence_index.npz")
+    parser.add_argument("-k", type=int, default=20)
+    parser.add_argument("--metric", default="lift", choices=METRICS)
+    parser.add_argument("--min-count", type=int, default=2, help="Co-ocurrencias mínimas de un par")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    idx = CooccurrenceIndex.build(TransactionMatrix.load(args.matrix), k=args.k,
+                                  metric=args.metric, min_count=args.min_count)
+    idx.save(args.output)
+    print(f"✅ {idx!r} → '{args.output}' ({time.perf_counter() - t0:.1f}s)")
+
+    probe = idx.items[np.argmax(idx.item_counts)]
+    t0 = time.perf_counter()
+    for _ in range(10000):
+        idx.neighbors(probe)
+    print(f"   consulta neighbors(): {(time.perf_counter() - t0) / 10000 * 1e6:.1f} µs")
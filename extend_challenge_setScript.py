@@ -1,34 +1,165 @@
+import os
+import sys
 import json
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "DataRecolectionScripts"))
+from challenge_stream import iter_document, iter_playlists, iter_items, track_id, dump_document
+from checkpoint_store import CheckpointStore
+
+# Playlists por lote de búsqueda en el índice / row group de Parquet
+BATCH_PLAYLISTS = 250
+
+# Columnas de la salida Parquet: una fila por (playlist, pista); las features
+# acústicas van como JSON porque `highlevel` no tiene un esquema fijo
+TRACK_COLUMNS = ["pos", "track_uri", "track_name", "artist_uri", "artist_name",
+                 "album_uri", "album_name", "duration_ms"]
 
 def load_json(path):
     with open(path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def enrich_challenge_with_acoustic(challenge_path, acoustic_path, output_path):
-    # 1. Carga de los JSON
-    challenge = load_json(challenge_path)
-    acoustic = load_json(acoustic_path)
+def build_acoustic_index(acoustic_path, index_path, batch_size=5000):
+    """
+    Índice en disco {track_id: features} (CheckpointStore/SQLite) construido
+    en streaming desde el JSON acústico. Se reconstruye solo si el JSON es
+    más reciente que el índice.
+    """
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(acoustic_path):
+        return CheckpointStore(index_path)
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    index = CheckpointStore(tmp_path)
+    batch = {}
+    for tid, features in iter_items(acoustic_path):
+        batch[tid] = features
+        if len(batch) >= batch_size:
+            index.put_many(batch)
+            batch = {}
+    index.put_many(batch)
+    index.close()
+    os.replace(tmp_path, index_path)
+    return CheckpointStore(index_path)
 
-    # 2. Recorre cada playlist y cada pista
-    for playlist in challenge.get('playlists', []):
-        for track in playlist.get('tracks', []):
-            # Extrae el código que coincide con la clave de acoustic
-            # Si el campo track_uri viene como 'spotify:track:XYZ', toma solo 'XYZ'.
-            uri = track.get('track_uri', '')
-            track_id = uri.split(':')[-1] if ':' in uri else uri
+def iter_playlist_batches(challenge_path, size=BATCH_PLAYLISTS):
+    batch = []
+    for playlist in iter_playlists(challenge_path):
+        batch.append(playlist)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-            # Busca en acoustic; si no existe, deja None o maneja como prefieras
-            features = acoustic.get(track_id)
-            track['acoustic_features'] = features  # puede ser un dict o None
+def iter_enriched_batches(challenge_path, index, size=BATCH_PLAYLISTS):
+    """Lotes de playlists con 'acoustic_features' en cada pista (None si no hay)."""
+    for batch in iter_playlist_batches(challenge_path, size):
+        features = index.get_many(track_id(t) for pl in batch for t in pl.get('tracks', []))
+        for playlist in batch:
+            for track in playlist.get('tracks', []):
+                track['acoustic_features'] = features.get(track_id(track))
+        yield batch
 
-    # 3. Escribe el JSON enriquecido a disco
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(challenge, f, ensure_ascii=False, indent=2)
+def write_jsonl(batches, output_path):
+    """Una playlist enriquecida por línea; escritura atómica (tmp + os.replace)."""
+    tmp_path = output_path + ".tmp"
+    n = 0
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for batch in batches:
+            for playlist in batch:
+                f.write(json.dumps(playlist, ensure_ascii=False))
+                f.write("\n")
+                n += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, output_path)
+    return n
 
-if __name__ == '__main__':
-    enrich_challenge_with_acoustic(
-        'challenge_set.json',
-        'acousticbrainz_data_updated_clean.json',
-        'challenge_set_enriched.json'
+def write_parquet(batches, output_path):
+    """Una fila por (playlist, pista); un row group por lote de playlists."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [("pid", pa.int32()), ("playlist_name", pa.string())]
+        + [(c, pa.int16() if c == "pos" else pa.int64() if c == "duration_ms" else pa.string())
+           for c in TRACK_COLUMNS]
+        + [("acoustic_features", pa.string())]
     )
-    print("¡Listo! Se ha generado challenge_set_enriched.json con los datos acústicos.")
+    tmp_path = output_path + ".tmp"
+    n = 0
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+        for batch in batches:
+            cols = {name: [] for name in schema.names}
+            for playlist in batch:
+                for track in playlist.get('tracks', []):
+                    cols["pid"].append(playlist["pid"])
+                    cols["playlist_name"].append(playlist.get("name"))
+                    for c in TRACK_COLUMNS:
+                        cols[c].append(track.get(c))
+                    feats = track.get('acoustic_features')
+                    cols["acoustic_features"].append(
+                        None if feats is None else json.dumps(feats, ensure_ascii=False))
+            writer.write_table(pa.table(cols, schema=schema))
+            n += len(batch)
+    os.replace(tmp_path, output_path)
+    return n
+
+def enrich_challenge_with_acoustic(challenge_path, acoustic_path, output_path, index_path=None,
+                                   batch_playlists=BATCH_PLAYLISTS):
+    """
+    Une cada pista del challenge set con sus features acústicas.
+
+    Sin index_path: el JSON acústico se carga completo en memoria y la salida
+    es un JSON con la misma forma del challenge set (comportamiento original).
+    Con index_path: join en streaming contra un índice en disco; la memoria
+    queda acotada por un lote de playlists. La salida es JSONL (una playlist
+    por línea) o Parquet según la extensión de output_path.
+    """
+    if index_path is None:
+        # 1. Carga del JSON acústico (el challenge set se lee en streaming)
+        acoustic = load_json(acoustic_path)
+
+        # 2. Recorre cada playlist y cada pista, de una playlist a la vez
+        def enriched_events():
+            for kind, key, value in iter_document(challenge_path):
+                if kind == 'item':
+                    for track in value.get('tracks', []):
+                        # Extrae el código que coincide con la clave de acoustic
+                        # Si el campo track_uri viene como 'spotify:track:XYZ', toma solo 'XYZ'.
+                        # Busca en acoustic; si no existe, deja None o maneja como prefieras
+                        track['acoustic_features'] = acoustic.get(track_id(track))  # puede ser un dict o None
+                yield kind, key, value
+
+        # 3. Escribe el JSON enriquecido a disco a medida que se recorre
+        return dump_document(enriched_events(), output_path)
+
+    index = build_acoustic_index(acoustic_path, index_path)
+    batches = iter_enriched_batches(challenge_path, index, batch_playlists)
+    if output_path.endswith('.parquet'):
+        n = write_parquet(batches, output_path)
+    elif output_path.endswith('.jsonl'):
+        n = write_jsonl(batches, output_path)
+    else:
+        raise ValueError(f"Formato de salida no soportado en modo streaming: {output_path} (.jsonl o .parquet)")
+    index.close()
+    return n
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Añade las features acústicas a cada pista del challenge set")
+    parser.add_argument('--challenge', default='challenge_set.json')
+    parser.add_argument('--acoustic', default='acousticbrainz_data_updated_clean.json')
+    parser.add_argument('--output', default='challenge_set_enriched.json',
+                        help="'.json' (en memoria), '.jsonl' o '.parquet' (streaming con índice)")
+    parser.add_argument('--index', default='acoustic_index.sqlite',
+                        help="Índice en disco para el modo streaming")
+    parser.add_argument('--batch-playlists', type=int, default=BATCH_PLAYLISTS,
+                        help="Playlists por lote (acota la memoria del modo streaming)")
+    args = parser.parse_args()
+
+    streaming = not args.output.endswith('.json')
+    n = enrich_challenge_with_acoustic(args.challenge, args.acoustic, args.output,
+                                       index_path=args.index if streaming else None,
+                                       batch_playlists=args.batch_playlists)
+    print(f"¡Listo! Se ha generado {args.output} con los datos acústicos ({n} playlists).")
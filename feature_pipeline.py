@@ -0,0 +1,297 @@
+"""
+feature_pipeline.py
+
+Pipeline de features ajustado una sola vez y guardado como un único objeto
+(feature_pipeline.joblib), en vez de re-ajustar en cada ejecución las
+celdas de preprocessing.ipynb (columnas eliminadas, winsorize, escalado,
+discretización, PCA) y otro StandardScaler más en prediction.ipynb:
+
+  - columnas eliminadas y relleno de `name` ("sin nombre")
+  - límites de winsorize 1%/99% y StandardScaler
+  - imputación: numéricas faltantes → media de entrenamiento (0 tras escalar)
+  - bordes del KBinsDiscretizer (energy, danceability_ll, bpm)
+  - IncrementalPCA de pistas y de playlists
+
+El ajuste reusa StreamingPreprocessor (por lotes, sirve para el MPD
+completo). Cada etapa intermedia se guarda en cache_dir con una clave que
+es el hash del contenido del Parquet de entrada, de los parámetros de la
+etapa y de la clave de la etapa anterior: al volver a correr, las etapas sin
+cambios se cargan en vez de recalcularse.
+
+    stats  ← hash(entrada, limits, drop_columns, sketch_k, discretizador)
+    pca    ← hash(stats, n_components, pca_keys)
+    salida ← hash(pca, entrada)               (transform_file)
+
+Para inferencia, feature_matrix() transforma un lote de filas nuevas en una
+sola llamada vectorizada (float32, listo para el modelo).
+
+Uso:
+    pipeline = FeaturePipeline().fit("data/processed/playlist_tracks_complete.parquet",
+                                     cache_dir="data/processed_for_modeling/pipeline_cache")
+    pipeline.save("feature_pipeline.joblib")
+
+    pipeline = FeaturePipeline.load("feature_pipeline.joblib")
+    X = pipeline.feature_matrix(df_new_tracks)           # filas crudas → (n, n_features) float32
+    X = pipeline.feature_matrix(df_tracks, transformed=True)   # df_processed_full ya escalado
+
+    python feature_pipeline.py data/processed/playlist_tracks_complete.parquet --benchmark
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from streaming_preprocessing import StreamingPreprocessor, DROP_COLUMNS, DISCRETIZE_COLUMNS
+
+PIPELINE_VERSION = 1
+OUTPUT_NAMES = {"track_id": "df_pca_components.parquet", "pid": "playlist_pca_components.parquet"}
+
+
+# ------------------------------------------------------------
+# Hashes de contenido y caché de etapas
+# ------------------------------------------------------------
+def file_digest(path, memo_path=None, chunk_size=1 << 23):
+    """
+    blake2b del contenido del archivo. Con memo_path, el hash se recuerda por
+    (ruta, tamaño, mtime) para no volver a leer un Parquet de varios GB.
+    """
+    st = os.stat(path)
+    memo_key = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    memo = {}
+    if memo_path and os.path.exists(memo_path):
+        with open(memo_path) as f:
+            memo = json.load(f)
+        if memo_key in memo:
+            return memo[memo_key]
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    if memo_path:
+        memo[memo_key] = digest
+        with open(memo_path, "w") as f:
+            json.dump(memo, f, indent=1)
+    return digest
+
+
+def stage_key(*parts):
+    """Clave de etapa: hash de sus entradas (hashes previos y parámetros)."""
+    payload = json.dumps(parts, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+class StageCache:
+    """Artefactos intermedios en disco, uno por (etapa, clave)."""
+
+    def __init__(self, directory, verbose=True):
+        self.directory = str(directory)
+        self.verbose = verbose
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, stage, key, suffix=".joblib"):
+        return os.path.join(self.directory, f"{stage}-{key}{suffix}")
+
+    def digest(self, path):
+        return file_digest(path, os.path.join(self.directory, "digests.json"))
+
+    def get_or_compute(self, stage, key, compute):
+        path = self.path(stage, key)
+        if os.path.exists(path):
+            if self.verbose:
+                print(f"   ♻️ {stage}: sin cambios ({os.path.basename(path)})")
+            return joblib.load(path)
+        value = compute()
+        tmp = path + ".tmp"
+        joblib.dump(value, tmp)
+        os.replace(tmp, path)
+        return value
+
+
+class _NoCache:
+    """Sin cache_dir: cada etapa se calcula siempre."""
+
+    def digest(self, path):
+        return file_digest(path)
+
+    def get_or_compute(self, stage, key, compute):
+        return compute()
+
+
+# ------------------------------------------------------------
+# Pipeline
+# ------------------------------------------------------------
+class FeaturePipeline:
+    """Todas las etapas de preprocesamiento ajustadas una vez; transform por lotes."""
+
+    def __init__(self, limits=(0.01, 0.01), n_components=10, pca_keys=("track_id", "pid"),
+                 drop_columns=DROP_COLUMNS, discretize_columns=DISCRETIZE_COLUMNS, n_bins=3,
+                 sketch_k=2048, batch_size=200_000, fill_name="sin nombre", verbose=True):
+        self.limits = tuple(limits)
+        self.n_components = n_components
+        self.pca_keys = tuple(pca_keys)
+        self.drop_columns = list(drop_columns)
+        self.discretize_columns = list(discretize_columns)
+        self.n_bins = n_bins
+        self.sketch_k = sketch_k
+        self.batch_size = batch_size
+        self.fill_name = fill_name
+        self.verbose = verbose
+
+    def __repr__(self):
+        if not hasattr(self, "pre_"):
+            return "FeaturePipeline(sin ajustar)"
+        return (f"FeaturePipeline({len(self.columns)} features, PCA {list(self.pre_.pca_)}, "
+                f"stats={self.stage_keys_['stats'][:8]})")
+
+    def _preprocessor(self):
+        return StreamingPreprocessor(limits=self.limits, n_components=self.n_components, pca_keys=self.pca_keys,
+                                     batch_size=self.batch_size, sketch_k=self.sketch_k,
+                                     drop_columns=self.drop_columns, discretize_columns=self.discretize_columns,
+                                     n_bins=self.n_bins, verbose=self.verbose)
+
+    @staticmethod
+    def _cache(cache_dir, verbose=True):
+        return StageCache(cache_dir, verbose) if cache_dir else _NoCache()
+
+    @property
+    def columns(self):
+        return self.pre_.columns_
+
+    # --------------------------------------------------------
+    # Ajuste por etapas
+    # --------------------------------------------------------
+    def fit(self, path, cache_dir=None):
+        cache = self._cache(cache_dir, self.verbose)
+        pre = self._preprocessor()
+        input_key = cache.digest(path)
+        stats_key = stage_key("stats", PIPELINE_VERSION, input_key, self.limits, self.drop_columns,
+                              self.sketch_k, self.discretize_columns, self.n_bins)
+        pre.set_stats(cache.get_or_compute("stats", stats_key, lambda: pre.fit_stats(path).get_stats()))
+        pca_key = stage_key("pca", stats_key, self.n_components, self.pca_keys)
+        pre.pca_ = cache.get_or_compute("pca", pca_key, lambda: pre.fit_pca(path).pca_)
+        self.pre_ = pre
+        self.input_key_ = input_key
+        self.stage_keys_ = {"stats": stats_key, "pca": pca_key}
+        return self
+
+    # --------------------------------------------------------
+    # Transformación
+    # --------------------------------------------------------
+    def feature_matrix(self, df, transformed=False):
+        """
+        Matriz (n, n_features) float32 con winsorize + escalado + imputación,
+        en una sola pasada numpy. Las columnas que falten se imputan. Con
+        transformed=True, df ya viene escalado (df_processed_full).
+        """
+        x = df.reindex(columns=self.columns).to_numpy(dtype=np.float64, na_value=np.nan)
+        if not transformed:
+            x = self.pre_.scale(self.pre_.clip(x))
+        x = np.nan_to_num(x, nan=0.0)          # media de entrenamiento tras escalar
+        return x.astype(np.float32)
+
+    def transform(self, df, discretize=True):
+        """Filas crudas → filas como df_processed (columnas, nombre, escalado, *_cat)."""
+        df = df.assign(**{c: np.nan for c in self.columns if c not in df})
+        if "name" in df:
+            df["name"] = df["name"].fillna(self.fill_name)
+        # Imputar con la media de entrenamiento (0 tras escalar) antes de discretizar
+        df[self.columns] = df[self.columns].fillna(dict(zip(self.columns, self.pre_.mean_)))
+        return self.pre_.transform_frame(df, discretize)
+
+    def components(self, df, key="pid", transformed=False):
+        """Componentes PCA de la primera fila de cada `key` (pistas o playlists) del lote."""
+        first = ~df[key].duplicated().to_numpy()
+        comp = self.pre_.pca_[key].transform(self.feature_matrix(df.loc[first], transformed))
+        return pd.DataFrame(comp, index=pd.Index(df.loc[first, key], name=key),
+                            columns=[f"PC_{i + 1}" for i in range(comp.shape[1])])
+
+    def transform_file(self, path, output_dir, cache_dir=None):
+        """
+        df_processed_full.parquet + componentes PCA en output_dir. Si output_dir
+        ya tiene la salida de este pipeline sobre este mismo archivo, no se
+        vuelve a escribir.
+        """
+        cache = self._cache(cache_dir, self.verbose)
+        key = stage_key("output", self.stage_keys_["pca"], cache.digest(path))
+        marker = os.path.join(output_dir, ".feature_pipeline.json")
+        expected = ["df_processed_full.parquet"] + [OUTPUT_NAMES.get(k, f"{k}_pca_components.parquet")
+                                                    for k in self.pre_.pca_]
+        if os.path.exists(marker) and all(os.path.exists(os.path.join(output_dir, f)) for f in expected):
+            with open(marker) as f:
+                if json.load(f).get("key") == key:
+                    if self.verbose:
+                        print(f"   ♻️ salida: sin cambios ('{output_dir}')")
+                    return os.path.join(output_dir, "df_processed_full.parquet")
+        out_path = self.pre_.transform_file(path, output_dir)
+        with open(marker, "w") as f:
+            json.dump({"key": key, "stages": self.stage_keys_, "input": path}, f, indent=1)
+        return out_path
+
+    # --------------------------------------------------------
+    # Persistencia
+    # --------------------------------------------------------
+    def to_scaler(self):
+        """StandardScaler equivalente (compatibilidad con scaler_audio_features.joblib)."""
+        return self.pre_.to_scaler()
+
+    def save(self, path):
+        joblib.dump(self, path)
+        return path
+
+    @staticmethod
+    def load(path):
+        pipeline = joblib.load(path)
+        if not isinstance(pipeline, FeaturePipeline):
+            raise TypeError(f"{path} no contiene un FeaturePipeline")
+        return pipeline
+
+
+def benchmark(pipeline, path, batch_sizes=(1, 100, 10_000), repeats=20):
+    """Latencia de feature_matrix() sobre filas crudas vs re-ajustar un StandardScaler."""
+    from sklearn.preprocessing import StandardScaler
+
+    df = pd.read_parquet(path).head(max(batch_sizes))
+    print(f"📊 {pipeline!r}")
+    print(f"{'filas':>7} {'feature_matrix ms':>18} {'µs/fila':>9}")
+    for n in batch_sizes:
+        batch = df.head(n)
+        pipeline.feature_matrix(batch)
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            pipeline.feature_matrix(batch)
+        ms = (time.perf_counter() - t0) / repeats * 1000
+        print(f"{n:>7} {ms:>18.3f} {ms * 1000 / n:>9.2f}")
+    t0 = time.perf_counter()
+    StandardScaler().fit_transform(df[pipeline.columns].fillna(0).to_numpy())
+    print(f"   re-ajustar StandardScaler ({len(df)} filas): {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    # La clase del módulo (no la de __main__), para que el .joblib se abra desde otros módulos
+    from feature_pipeline import FeaturePipeline
+
+    parser = argparse.ArgumentParser(description="Ajuste único del pipeline de features con caché por etapas")
+    parser.add_argument("input", nargs="?", default="data/processed/playlist_tracks_complete.parquet")
+    parser.add_argument("--output", default="feature_pipeline.joblib")
+    parser.add_argument("--cache-dir", default="data/processed_for_modeling/pipeline_cache")
+    parser.add_argument("--transform-dir", default=None,
+                        help="Escribir df_processed_full + componentes PCA en este directorio")
+    parser.add_argument("--batch-size", type=int, default=200_000)
+    parser.add_argument("--benchmark", action="store_true", help="Latencia de transformación por lote")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    pipeline = FeaturePipeline(batch_size=args.batch_size).fit(args.input, cache_dir=args.cache_dir)
+    pipeline.save(args.output)
+    print(f"✅ {pipeline!r} → '{args.output}' ({time.perf_counter() - t0:.1f}s)")
+    if args.transform_dir:
+        pipeline.transform_file(args.input, args.transform_dir, cache_dir=args.cache_dir)
+    if args.benchmark:
+        benchmark(pipeline, args.input)
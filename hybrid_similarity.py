@@ -0,0 +1,263 @@
+"""
+hybrid_similarity.py
+
+Similitud playlist → playlist con un score híbrido ponderado sobre tres
+tipos de señal, en vez de consultar por separado cada índice:
+
+  - audio: coseno entre vectores de features de la playlist (agregados de
+    df_playlist / componentes PCA), índice de vector_index.py.
+  - co-ocurrencia: Jaccard de las pistas compartidas (transactions_matrix),
+    candidatos con MinHash LSH (minhash_lsh.py).
+  - metadatos: Jaccard de artistas y de álbumes de cada playlist.
+
+Cada señal aporta su lista de candidatos (top-n de su índice); la unión se
+re-puntúa por lotes con numpy/scipy (un producto fila a fila por señal,
+nada de bucles por par) y se ordena por Σ peso · score. Cada etapa de cada
+señal (candidatos y re-ranking) se cronometra para ajustar pesos y
+presupuesto de latencia (latency_report()).
+
+Uso:
+    engine = HybridSimilarity({
+        "audio": VectorSignal(open_index("data/processed_for_modeling/playlist_index")),
+        "tracks": SetSignal(tm_transactions, MinHashLSH.load(".../minhash_lsh.npz")),
+        "artists": SetSignal(TransactionMatrix.from_frame(df_processed_full, "pid", "artist_name")),
+    }, weights={"audio": 0.5, "tracks": 0.3, "artists": 0.2})
+    engine.similar([pid], k=10)          # pid, similar_pid, score + un score por señal
+    engine.latency_report()
+
+    python hybrid_similarity.py --benchmark
+"""
+
+import time
+import argparse
+from collections import deque, defaultdict
+
+import numpy as np
+import pandas as pd
+
+from transaction_matrix import TransactionMatrix
+from minhash_lsh import MinHashLSH
+from vector_index import load_vectors, HNSWIndex
+
+
+def _positions(index, labels):
+    """Posición de cada etiqueta en un pd.Index (-1 si no está)."""
+    return index.get_indexer(np.asarray(labels))
+
+
+# ------------------------------------------------------------
+# Señales
+# ------------------------------------------------------------
+class VectorSignal:
+    """Similitud entre vectores de features (índice de vector_index.py)."""
+
+    def __init__(self, index):
+        self.index = index
+        self._labels = pd.Index(index.ids)
+
+    def candidates(self, pids, n):
+        known = _positions(self._labels, pids) >= 0
+        q = np.flatnonzero(known)
+        found, _ = self.index.similar(np.asarray(pids)[q], n)
+        rows, found = np.repeat(q, found.shape[1]), found.ravel()
+        ok = found != -1                    # huecos del IVF
+        return rows[ok], found[ok]
+
+    def score(self, q_pids, c_pids):
+        qp, cp = _positions(self._labels, q_pids), _positions(self._labels, c_pids)
+        ok = (qp >= 0) & (cp >= 0)
+        out = np.zeros(len(qp), dtype=np.float32)
+        a = np.asarray(self.index.vectors[qp[ok]])
+        b = np.asarray(self.index.vectors[cp[ok]])
+        if self.index.metric == "cosine":
+            out[ok] = np.einsum("ij,ij->i", a, b)
+        else:
+            out[ok] = 1.0 / (1.0 + np.einsum("ij,ij->i", a - b, a - b))
+        return out
+
+
+class SetSignal:
+    """Jaccard entre conjuntos (pistas, artistas o álbumes) de dos playlists."""
+
+    def __init__(self, tm, lsh=None):
+        self.tm = tm
+        self.lsh = lsh                      # sin LSH la señal solo re-puntúa
+        self._labels = pd.Index(tm.pids)
+        self._x = tm.matrix.astype(np.float32)
+        self._sizes = np.diff(tm.matrix.indptr).astype(np.float32)
+
+    @classmethod
+    def from_frame(cls, df, column, with_lsh=True, **lsh_kwargs):
+        """Matriz playlist × `column` (p.ej. artist_name) y, opcionalmente, su MinHash LSH."""
+        tm = TransactionMatrix.from_frame(df.dropna(subset=[column]), "pid", column)
+        lsh = None
+        if with_lsh:
+            lsh = MinHashLSH(**lsh_kwargs)
+            lsh.add_matrix(tm)
+        return cls(tm, lsh)
+
+    def candidates(self, pids, n):
+        if self.lsh is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        known = np.fromiter((p in self.lsh._position for p in np.asarray(pids).tolist()),
+                            dtype=bool, count=len(pids))
+        q = np.flatnonzero(known)
+        hits = self.lsh.similar(np.asarray(pids)[q], n)
+        q_of = pd.Index(np.asarray(pids)[q]).get_indexer(hits["pid"].to_numpy())
+        return q[q_of], hits["similar_pid"].to_numpy()
+
+    def score(self, q_pids, c_pids):
+        qp, cp = _positions(self._labels, q_pids), _positions(self._labels, c_pids)
+        ok = (qp >= 0) & (cp >= 0)
+        out = np.zeros(len(qp), dtype=np.float32)
+        if ok.any():
+            inter = np.asarray(self._x[qp[ok]].multiply(self._x[cp[ok]]).sum(axis=1)).ravel()
+            union = self._sizes[qp[ok]] + self._sizes[cp[ok]] - inter
+            out[ok] = np.where(union > 0, inter / np.maximum(union, 1), 0)
+        return out
+
+
+# ------------------------------------------------------------
+# Motor híbrido
+# ------------------------------------------------------------
+class HybridSimilarity:
+    """Fusión de candidatos de varias señales + re-ranking ponderado por lotes."""
+
+    def __init__(self, signals, weights=None, history=1000):
+        self.signals = dict(signals)
+        self.weights = self._normalize(weights or {name: 1.0 for name in self.signals})
+        self._timings = deque(maxlen=history)     # un registro por llamada a similar()
+
+    def __repr__(self):
+        w = ", ".join(f"{n}={w:.2f}" for n, w in self.weights.items())
+        return f"HybridSimilarity({w})"
+
+    def _normalize(self, weights):
+        unknown = set(weights) - set(self.signals)
+        if unknown:
+            raise KeyError(f"Señales desconocidas: {sorted(unknown)}")
+        total = sum(weights.values())
+        return {name: weights.get(name, 0.0) / total for name in self.signals}
+
+    def similar(self, pids, k=10, n_candidates=50, weights=None):
+        """
+        Top-k por score híbrido para cada pid (sin sí misma). Retorna un
+        DataFrame pid, similar_pid, score y el score de cada señal.
+        """
+        weights = self._normalize(weights) if weights else self.weights
+        pids = np.asarray(pids, dtype=np.int64)
+        timing = {"n_queries": len(pids)}
+        t_start = time.perf_counter()
+
+        # 1) Candidatos de cada señal con peso > 0
+        q_all, c_all = [], []
+        for name, signal in self.signals.items():
+            if not weights[name]:
+                continue
+            t0 = time.perf_counter()
+            q, c = signal.candidates(pids, n_candidates)
+            timing[f"{name}.candidates"] = time.perf_counter() - t0
+            q_all.append(q)
+            c_all.append(np.asarray(c, dtype=np.int64))
+
+        # 2) Unión de pares (consulta, candidato)
+        t0 = time.perf_counter()
+        q = np.concatenate(q_all) if q_all else np.empty(0, dtype=np.int64)
+        c = np.concatenate(c_all) if c_all else np.empty(0, dtype=np.int64)
+        keep = c != pids[q]
+        pairs = pd.DataFrame({"q": q[keep], "c": c[keep]}).drop_duplicates()
+        q, c = pairs["q"].to_numpy(), pairs["c"].to_numpy()
+        timing["fusion"] = time.perf_counter() - t0
+
+        # 3) Re-ranking vectorizado, una llamada por señal
+        scores = {}
+        total = np.zeros(len(q), dtype=np.float32)
+        for name, signal in self.signals.items():
+            if not weights[name]:
+                continue
+            t0 = time.perf_counter()
+            scores[name] = signal.score(pids[q], c)
+            timing[f"{name}.score"] = time.perf_counter() - t0
+            total += weights[name] * scores[name]
+
+        t0 = time.perf_counter()
+        order = np.lexsort((-total, q))
+        q_sorted = q[order]
+        rank = np.arange(len(order)) - np.searchsorted(q_sorted, q_sorted)
+        top = order[rank < k]
+        out = pd.DataFrame({"pid": pids[q[top]], "similar_pid": c[top], "score": total[top]})
+        for name, s in scores.items():
+            out[name] = s[top]
+        timing["topk"] = time.perf_counter() - t0
+        timing["total"] = time.perf_counter() - t_start
+        self._timings.append(timing)
+        return out
+
+    def latency_report(self):
+        """ms por etapa (media, p50, p99) sobre las últimas llamadas, y por consulta."""
+        stages = defaultdict(list)
+        n_queries = []
+        for t in self._timings:
+            n_queries.append(t["n_queries"])
+            for stage, seconds in t.items():
+                if stage != "n_queries":
+                    stages[stage].append(seconds * 1000)
+        if not stages:
+            return pd.DataFrame()
+        total_q = max(sum(n_queries), 1)
+        rows = {stage: {"mean_ms": np.mean(v), "p50_ms": np.percentile(v, 50), "p99_ms": np.percentile(v, 99),
+                        "ms_por_consulta": np.sum(v) / total_q}
+                for stage, v in stages.items()}
+        return pd.DataFrame.from_dict(rows, orient="index").round(3)
+
+
+def build_engine(vectors_path, transactions_path, tracks_path, weights=None, lsh_path=None):
+    """Motor con las señales por defecto a partir de los artefactos de preprocessing.ipynb."""
+    ids, X = load_vectors(vectors_path)
+    tm = TransactionMatrix.load(transactions_path)
+    lsh = MinHashLSH.load(lsh_path) if lsh_path else None
+    if lsh is None:
+        lsh = MinHashLSH(threshold=0.3)
+        lsh.add_matrix(tm)
+    df = pd.read_parquet(tracks_path, columns=["pid", "artist_name", "album_name"])
+    signals = {
+        "audio": VectorSignal(HNSWIndex(metric="cosine").build(X, ids)),
+        "tracks": SetSignal(tm, lsh),
+        "artists": SetSignal.from_frame(df, "artist_name", threshold=0.3),
+        "albums": SetSignal.from_frame(df, "album_name", with_lsh=False),
+    }
+    weights = weights or {"audio": 0.4, "tracks": 0.3, "artists": 0.2, "albums": 0.1}
+    return HybridSimilarity(signals, weights)
+
+
+def benchmark(engine, pids, batch_size=64, k=10, n_candidates=50):
+    rng = np.random.default_rng(0)
+    pids = rng.permutation(pids)
+    t0 = time.perf_counter()
+    for start in range(0, len(pids), batch_size):
+        engine.similar(pids[start:start + batch_size], k, n_candidates)
+    elapsed = time.perf_counter() - t0
+    print(f"📊 {engine!r}: {len(pids)} consultas en lotes de {batch_size}, "
+          f"{len(pids) / elapsed:,.0f} consultas/s")
+    print(engine.latency_report())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Similitud híbrida entre playlists (audio + co-ocurrencia + metadatos)")
+    parser.add_argument("--vectors", default="data/processed_for_modeling/playlist_pca_components.parquet")
+    parser.add_argument("--transactions", default="data/processed_for_modeling/transactions_matrix.npz")
+    parser.add_argument("--tracks", default="data/processed_for_modeling/df_processed_full.parquet",
+                        help="Parquet con pid, artist_name y album_name")
+    parser.add_argument("--lsh", default=None, help="minhash_lsh.npz ya construido (opcional)")
+    parser.add_argument("--pid", type=int, nargs="*", help="pids a consultar")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--benchmark", action="store_true", help="Latencia por señal sobre 1000 consultas")
+    args = parser.parse_args()
+
+    engine = build_engine(args.vectors, args.transactions, args.tracks, lsh_path=args.lsh)
+    if args.benchmark:
+        pool = engine.signals["tracks"].tm.pids
+        benchmark(engine, pool[:1000], k=args.k)
+    else:
+        pids = args.pid or engine.signals["tracks"].tm.pids[:1].tolist()
+        print(engine.similar(pids, args.k).to_string(index=False))
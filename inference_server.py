@@ -0,0 +1,559 @@
+"""
+inference_server.py
+
+Servidor HTTP local (aiohttp) de inferencia por playlist: en vez de solo
+imprimir el accuracy de los modelos de prediction.ipynb, carga una vez el
+pipeline de features (feature_pipeline.joblib), el clasificador de cluster
+guardado (models/xgb_cluster_hybrid.json), el índice de playlists y el de
+pistas (track_similarity.py), y responde por cada playlist posteada:
+
+  - cluster: predicción del clasificador sobre el perfil agregado de la
+    playlist (mismas columnas que df_playlist, playlist_profiles.py).
+  - similar_playlists: vecinos del perfil (coseno sobre features
+    estandarizadas, HNSW de vector_index.py) con su cluster.
+  - recommended_tracks: suma de similitudes a las pistas de la playlist
+    (embeddings del autoencoder), sin las pistas que ya tiene.
+
+Las peticiones concurrentes se juntan en micro-lotes (hasta max_batch_size
+o max_wait_ms desde la primera): perfiles, predicción y búsquedas en los
+índices se hacen una vez por lote, en un hilo aparte para no bloquear el
+event loop. GET /metrics da p50/p95/p99 de latencia por petición, tamaño
+medio de lote y tiempo de modelo por lote.
+
+    POST /predict  {"tracks": ["track_id", ...], "name": "opcional",
+                    "new_tracks": [{features crudas de pistas sin track_id conocido}],
+                    "k": 10, "n": 20}
+    GET  /metrics
+    GET  /health
+
+Uso:
+    python inference_server.py --port 8080
+    curl -X POST localhost:8080/predict -d '{"tracks": ["3n3Ppam7vgaVa1iaRUc9Lp"]}'
+
+    python inference_server.py --benchmark      # micro-lotes vs. una petición por llamada
+    python inference_server.py --check          # status de peticiones válidas/inválidas, solas y en lote
+"""
+
+import os
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+from feature_pipeline import FeaturePipeline
+from playlist_profiles import DURATION_COL, PlaylistProfileStore, notebook_columns
+from track_similarity import TrackSimilarity
+from vector_index import INDEX_TYPES, open_index
+
+DATA_DIR = "data/processed_for_prediction"
+# Columnas por fila de playlist (no por pista): se rellenan con la posición en la lista
+PLAYLIST_ROW_COLUMNS = ("pos",)
+NON_FEATURES = ["pid", "name", "playlist_labels_kmeans", "playlist_labels_hdbscan", "cluster_hybrid"]
+# Límites de "k" (playlists similares) y "n" (pistas recomendadas) por petición
+MAX_K = 100
+MAX_N = 500
+
+
+# ------------------------------------------------------------
+# 1) Artefactos persistidos
+# ------------------------------------------------------------
+class ClusterModel:
+    """Clasificador de cluster guardado: Booster de xgboost (.json/.ubj) o estimador sklearn (.joblib)."""
+
+    def __init__(self, model, features, classes=None):
+        self.model = model
+        self.features = list(features)
+        self.classes = None if classes is None else np.asarray(classes)
+
+    def __repr__(self):
+        return f"ClusterModel({type(self.model).__name__}, {len(self.features)} features)"
+
+    @classmethod
+    def load(cls, path):
+        path = str(path)
+        if path.endswith((".json", ".ubj")):
+            import xgboost as xgb
+
+            booster = xgb.Booster()
+            booster.load_model(path)
+            classes_path = os.path.splitext(path)[0] + "_classes.npy"
+            classes = np.load(classes_path, allow_pickle=True) if os.path.exists(classes_path) else None
+            return cls(booster, booster.feature_names, classes)
+        model = joblib.load(path)
+        return cls(model, model.feature_names_in_)
+
+    def predict(self, X):
+        X = X.reindex(columns=self.features)
+        if hasattr(self.model, "inplace_predict"):
+            pred = np.asarray(self.model.inplace_predict(X.to_numpy(dtype=np.float32, na_value=np.nan)))
+            pred = pred.argmax(axis=1) if pred.ndim == 2 else pred.astype(int)   # softprob / softmax
+            return self.classes[pred] if self.classes is not None else pred
+        return self.model.predict(X)
+
+
+def build_playlist_index(df_playlist, directory, cluster_column="cluster_hybrid", kind="hnsw"):
+    """Índice coseno sobre las features de df_playlist estandarizadas + cluster de cada pid."""
+    features = [c for c in df_playlist.select_dtypes("number").columns if c not in NON_FEATURES]
+    X = df_playlist[features].to_numpy(dtype=np.float64, na_value=np.nan)
+    mean, std = np.nanmean(X, axis=0), np.nanstd(X, axis=0)
+    std[~(std > 0)] = 1.0
+    X = np.nan_to_num((X - mean) / std)
+    index = INDEX_TYPES[kind]("cosine").build(X, df_playlist["pid"].to_numpy())
+    index.save(directory)
+    np.savez(os.path.join(str(directory), "scaling.npz"), mean=mean, std=std, features=np.array(features))
+    clusters = df_playlist[cluster_column] if cluster_column in df_playlist else pd.Series(-1, df_playlist.index)
+    pd.DataFrame({"cluster": clusters.to_numpy()}).to_parquet(os.path.join(str(directory), "clusters.parquet"))
+    return directory
+
+
+class PlaylistPredictor:
+    """Todo lo que se carga una vez; predict_batch() atiende un lote de playlists con operaciones vectorizadas."""
+
+    def __init__(self, pipeline, track_table, model, playlist_index, scaling, playlist_clusters, tracks,
+                 max_seeds=50):
+        self.pipeline = pipeline
+        self.track_table = track_table              # una fila por track_id, features ya transformadas
+        self.model = model
+        self.playlist_index = playlist_index
+        self.scaling = scaling
+        self.playlist_clusters = np.asarray(playlist_clusters)
+        self.tracks = tracks                        # TrackSimilarity
+        self.max_seeds = max_seeds
+        self.mean_cols = notebook_columns(track_table.reset_index())
+        self._track_pos = pd.Index(track_table.index)
+        self._seed_pos = pd.Index(tracks.index.ids)
+
+    def __repr__(self):
+        return (f"PlaylistPredictor({len(self.track_table):,} pistas, {self.model!r}, "
+                f"{len(self.playlist_index):,} playlists indexadas, {len(self.tracks):,} pistas recomendables)")
+
+    @classmethod
+    def load(cls, pipeline_path="feature_pipeline.joblib", model_path="models/xgb_cluster_hybrid.json",
+             tracks_path=f"{DATA_DIR}/df_processed_full.parquet",
+             playlists_path=f"{DATA_DIR}/df_playlist_with_clusters.parquet",
+             playlist_index_dir=f"{DATA_DIR}/playlist_feature_index", track_index_dir=f"{DATA_DIR}/track_index",
+             cluster_column="cluster_hybrid", **kwargs):
+        pipeline = FeaturePipeline.load(pipeline_path)
+        df = pd.read_parquet(tracks_path)
+        numeric = [c for c in df.select_dtypes("number").columns if c != "pid"]
+        track_table = df.drop_duplicates("track_id").set_index("track_id")[numeric]
+        if not os.path.exists(os.path.join(playlist_index_dir, "meta.json")):
+            build_playlist_index(pd.read_parquet(playlists_path), playlist_index_dir, cluster_column)
+        with np.load(os.path.join(playlist_index_dir, "scaling.npz")) as z:
+            scaling = {"mean": z["mean"], "std": z["std"], "features": list(z["features"])}
+        clusters = pd.read_parquet(os.path.join(playlist_index_dir, "clusters.parquet"))["cluster"]
+        return cls(pipeline, track_table, ClusterModel.load(model_path), open_index(playlist_index_dir),
+                   scaling, clusters, TrackSimilarity.load(track_index_dir), **kwargs)
+
+    # --------------------------------------------------------
+    # Perfiles de playlist (una reconstrucción por lote)
+    # --------------------------------------------------------
+    def playlist_rows(self, playlists):
+        """Filas pista-a-pista del lote (pid = posición en el lote) y pistas desconocidas por playlist."""
+        frames, unknown = [], []
+        for i, p in enumerate(playlists):
+            ids = list(p.get("tracks", []))
+            pos = self._track_pos.get_indexer(ids)
+            unknown.append([t for t, q in zip(ids, pos) if q < 0])
+            rows = self.track_table.iloc[pos[pos >= 0]].reset_index()
+            if p.get("new_tracks"):
+                # Pistas sin fila en df_processed_full: features crudas → mismo preprocesamiento
+                rows = pd.concat([rows, self.pipeline.transform(pd.DataFrame(p["new_tracks"]))], ignore_index=True)
+            frames.append(rows.assign(pid=i, name=p.get("name") or self.pipeline.fill_name))
+        rows = pd.concat(frames, ignore_index=True)
+        for col in PLAYLIST_ROW_COLUMNS:
+            if col in self.mean_cols:
+                rows[col] = rows.groupby("pid").cumcount()
+        if "track_id" not in rows:
+            rows["track_id"] = None
+        return rows, unknown
+
+    def profiles(self, playlists):
+        """df_playlist de las playlists del lote (una fila por playlist, en orden)."""
+        rows, unknown = self.playlist_rows(playlists)
+        frame = PlaylistProfileStore.build(rows, self.mean_cols, (DURATION_COL,)).to_frame()
+        return frame.set_index("pid").reindex(range(len(playlists))), unknown
+
+    # --------------------------------------------------------
+    # Lote completo
+    # --------------------------------------------------------
+    def _similar_playlists(self, profiles, k):
+        X = profiles.reindex(columns=self.scaling["features"]).to_numpy(dtype=np.float64, na_value=np.nan)
+        X = np.nan_to_num((X - self.scaling["mean"]) / self.scaling["std"])
+        pos, scores = self.playlist_index._search(self.playlist_index._prepare(X), k)
+        return pos, scores
+
+    def _recommend(self, playlists, n):
+        """Una búsqueda para las semillas únicas del lote; suma de similitudes por (playlist, pista)."""
+        seeds = [list(dict.fromkeys(p.get("tracks", [])))[-self.max_seeds:] for p in playlists]
+        owner = np.repeat(np.arange(len(playlists)), [len(s) for s in seeds])
+        seed_pos = self._seed_pos.get_indexer([t for s in seeds for t in s])
+        owner, seed_pos = owner[seed_pos >= 0], seed_pos[seed_pos >= 0]
+        out = [[] for _ in playlists]
+        if not len(seed_pos):
+            return out
+        uniq, inverse = np.unique(seed_pos, return_inverse=True)
+        index = self.tracks.index
+        per_seed = max(n, 10)
+        pos, scores = index._search(np.asarray(index.vectors[uniq]), per_seed + 1)
+        pos, scores = pos[inverse], scores[inverse]
+        hits = pd.DataFrame({"playlist": np.repeat(owner, pos.shape[1]), "pos": pos.ravel(),
+                             "score": (scores if index.largest else -scores).ravel()})
+        own = pd.MultiIndex.from_arrays([owner, seed_pos])
+        hits = hits[(hits["pos"] >= 0) & ~pd.MultiIndex.from_frame(hits[["playlist", "pos"]]).isin(own)]
+        best = (hits.groupby(["playlist", "pos"], sort=False)["score"].sum().reset_index()
+                .sort_values(["playlist", "score"], ascending=[True, False]).groupby("playlist").head(n))
+        for p, pos_, s in zip(best["playlist"].to_numpy(), best["pos"].to_numpy(), best["score"].to_numpy()):
+            out[p].append({"track_id": str(index.ids[pos_]), "score": round(float(s), 4)})
+        return out
+
+    def predict_batch(self, playlists):
+        """Lista de respuestas (una por playlist del lote).
+
+        Las playlists sin ninguna pista conocida ni new_tracks se responden
+        aparte (no tienen perfil). Si el lote falla, se repite playlist a
+        playlist: la que falle recibe su excepción en su posición y el resto
+        del lote responde con normalidad.
+        """
+        results = [None] * len(playlists)
+        usable = []
+        for i, p in enumerate(playlists):
+            ids = list(p.get("tracks", []))
+            if p.get("new_tracks") or (self._track_pos.get_indexer(ids) >= 0).any():
+                usable.append(i)
+            else:
+                results[i] = {"error": "ninguna pista conocida", "unknown_tracks": ids}
+        if not usable:
+            return results
+        batch = [playlists[i] for i in usable]
+        try:
+            answers = self._predict_batch(batch)
+        except Exception as e:
+            answers = [e] if len(batch) == 1 else [self.predict_batch([p])[0] for p in batch]
+        for i, answer in zip(usable, answers):
+            results[i] = answer
+        return results
+
+    def _predict_batch(self, playlists):
+        profiles, unknown = self.profiles(playlists)
+        empty = profiles["n_tracks"].isna().to_numpy()
+        clusters = np.full(len(playlists), None, dtype=object)
+        if (~empty).any():
+            clusters[~empty] = self.model.predict(profiles[~empty])
+        k = max(int(p.get("k", 10)) for p in playlists)
+        n = max(int(p.get("n", 20)) for p in playlists)
+        sim_pos, sim_scores = self._similar_playlists(profiles, k)
+        recommended = self._recommend(playlists, n)
+        results = []
+        for i, p in enumerate(playlists):
+            if empty[i]:
+                results.append({"error": "ninguna pista conocida", "unknown_tracks": unknown[i]})
+                continue
+            k_i, n_i = int(p.get("k", 10)), int(p.get("n", 20))
+            ok = sim_pos[i] >= 0
+            similar = [{"pid": int(self.playlist_index.ids[q]), "score": round(float(s), 4),
+                        "cluster": _plain(self.playlist_clusters[q])}
+                       for q, s in zip(sim_pos[i][ok][:k_i], sim_scores[i][ok][:k_i])]
+            results.append({"cluster": _plain(clusters[i]), "similar_playlists": similar,
+                            "recommended_tracks": recommended[i][:n_i], "unknown_tracks": unknown[i]})
+        return results
+
+
+def validate_payload(payload):
+    """Petición de /predict normalizada (tipos y límites) o ValueError con el motivo."""
+    if not isinstance(payload, dict):
+        raise ValueError("se espera un objeto JSON {'tracks': [track_id, ...]}")
+    tracks = payload.get("tracks") or []
+    if not isinstance(tracks, list) or not all(isinstance(t, str) for t in tracks):
+        raise ValueError("'tracks' debe ser una lista de track_id (str)")
+    new_tracks = payload.get("new_tracks") or []
+    if not isinstance(new_tracks, list) or not all(isinstance(t, dict) and "duration_ms" in t for t in new_tracks):
+        raise ValueError("'new_tracks' debe ser una lista de objetos con features crudas (incluido duration_ms)")
+    if not tracks and not new_tracks:
+        raise ValueError("se espera {'tracks': [track_id, ...]} o 'new_tracks' no vacío")
+    clean = {"tracks": tracks, "new_tracks": new_tracks}
+    for key, default, limit in (("k", 10, MAX_K), ("n", 20, MAX_N)):
+        value = payload.get(key, default)
+        if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= limit:
+            raise ValueError(f"'{key}' debe ser un entero entre 1 y {limit}")
+        clean[key] = value
+    name = payload.get("name")
+    if name is not None and not isinstance(name, str):
+        raise ValueError("'name' debe ser un texto")
+    clean["name"] = name
+    return clean
+
+
+def _plain(value):
+    """numpy → tipo JSON."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+# ------------------------------------------------------------
+# 2) Micro-lotes y métricas
+# ------------------------------------------------------------
+class LatencyStats:
+    """Ventana de las últimas `window` peticiones y lotes."""
+
+    def __init__(self, window=10_000):
+        self.latency_ms = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.batch_ms = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+
+    def summary(self):
+        lat = np.asarray(self.latency_ms)
+        pct = (lambda q: round(float(np.percentile(lat, q)), 2)) if len(lat) else (lambda q: None)
+        return {"requests": self.requests, "errors": self.errors, "p50_ms": pct(50), "p95_ms": pct(95),
+                "p99_ms": pct(99), "batches": len(self.batch_sizes),
+                "mean_batch_size": round(float(np.mean(self.batch_sizes)), 2) if self.batch_sizes else None,
+                "model_ms_per_batch_p50": round(float(np.median(self.batch_ms)), 2) if self.batch_ms else None}
+
+
+class MicroBatcher:
+    """Cola de peticiones → lotes de hasta max_batch_size (o lo que llegue en max_wait_ms)."""
+
+    def __init__(self, predict_batch, max_batch_size=64, max_wait_ms=5.0, stats=None):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = stats or LatencyStats()
+        self.queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, payload):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((payload, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            payloads = [p for p, _ in batch]
+            t0 = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._executor, self.predict_batch, payloads)
+            except Exception as e:          # el lote entero falla: cada petición recibe el error
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.stats.batch_ms.append((time.perf_counter() - t0) * 1000)
+            self.stats.batch_sizes.append(len(batch))
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):   # solo falló esta playlist
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+# ------------------------------------------------------------
+# 3) Aplicación aiohttp
+# ------------------------------------------------------------
+def make_app(predictor, max_batch_size=64, max_wait_ms=5.0):
+    stats = LatencyStats()
+    batcher = MicroBatcher(predictor.predict_batch, max_batch_size, max_wait_ms, stats)
+
+    async def handle_predict(request):
+        t0 = time.perf_counter()
+        stats.requests += 1
+        try:
+            payload = await request.json()
+        except ValueError:
+            stats.errors += 1
+            return web.json_response({"error": "JSON inválido"}, status=400)
+        try:
+            payload = validate_payload(payload)
+        except ValueError as e:             # se rechaza aquí, antes de entrar en un lote
+            stats.errors += 1
+            return web.json_response({"error": str(e)}, status=400)
+        try:
+            result = await batcher.submit(payload)
+        except Exception as e:
+            stats.errors += 1
+            return web.json_response({"error": f"{type(e).__name__}: {e}"}, status=500)
+        stats.latency_ms.append((time.perf_counter() - t0) * 1000)
+        return web.json_response(result, status=422 if "error" in result else 200)
+
+    async def handle_metrics(request):
+        return web.json_response(stats.summary())
+
+    async def handle_health(request):
+        return web.json_response({"status": "ok", "model": repr(predictor.model),
+                                  "max_batch_size": max_batch_size, "max_wait_ms": max_wait_ms})
+
+    async def on_startup(app):
+        batcher.start()
+
+    async def on_cleanup(app):
+        await batcher.stop()
+
+    app = web.Application()
+    app.router.add_post("/predict", handle_predict)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/health", handle_health)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app["stats"] = stats
+    return app
+
+
+# ------------------------------------------------------------
+# 4) Prueba de carga
+# ------------------------------------------------------------
+async def load_test(url, payloads, concurrency=32):
+    """Envía los payloads con `concurrency` peticiones en vuelo; latencias del lado del cliente (ms)."""
+    import aiohttp
+
+    latencies = []
+    queue = list(payloads)
+
+    async def worker(session):
+        while queue:
+            payload = queue.pop()
+            t0 = time.perf_counter()
+            async with session.post(f"{url}/predict", json=payload) as resp:
+                await resp.read()
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    return np.array(latencies), time.perf_counter() - t0
+
+
+async def _serve_and_test(predictor, payloads, max_batch_size, concurrency, port):
+    runner = web.AppRunner(make_app(predictor, max_batch_size=max_batch_size))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    try:
+        lat, elapsed = await load_test(f"http://127.0.0.1:{port}", payloads, concurrency)
+        server = runner.app["stats"].summary()
+    finally:
+        await runner.cleanup()
+    return {"max_batch_size": max_batch_size, "req_s": len(payloads) / elapsed,
+            "p50_ms": np.percentile(lat, 50), "p99_ms": np.percentile(lat, 99),
+            "mean_batch_size": server["mean_batch_size"]}
+
+
+async def _check_requests(predictor, known, port):
+    """(status, cuerpo) de cada caso, enviados a la vez (mismo micro-lote) y luego uno a uno."""
+    import aiohttp
+
+    cases = {
+        "válida": ({"tracks": known}, 200),
+        "solo pistas desconocidas": ({"tracks": ["nope"]}, 422),
+        "k no entero": ({"tracks": known, "k": "x"}, 400),
+        "tracks no es lista de str": ({"tracks": [1, 2]}, 400),
+        "new_tracks sin duration_ms": ({"new_tracks": [{"bpm": 120}]}, 400),
+    }
+    runner = web.AppRunner(make_app(predictor, max_wait_ms=50))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async def post(payload):
+                async with session.post(f"http://127.0.0.1:{port}/predict", json=payload) as resp:
+                    return resp.status, await resp.json()
+
+            together = await asyncio.gather(*(post(payload) for payload, _ in cases.values()))
+            alone = [await post(payload) for payload, _ in cases.values()]
+    finally:
+        await runner.cleanup()
+    return cases, together, alone
+
+
+def check(predictor, port=8090):
+    """
+    Cada caso responde el mismo status tanto solo como dentro de un lote con
+    otras peticiones (una petición mala no cambia la respuesta de las demás).
+    """
+    known = predictor.track_table.index[:10].tolist()
+    cases, together, alone = asyncio.run(_check_requests(predictor, known, port))
+    for (name, (_, expected)), (s_batch, body), (s_alone, _) in zip(cases.items(), together, alone):
+        assert s_batch == s_alone == expected, (name, s_batch, s_alone, body)
+        print(f"✅ {name:<28} {expected} (en lote y sola)")
+
+
+def benchmark(predictor, payloads, concurrency=32, batch_sizes=(1, 64), port=8089):
+    """Misma carga con una petición por llamada al modelo (max_batch_size=1) y con micro-lotes."""
+    rows = [asyncio.run(_serve_and_test(predictor, payloads, b, concurrency, port)) for b in batch_sizes]
+    print(f"📊 {len(payloads)} peticiones, {concurrency} concurrentes — {predictor!r}")
+    print(pd.DataFrame(rows).set_index("max_batch_size").round(2).to_string())
+
+
+def sample_payloads(predictor, n=1000, tracks_per_playlist=(10, 60), seed=0):
+    """Playlists sintéticas con pistas conocidas, para la prueba de carga."""
+    rng = np.random.default_rng(seed)
+    ids = predictor.track_table.index.to_numpy()
+    return [{"tracks": rng.choice(ids, rng.integers(*tracks_per_playlist), replace=False).tolist()}
+            for _ in range(n)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local de inferencia por playlist (micro-lotes)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--pipeline", default="feature_pipeline.joblib")
+    parser.add_argument("--model", default="models/xgb_cluster_hybrid.json")
+    parser.add_argument("--tracks", default=f"{DATA_DIR}/df_processed_full.parquet")
+    parser.add_argument("--playlists", default=f"{DATA_DIR}/df_playlist_with_clusters.parquet")
+    parser.add_argument("--playlist-index", default=f"{DATA_DIR}/playlist_feature_index")
+    parser.add_argument("--track-index", default=f"{DATA_DIR}/track_index")
+    parser.add_argument("--cluster-column", default="cluster_hybrid")
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--benchmark", action="store_true", help="Prueba de carga: micro-lotes vs. sin lotes")
+    parser.add_argument("--check", action="store_true",
+                        help="Status de peticiones válidas e inválidas, solas y dentro de un mismo lote")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    predictor = PlaylistPredictor.load(args.pipeline, args.model, args.tracks, args.playlists,
+                                       args.playlist_index, args.track_index, args.cluster_column)
+    print(f"✅ {predictor!r} cargado en {time.perf_counter() - t0:.1f}s")
+    if args.check:
+        check(predictor)
+    elif args.benchmark:
+        benchmark(predictor, sample_payloads(predictor, args.requests), args.concurrency,
+                  batch_sizes=(1, args.max_batch_size))
+    else:
+        web.run_app(make_app(predictor, args.max_batch_size, args.max_wait_ms), host=args.host, port=args.port)
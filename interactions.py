@@ -0,0 +1,276 @@
+"""
+interactions.py
+
+Tabla de interacciones playlist→pista construida directamente en arrays
+tipados, en vez de la cadena explode + json_normalize + str.split + merge
+de Load&EDA.ipynb (que pasa ~650k filas por objetos Python varias veces):
+
+  - pid       int32
+  - track_idx int32   id de la pista en el vocabulario global (uri_vocab.py)
+  - pos       int16
+
+Los metadatos se guardan una sola vez por pista en `tracks` (fila i = pista
+con id i; artist_idx/album_idx también son ids del vocabulario) y las URIs
+solo se reconstruyen para mostrar. Las features se unen por posición
+(búsqueda binaria del track_id ordenado de la tabla de
+track_feature_store.py, una vez por pista, y luego un `take` por fila) en
+lugar de un merge hash sobre claves string.
+
+Uso:
+    vocab = UriVocabulary.load("data/processed/vocab")
+    inter = Interactions.from_challenge("data/challenge_set.json", min_samples=1, vocab=vocab)
+    inter.save("data/processed/interactions", vocab_dir="data/processed/vocab")
+    full = inter.playlist_track_full("data/processed/tracks_features.arrow")
+
+    python interactions.py data/challenge_set.json --benchmark
+"""
+
+import os
+import sys
+import time
+import argparse
+from array import array
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "DataRecolectionScripts"))
+from challenge_stream import iter_playlists
+from track_feature_store import read_track_table, lookup_positions
+from uri_vocab import UriVocabulary
+
+PLAYLIST_COLS = ["pid", "name", "num_tracks", "num_samples", "num_holdouts"]
+TRACK_TEXT_COLS = ["track_name", "artist_name", "album_name"]
+# Columnas de pista en el orden de json_normalize (el del notebook)
+TRACK_META_COLS = ["artist_name", "track_uri", "artist_uri", "track_name",
+                   "album_uri", "duration_ms", "album_name"]
+
+
+class Interactions:
+    """Interacciones (pid, track_idx, pos) + tablas de playlists y de pistas."""
+
+    def __init__(self, pid, track_idx, pos, playlists, tracks, vocab):
+        self.pid = pid
+        self.track_idx = track_idx
+        self.pos = pos
+        self.playlists = playlists    # DataFrame, una fila por playlist
+        self.tracks = tracks          # DataFrame, fila i = pista con id i del vocabulario
+        self.vocab = vocab
+
+    def __len__(self):
+        return len(self.pid)
+
+    # --------------------------------------------------------
+    # Construcción
+    # --------------------------------------------------------
+    @classmethod
+    def from_playlists(cls, playlists, vocab=None):
+        """
+        Con `vocab` (p.ej. cargado de disco) los ids son los globales y el
+        vocabulario se extiende con las pistas/artistas/álbumes nuevos.
+        """
+        vocab = UriVocabulary() if vocab is None else vocab
+        add = vocab.add_one
+        pid, track_idx, pos = array("i"), array("i"), array("h")
+        seen = {}          # track_idx → [artist_idx, album_idx, duration_ms, nombres...]
+        pl_rows = []
+        for pl in playlists:
+            pl_rows.append([pl.get(c) for c in PLAYLIST_COLS])
+            p = pl["pid"]
+            for tr in pl.get("tracks", []):
+                idx = add("track", tr.get("track_uri", ""))
+                if idx not in seen:
+                    seen[idx] = [
+                        add("artist", tr["artist_uri"]) if tr.get("artist_uri") else -1,
+                        add("album", tr["album_uri"]) if tr.get("album_uri") else -1,
+                        tr.get("duration_ms"),
+                    ] + [tr.get(c) for c in TRACK_TEXT_COLS]
+                pid.append(p)
+                track_idx.append(idx)
+                pos.append(tr.get("pos", 0))
+
+        playlists_df = pd.DataFrame(pl_rows, columns=PLAYLIST_COLS)
+        return cls(
+            np.frombuffer(pid, dtype=np.int32),
+            np.frombuffer(track_idx, dtype=np.int32),
+            np.frombuffer(pos, dtype=np.int16),
+            playlists_df.astype({"pid": "int32"}),
+            cls._tracks_table(seen, vocab.size("track")),
+            vocab,
+        )
+
+    @staticmethod
+    def _tracks_table(seen, n_tracks):
+        """Tabla densa por id de pista; las que no aparecen en estas playlists quedan vacías."""
+        ids = np.fromiter(seen.keys(), dtype=np.int64, count=len(seen))
+        rows = list(seen.values())
+        artist_idx = np.full(n_tracks, -1, dtype=np.int32)
+        album_idx = np.full(n_tracks, -1, dtype=np.int32)
+        duration = np.full(n_tracks, np.nan)
+        artist_idx[ids] = [r[0] for r in rows]
+        album_idx[ids] = [r[1] for r in rows]
+        duration[ids] = [np.nan if r[2] is None else r[2] for r in rows]
+        tracks = {"artist_idx": artist_idx, "album_idx": album_idx,
+                  "duration_ms": pd.array(duration, dtype="Int64")}
+        for j, c in enumerate(TRACK_TEXT_COLS, start=3):
+            col = np.full(n_tracks, None, dtype=object)
+            col[ids] = [r[j] for r in rows]
+            tracks[c] = col
+        return pd.DataFrame(tracks)
+
+    @classmethod
+    def from_challenge(cls, challenge_path, min_samples=0, vocab=None):
+        """Lee el challenge set en streaming (min_samples=1 descarta playlists vacías)."""
+        return cls.from_playlists(iter_playlists(str(challenge_path), min_samples=min_samples), vocab)
+
+    # --------------------------------------------------------
+    # Persistencia
+    # --------------------------------------------------------
+    def save(self, directory, vocab_dir=None):
+        """Solo ids y metadatos por pista; el vocabulario va en vocab_dir (por defecto directory/vocab)."""
+        os.makedirs(directory, exist_ok=True)
+        pq.write_table(pa.table({"pid": self.pid, "track_idx": self.track_idx, "pos": self.pos}),
+                       os.path.join(directory, "interactions.parquet"))
+        self.playlists.to_parquet(os.path.join(directory, "playlists.parquet"), index=False)
+        self.tracks.to_parquet(os.path.join(directory, "tracks.parquet"), index=False)
+        self.vocab.save(vocab_dir or os.path.join(directory, "vocab"))
+
+    @classmethod
+    def load(cls, directory, vocab_dir=None):
+        t = pq.read_table(os.path.join(directory, "interactions.parquet"), memory_map=True)
+        return cls(
+            t.column("pid").to_numpy(),
+            t.column("track_idx").to_numpy(),
+            t.column("pos").to_numpy(),
+            pd.read_parquet(os.path.join(directory, "playlists.parquet")),
+            pd.read_parquet(os.path.join(directory, "tracks.parquet")),
+            UriVocabulary.load(vocab_dir or os.path.join(directory, "vocab")),
+        )
+
+    # --------------------------------------------------------
+    # Vistas
+    # --------------------------------------------------------
+    def to_frame(self):
+        """DataFrame (pid, track_idx, pos) sin copiar los arrays."""
+        return pd.DataFrame({"pid": self.pid, "track_idx": self.track_idx, "pos": self.pos}, copy=False)
+
+    def track_meta(self):
+        """Metadatos por pista con las URIs reconstruidas (para mostrar), índice = track_idx."""
+        meta = self.tracks.copy()
+        meta["track_id"] = self.vocab.keys("track")[:len(meta)]
+        meta["track_uri"] = self.vocab.decode("track", np.arange(len(meta)), uri=True)
+        meta["artist_uri"] = self.vocab.decode("artist", meta["artist_idx"], uri=True)
+        meta["album_uri"] = self.vocab.decode("album", meta["album_idx"], uri=True)
+        return meta
+
+    def feature_rows(self, store_path):
+        """Fila de la tabla de features para cada id de pista (-1 si no tiene)."""
+        keys = read_track_table(store_path, columns=["track_id"]).column("track_id")
+        return lookup_positions(keys.to_numpy(zero_copy_only=False), self.vocab.keys("track")[:len(self.tracks)])
+
+    def track_features(self, store_path, columns=None):
+        """Features por id de pista, alineadas con `tracks` (NaN donde no hay)."""
+        table = read_track_table(store_path, columns)
+        rows = self.feature_rows(store_path)
+        # take con nulos donde no hay fila: las pistas sin features quedan en NaN
+        taken = table.take(pa.array(np.where(rows >= 0, rows, 0)).cast(pa.int64()))
+        mask = pa.array(rows < 0)
+        cols = {}
+        for name in taken.column_names:
+            if name == "track_id":
+                continue
+            col = taken.column(name)
+            cols[name] = pc.if_else(mask, pa.scalar(None, type=col.type), col)
+        return pa.table(cols).to_pandas()
+
+    def playlist_track_full(self, store_path, columns=None):
+        """
+        Equivalente a playlist_track_full del notebook (pid, name, metadatos de
+        pista con sus URIs, track_id y features), construido con takes posicionales.
+        """
+        names = self.playlists.set_index("pid")["name"]
+        meta = self.track_meta().take(self.track_idx).reset_index(drop=True)
+        feats = self.track_features(store_path, columns).take(self.track_idx).reset_index(drop=True)
+        base = pd.DataFrame({
+            "pid": self.pid,
+            "name": names.reindex(self.pid).to_numpy(),
+            "pos": self.pos,
+        })
+        return pd.concat([base, meta[TRACK_META_COLS + ["track_id"]], feats], axis=1)
+
+
+# ------------------------------------------------------------
+# Benchmark contra la cadena de celdas del notebook
+# ------------------------------------------------------------
+def notebook_chain(playlists, tracks_feat_df):
+    """Celdas 1.2, 1.4 y 1.5 de Load&EDA.ipynb, tal cual."""
+    playlists_df = pd.json_normalize(playlists, meta=['pid', 'name', 'num_tracks',
+                                                      'num_holdouts', 'num_samples'])
+    playlists_df = playlists_df[playlists_df['num_samples'] > 0].copy()
+    pl_tracks = playlists_df.explode('tracks', ignore_index=True)
+    tracks_cols = pd.json_normalize(pl_tracks['tracks'])
+    playlist_track_df = pd.concat([pl_tracks[['pid', 'name']], tracks_cols], axis=1)
+    playlist_track_df['track_id'] = playlist_track_df['track_uri'].str.split(':').str[-1]
+    return playlist_track_df.merge(tracks_feat_df, on='track_id', how='left', validate='m:1')
+
+
+def benchmark(challenge_path, store_path):
+    from track_feature_store import load_track_features
+
+    playlists = list(iter_playlists(challenge_path))
+    tracks_feat_df = load_track_features(store_path)
+
+    t0 = time.perf_counter()
+    old = notebook_chain(playlists, tracks_feat_df)
+    t_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    inter = Interactions.from_playlists(pl for pl in playlists if pl.get("num_samples", 0) > 0)
+    t_build = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    feats = inter.track_features(store_path)
+    t_join = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    new = inter.playlist_track_full(store_path)
+    t_full = time.perf_counter() - t0
+
+    assert len(old) == len(new) == len(inter)
+    check = [c for c in ("loudness", "bpm") if c in new]
+    for c in check:
+        a = old[c].to_numpy(dtype=float)
+        b = new[c].to_numpy(dtype=float)
+        assert np.allclose(a, b, equal_nan=True), c
+
+    print(f"📊 {len(inter)} interacciones, {len(inter.tracks)} pistas únicas, "
+          f"{len(inter.playlists)} playlists")
+    print(f"   cadena del notebook (explode+json_normalize+split+merge): {t_old:7.2f}s  "
+          f"{old.memory_usage(deep=True).sum() / 1e6:8.1f} MB")
+    print(f"   Interactions (arrays int32/int16):                         {t_build:7.2f}s  "
+          f"{(inter.pid.nbytes + inter.track_idx.nbytes + inter.pos.nbytes) / 1e6:8.1f} MB")
+    print(f"   + features por pista única (lookup posicional):            {t_join:7.2f}s  "
+          f"{feats.memory_usage(deep=True).sum() / 1e6:8.1f} MB")
+    print(f"   playlist_track_full equivalente:                           {t_full:7.2f}s  "
+          f"{new.memory_usage(deep=True).sum() / 1e6:8.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construye la tabla de interacciones playlist→pista")
+    parser.add_argument("challenge", nargs="?", default="data/challenge_set.json")
+    parser.add_argument("--features", default="data/processed/tracks_features.arrow")
+    parser.add_argument("--output", default="data/processed/interactions")
+    parser.add_argument("--vocab", default="data/processed/vocab",
+                        help="Vocabulario global de ids (se extiende con las URIs nuevas)")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Compara con la cadena explode + json_normalize + merge del notebook")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.challenge, args.features)
+    else:
+        inter = Interactions.from_challenge(args.challenge, min_samples=1,
+                                            vocab=UriVocabulary.load(args.vocab))
+        inter.save(args.output, vocab_dir=args.vocab)
+        print(f"✅ {len(inter)} interacciones ({len(inter.tracks)} pistas únicas) → '{args.output}'")
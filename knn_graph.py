@@ -0,0 +1,348 @@
+"""
+knn_graph.py
+
+Grafo kNN disperso que se construye una vez (índice ANN de vector_index.py,
+HNSW multihilo por defecto), se guarda en disco y lo consumen todos los
+pasos que hoy arman su propio grafo de vecinos sobre los mismos puntos:
+
+  - UMAP (preprocessing.ipynb, pistas y playlists): precomputed_knn.
+  - DBSCAN: grafo de radio eps sacado del kNN → metric="precomputed".
+    Exacto en los puntos cuyo k-ésimo vecino está a más de eps; en los
+    "saturados" (saturated(eps)) pueden faltar vecinos.
+  - HDBSCAN: MST de alcanzabilidad mutua sobre el kNN →
+    HDBSCAN(metric="precomputed", min_samples=1), que con un árbol como
+    entrada conserva sus pesos.
+  - silhouette: necesita distancias a todos los puntos, así que el grafo
+    guarda además la matriz de distancias de una muestra de evaluación
+    (eval_size puntos) y silhouette() la reusa para cualquier etiquetado.
+
+Archivos en el directorio: meta.json, ids.npy, indices.npy (n, k) int32,
+distances.npy (n, k) float32 sin el propio punto, eval_idx.npy y
+eval_dist.npy. load(mmap=True) los abre con memory map.
+
+Uso:
+    graph = KNNGraph.build(X_playlist_numeric, k=30, ids=playlist_umap.index)
+    graph.save("data/processed_for_modeling/playlist_knn")
+    graph = KNNGraph.load("data/processed_for_modeling/playlist_knn")
+    graph.hdbscan(min_cluster_size=20, min_samples=10)
+    graph.dbscan(eps=0.5, min_samples=20)
+    graph.silhouette(labels)
+    reducer = graph.umap(X, n_components=2, random_state=42)
+
+    python knn_graph.py data/processed_for_modeling/playlist_pca_components.parquet --k 30 --recall
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.csgraph import minimum_spanning_tree, connected_components
+
+from vector_index import INDEX_TYPES, load_vectors
+
+METRICS = {"euclidean": "l2", "cosine": "cosine"}      # nombre sklearn/umap → vector_index
+
+
+# ------------------------------------------------------------
+# Funciones sobre arrays (las usa también cluster_sweep.py)
+# ------------------------------------------------------------
+def mutual_reachability_mst(knn_dist, knn_ind, min_samples):
+    """
+    MST (simétrico, CSR) de la alcanzabilidad mutua max(núcleo_i, núcleo_j, d_ij)
+    restringida al kNN. El núcleo cuenta al propio punto, como HDBSCAN de
+    sklearn: distancia al vecino min_samples - 1. Componentes sueltas se
+    unen con aristas más largas que cualquier otra.
+    """
+    n, k = knn_dist.shape
+    if min_samples - 1 > k:
+        raise ValueError(f"min_samples={min_samples} necesita al menos {min_samples - 1} vecinos (kNN con k={k})")
+    core = np.asarray(knn_dist[:, min_samples - 2]) if min_samples >= 2 else np.zeros(n)
+    rows = np.repeat(np.arange(n), k)
+    cols = np.asarray(knn_ind).ravel()
+    w = np.maximum.reduce([np.asarray(knn_dist).ravel(), core[rows], core[cols]])
+    # Los ceros explícitos se perderían en la CSR (puntos duplicados)
+    g = sp.csr_matrix((np.maximum(w, 1e-12), (rows, cols)), shape=(n, n))
+    tree = minimum_spanning_tree(g.maximum(g.T)).tocoo()
+    n_comp, comp = connected_components(tree, directed=False)
+    if n_comp > 1:
+        reps = np.unique(comp, return_index=True)[1]
+        bridge = 2 * w.max()
+        tree = sp.coo_matrix((np.concatenate([tree.data, np.full(n_comp - 1, bridge)]),
+                              (np.concatenate([tree.row, reps[:-1]]), np.concatenate([tree.col, reps[1:]]))),
+                             shape=(n, n))
+    tree = tree.tocsr()
+    return (tree + tree.T).tocsr()
+
+
+def silhouette_from_distances(D, labels, chunk_size=2048):
+    """silhouette_score(metric="precomputed") por bloques de filas: D · one-hot da la suma por cluster."""
+    labels = np.asarray(labels)
+    uniq, codes = np.unique(labels, return_inverse=True)
+    if not 1 < len(uniq) < len(labels):
+        return np.nan
+    onehot = np.zeros((len(labels), len(uniq)), dtype=np.float32)
+    onehot[np.arange(len(labels)), codes] = 1
+    sizes = onehot.sum(axis=0)
+    s = np.empty(len(labels))
+    for start in range(0, len(labels), chunk_size):
+        stop = min(start + chunk_size, len(labels))
+        sums = np.asarray(D[start:stop], dtype=np.float32) @ onehot
+        own = codes[start:stop]
+        own_size = sizes[own]
+        a = sums[np.arange(stop - start), own] / np.maximum(own_size - 1, 1)
+        means = sums / sizes
+        means[np.arange(stop - start), own] = np.inf
+        b = means.min(axis=1)
+        s[start:stop] = np.where(own_size > 1, (b - a) / np.maximum(a, b), 0.0)
+    return float(np.nan_to_num(s).mean())
+
+
+def eval_silhouette(eval_dist, eval_idx, labels):
+    """Silhouette de `labels` (todas las filas) sobre la muestra de evaluación, sin el ruido (-1)."""
+    labels = np.asarray(labels)[np.asarray(eval_idx)]
+    keep = labels >= 0
+    if keep.all():
+        return silhouette_from_distances(eval_dist, labels)
+    pos = np.flatnonzero(keep)
+    return silhouette_from_distances(np.asarray(eval_dist)[np.ix_(pos, pos)], labels[pos])
+
+
+# ------------------------------------------------------------
+# Grafo
+# ------------------------------------------------------------
+class KNNGraph:
+    """k vecinos (sin el propio punto) de cada fila + distancias de una muestra de evaluación."""
+
+    def __init__(self, indices, distances, ids=None, metric="euclidean", method="hnsw",
+                 eval_idx=None, eval_dist=None):
+        self.indices = indices
+        self.distances = distances
+        self.ids = np.arange(len(indices)) if ids is None else np.asarray(ids)
+        self.metric = metric
+        self.method = method
+        self.eval_idx = eval_idx
+        self.eval_dist = eval_dist
+        self.index = None           # índice de build() (no se guarda; umap_model.py lo reusa)
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def k(self):
+        return self.indices.shape[1]
+
+    def __repr__(self):
+        n_eval = 0 if self.eval_idx is None else len(self.eval_idx)
+        return f"KNNGraph({len(self):,} puntos, k={self.k}, {self.metric}, {self.method}, muestra de evaluación {n_eval:,})"
+
+    # --------------------------------------------------------
+    # Construcción
+    # --------------------------------------------------------
+    @classmethod
+    def build(cls, X, k=30, metric="euclidean", method="hnsw", ids=None, eval_size=10_000, seed=0,
+              verbose=True, **index_kwargs):
+        """kNN de todas las filas de X con un índice de vector_index.py (brute / ivf / hnsw)."""
+        if isinstance(X, pd.DataFrame):
+            ids = X.index.to_numpy() if ids is None else ids
+            X = X.select_dtypes(include=np.number).to_numpy()
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        t0 = time.perf_counter()
+        index = INDEX_TYPES[method](METRICS[metric], **index_kwargs).build(X)
+        pos, scores = index._search(index.vectors, k + 1)
+        short = int((pos < 0).any(axis=1).sum())
+        if short:
+            # IVF rellena con -1 las filas cuyas listas sondeadas no llegan a k+1 puntos
+            raise ValueError(f"{short:,} filas con menos de {k} vecinos ({method}, "
+                             f"nprobe={getattr(index, 'nprobe', None)}): sube nprobe o usa method='hnsw'/'brute'")
+        indices, distances = cls._drop_self(pos, cls._to_distance(scores, metric))
+        t_knn = time.perf_counter() - t0
+
+        eval_idx = eval_dist = None
+        if eval_size:
+            rng = np.random.default_rng(seed)
+            eval_idx = np.sort(rng.choice(len(X), min(eval_size, len(X)), replace=False))
+            eval_dist = cls._pairwise(X[eval_idx], metric)
+        graph = cls(indices, distances, ids, metric, method, eval_idx, eval_dist)
+        graph.index = index
+        if verbose:
+            print(f"📊 {graph!r}: kNN {t_knn:.1f}s, distancias de evaluación {time.perf_counter() - t0 - t_knn:.1f}s")
+        return graph
+
+    @staticmethod
+    def _to_distance(scores, metric):
+        if metric == "cosine":
+            return np.maximum(1.0 - scores, 0.0)
+        return np.sqrt(np.maximum(scores, 0.0))            # vector_index devuelve L2 al cuadrado
+
+    @staticmethod
+    def _drop_self(pos, dist):
+        """Quita el propio punto de cada fila (o el último vecino si no apareció, p.ej. duplicados)."""
+        n, k1 = pos.shape
+        is_self = pos == np.arange(n)[:, None]
+        missing = ~is_self.any(axis=1)
+        is_self[missing, -1] = True
+        is_self &= np.cumsum(is_self, axis=1) == 1          # una sola columna por fila
+        keep = ~is_self
+        return (pos[keep].reshape(n, k1 - 1).astype(np.int32),
+                dist[keep].reshape(n, k1 - 1).astype(np.float32))
+
+    @staticmethod
+    def _pairwise(X, metric):
+        if metric == "cosine":
+            Xn = X / np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+            return np.maximum(1.0 - Xn @ Xn.T, 0.0).astype(np.float32)
+        sq = np.einsum("ij,ij->i", X, X)
+        D = np.sqrt(np.maximum(sq[:, None] - 2 * X @ X.T + sq[None, :], 0.0)).astype(np.float32)
+        np.fill_diagonal(D, 0.0)
+        return D
+
+    def recall(self, X, n_queries=1000, seed=0):
+        """Recall@k del grafo contra kNN exacto sobre n_queries filas."""
+        if isinstance(X, pd.DataFrame):
+            X = X.select_dtypes(include=np.number).to_numpy()
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(X), min(n_queries, len(X)), replace=False)
+        exact = INDEX_TYPES["brute"](METRICS[self.metric]).build(X)
+        pos, _ = exact._search(exact.vectors[rows], self.k + 1)
+        truth = [set(p[p != r][:self.k]) for p, r in zip(pos, rows)]
+        found = np.asarray(self.indices)[rows]
+        return float(np.mean([len(t & set(f)) / self.k for t, f in zip(truth, found)]))
+
+    # --------------------------------------------------------
+    # Consumidores
+    # --------------------------------------------------------
+    def to_csr(self, max_distance=None, symmetric=True):
+        """Matriz dispersa (n, n) de distancias; solo aristas <= max_distance si se da."""
+        n, k = self.indices.shape
+        rows = np.repeat(np.arange(n), k)
+        cols = np.asarray(self.indices).ravel()
+        data = np.asarray(self.distances, dtype=np.float64).ravel()
+        if max_distance is not None:
+            keep = data <= max_distance
+            rows, cols, data = rows[keep], cols[keep], data[keep]
+        g = sp.csr_matrix((np.maximum(data, 1e-12), (rows, cols)), shape=(n, n))
+        return g.maximum(g.T).tocsr() if symmetric else g
+
+    def saturated(self, eps):
+        """Fracción de puntos con los k vecinos dentro de eps (su vecindad DBSCAN puede estar incompleta)."""
+        return float(np.mean(np.asarray(self.distances)[:, -1] <= eps))
+
+    def dbscan(self, eps, min_samples=20):
+        from sklearn.cluster import DBSCAN
+
+        if min_samples - 1 > self.k:
+            raise ValueError(f"min_samples={min_samples} necesita k >= {min_samples - 1} (k={self.k})")
+        return DBSCAN(eps=eps, min_samples=min_samples, metric="precomputed").fit_predict(self.to_csr(eps))
+
+    def mst(self, min_samples=10):
+        return mutual_reachability_mst(self.distances, self.indices, min_samples)
+
+    def hdbscan(self, min_cluster_size=20, min_samples=10, **kwargs):
+        from sklearn.cluster import HDBSCAN
+
+        return HDBSCAN(min_cluster_size=min_cluster_size, min_samples=1, metric="precomputed",
+                       **kwargs).fit_predict(self.mst(min_samples))
+
+    def silhouette(self, labels):
+        if self.eval_idx is None:
+            raise ValueError("Este grafo no tiene muestra de evaluación (eval_size=0)")
+        return eval_silhouette(self.eval_dist, self.eval_idx, labels)
+
+    def umap_knn(self, n_neighbors=15):
+        """(indices, distancias) con el propio punto en la columna 0, como espera umap."""
+        if n_neighbors - 1 > self.k:
+            raise ValueError(f"n_neighbors={n_neighbors} necesita k >= {n_neighbors - 1} (k={self.k})")
+        n = len(self)
+        ind = np.hstack([np.arange(n, dtype=np.int32)[:, None], np.asarray(self.indices)[:, :n_neighbors - 1]])
+        dist = np.hstack([np.zeros((n, 1), dtype=np.float32), np.asarray(self.distances)[:, :n_neighbors - 1]])
+        return ind, dist
+
+    def umap(self, X, n_neighbors=15, **umap_kwargs):
+        """umap.UMAP ajustado sobre X sin su búsqueda de vecinos (usa este grafo)."""
+        import umap
+
+        ind, dist = self.umap_knn(n_neighbors)
+        reducer = umap.UMAP(n_neighbors=n_neighbors, metric=self.metric, precomputed_knn=(ind, dist, None),
+                            **umap_kwargs)
+        return reducer.fit(X)
+
+    # --------------------------------------------------------
+    # Persistencia
+    # --------------------------------------------------------
+    def save(self, directory):
+        directory = str(directory)
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "indices.npy"), np.asarray(self.indices))
+        np.save(os.path.join(directory, "distances.npy"), np.asarray(self.distances))
+        np.save(os.path.join(directory, "ids.npy"), self.ids.astype(str) if self.ids.dtype == object else self.ids)
+        if self.eval_idx is not None:
+            np.save(os.path.join(directory, "eval_idx.npy"), np.asarray(self.eval_idx))
+            np.save(os.path.join(directory, "eval_dist.npy"), np.asarray(self.eval_dist))
+        meta = {"n": len(self), "k": self.k, "metric": self.metric, "method": self.method}
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = str(directory)
+        mode = "r" if mmap else None
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        path = lambda name: os.path.join(directory, f"{name}.npy")
+        eval_idx = np.load(path("eval_idx"), mmap_mode=mode) if os.path.exists(path("eval_idx")) else None
+        eval_dist = np.load(path("eval_dist"), mmap_mode=mode) if eval_idx is not None else None
+        return cls(np.load(path("indices"), mmap_mode=mode), np.load(path("distances"), mmap_mode=mode),
+                   np.load(path("ids")), meta["metric"], meta["method"], eval_idx, eval_dist)
+
+
+def benchmark(X, graph, min_cluster_size=20, min_samples=10, eps=None):
+    """Cada consumidor con su propia búsqueda de vecinos (sklearn) vs. el grafo compartido."""
+    from sklearn.cluster import DBSCAN, HDBSCAN
+    from sklearn.metrics import adjusted_rand_score
+
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    eps = eps if eps is not None else float(np.median(np.asarray(graph.distances)[:, min_samples - 2]))
+    rows = []
+    for name, own, shared in (
+        ("HDBSCAN", lambda: HDBSCAN(min_cluster_size=min_cluster_size, min_samples=min_samples).fit_predict(X),
+         lambda: graph.hdbscan(min_cluster_size, min_samples)),
+        ("DBSCAN", lambda: DBSCAN(eps=eps, min_samples=min_samples).fit_predict(X),
+         lambda: graph.dbscan(eps, min_samples)),
+    ):
+        t0 = time.perf_counter()
+        a = own()
+        t1 = time.perf_counter()
+        b = shared()
+        t2 = time.perf_counter()
+        rows.append({"paso": name, "propio_s": t1 - t0, "grafo_s": t2 - t1, "ari": adjusted_rand_score(a, b)})
+    print(f"📊 {graph!r} (eps={eps:.3f}, saturados {graph.saturated(eps):.1%})")
+    print(pd.DataFrame(rows).set_index("paso").round(3).to_string())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grafo kNN compartido (UMAP, DBSCAN, HDBSCAN, silhouette)")
+    parser.add_argument("input", nargs="?", default="data/processed_for_modeling/playlist_pca_components.parquet")
+    parser.add_argument("--output", default=None, help="Directorio del grafo (por defecto <input>_knn)")
+    parser.add_argument("--k", type=int, default=30)
+    parser.add_argument("--metric", default="euclidean", choices=sorted(METRICS))
+    parser.add_argument("--method", default="hnsw", choices=sorted(INDEX_TYPES))
+    parser.add_argument("--eval-size", type=int, default=10_000)
+    parser.add_argument("--recall", action="store_true", help="Recall@k contra kNN exacto")
+    parser.add_argument("--benchmark", action="store_true", help="Consumidores con y sin el grafo compartido")
+    args = parser.parse_args()
+
+    ids, X = load_vectors(args.input)
+    graph = KNNGraph.build(X, k=args.k, metric=args.metric, method=args.method, ids=ids, eval_size=args.eval_size)
+    output = args.output or os.path.splitext(args.input)[0] + "_knn"
+    graph.save(output)
+    print(f"✅ {graph!r} → '{output}'")
+    if args.recall:
+        print(f"   recall@{graph.k}: {graph.recall(X):.4f}")
+    if args.benchmark:
+        benchmark(X, KNNGraph.load(output))
@@ -0,0 +1,413 @@
+"""
+minhash_lsh.py
+
+Similitud playlist → playlist por pistas compartidas (Jaccard de los
+conjuntos de pistas), aproximada con firmas MinHash y un índice LSH por
+bandas. Complementa a vector_index.py, que solo compara features de audio.
+
+  - Firmas: num_perm funciones hash multiply-shift sobre el hash de cada
+    ítem (pd.util.hash_array, estable entre ejecuciones); mínimo por
+    playlist con np.minimum.reduceat sobre la CSR, por bloques de nnz.
+    Firma = num_perm × uint32 (128 → 512 bytes por playlist).
+  - LSH: bands × rows = num_perm; cada banda se reduce a una clave uint64.
+    Todas las claves van en un único array ordenado (clave, fila), así una
+    consulta por lotes es un searchsorted. Las altas nuevas van a un bloque
+    delta pequeño que se funde con el principal cuando crece (streaming).
+  - Memoria aproximada por playlist: 4·num_perm (firma) + 12·bands (claves
+    + filas). Con 128 permutaciones y 64 bandas → ~1.3 KB: 1M playlists del
+    MPD ≈ 1.2 GB (32 bandas ≈ 0.9 GB).
+  - evaluate(): recall@k contra Jaccard exacto (X @ Xᵀ disperso).
+
+Los ítems de las playlists nuevas tienen que ser del mismo tipo que las
+columnas de la matriz indexada: la de preprocessing.ipynb usa ids enteros
+del vocabulario de URIs, así que add_playlists()/query() reciben track_id
+junto con vocab= y los codifican antes de calcular la firma.
+
+Uso:
+    lsh = MinHashLSH(num_perm=128, threshold=0.3)
+    lsh.add_matrix(TransactionMatrix.load("data/processed_for_modeling/transactions_matrix.npz"))
+    lsh.add_playlists([1000123], [["4uLU6hMCjMI75M1A2tKUQC", "..."]], vocab=vocab)   # streaming
+    lsh.similar([1000123], k=10)          # pid, similar_pid, jaccard (estimado)
+    lsh.save("data/processed_for_modeling/minhash_lsh.npz")
+
+    python minhash_lsh.py --challenge data/challenge_set.json --benchmark
+"""
+
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from transaction_matrix import TransactionMatrix
+
+_EMPTY = np.uint32(0xFFFFFFFF)           # firma de una playlist vacía
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+# np.trapezoid existe desde numpy 2.0; antes se llamaba np.trapz
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+
+def item_hashes(items):
+    """Hash uint64 estable de cada ítem (track_id o id entero; usar siempre el mismo tipo)."""
+    return pd.util.hash_array(np.asarray(items, dtype=object))
+
+
+def optimal_bands(threshold, num_perm, fp_weight=0.3):
+    """
+    (bands, rows) con bands·rows = num_perm que minimiza falsos positivos +
+    falsos negativos ponderados alrededor del umbral de Jaccard. Los falsos
+    positivos pesan menos: se descartan al ordenar por Jaccard estimado.
+    """
+    best, best_err = None, np.inf
+    s = np.linspace(0, 1, 201)
+    for b in range(1, num_perm + 1):
+        if num_perm % b:
+            continue
+        r = num_perm // b
+        p = 1 - (1 - s ** r) ** b                # probabilidad de ser candidato
+        fp = _trapezoid(np.where(s < threshold, p, 0), s)
+        fn = _trapezoid(np.where(s >= threshold, 1 - p, 0), s)
+        err = fp_weight * fp + (1 - fp_weight) * fn
+        if err < best_err:
+            best, best_err = (b, r), err
+    return best
+
+
+class MinHashLSH:
+    """Firmas MinHash por playlist + índice LSH por bandas con inserción incremental."""
+
+    def __init__(self, num_perm=128, threshold=0.3, bands=None, seed=1, max_bucket=2000,
+                 chunk_nnz=1 << 17):
+        self.num_perm = num_perm
+        self.threshold = threshold
+        self.bands, self.rows = (bands, num_perm // bands) if bands else optimal_bands(threshold, num_perm)
+        if self.bands * self.rows != num_perm:
+            raise ValueError(f"bands ({self.bands}) debe dividir num_perm ({num_perm})")
+        self.seed = seed
+        self.max_bucket = max_bucket        # buckets más grandes se recortan en la consulta
+        self.chunk_nnz = chunk_nnz
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, 2**63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self._band_salt = rng.integers(0, 2**63, self.bands, dtype=np.uint64)
+        # Tabla de firmas (capacidad que se duplica) y pids
+        self.n = 0
+        self._sig = np.empty((0, num_perm), dtype=np.uint32)
+        self._pids = np.empty(0, dtype=np.int64)
+        self._position = {}
+        # Claves LSH: bloque principal ordenado + delta de altas recientes
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._key_rows = np.empty(0, dtype=np.int32)
+        self._delta_keys, self._delta_rows = [], []
+        self._delta_sorted = None
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return (f"MinHashLSH({self.n} playlists, num_perm={self.num_perm}, "
+                f"{self.bands} bandas × {self.rows}, umbral≈{(1 / self.bands) ** (1 / self.rows):.2f}, "
+                f"{self.memory_bytes() / 1024**2:.1f} MB)")
+
+    @property
+    def pids(self):
+        return self._pids[:self.n]
+
+    @property
+    def signatures(self):
+        return self._sig[:self.n]
+
+    def memory_bytes(self):
+        delta = sum(k.nbytes + r.nbytes for k, r in zip(self._delta_keys, self._delta_rows))
+        return self.signatures.nbytes + self._keys.nbytes + self._key_rows.nbytes + delta
+
+    # --------------------------------------------------------
+    # Firmas
+    # --------------------------------------------------------
+    def signatures_csr(self, indptr, hashes):
+        """
+        Firmas (n, num_perm) uint32 de filas CSR: indptr y el hash uint64 de
+        cada nnz. Por bloques de filas de ~chunk_nnz para acotar la memoria.
+        """
+        indptr = np.asarray(indptr, dtype=np.int64)
+        n_rows = len(indptr) - 1
+        sig = np.full((n_rows, self.num_perm), _EMPTY, dtype=np.uint32)
+        a, b = self._a[:, None], self._b[:, None]
+        start = 0
+        while start < n_rows:
+            stop = int(np.searchsorted(indptr, indptr[start] + self.chunk_nnz, side="right")) - 1
+            stop = min(max(stop, start + 1), n_rows)
+            lo, hi = indptr[start], indptr[stop]
+            lengths = np.diff(indptr[start:stop + 1])
+            nonempty = np.flatnonzero(lengths)
+            if hi > lo:
+                h = ((a * hashes[lo:hi][None, :] + b) >> np.uint64(32)).astype(np.uint32)
+                sig[start + nonempty] = np.minimum.reduceat(h, indptr[start:stop][nonempty] - lo, axis=1).T
+            start = stop
+        return sig
+
+    @staticmethod
+    def _encode_sets(sets, vocab, kind="track"):
+        """track_id → ids del vocabulario (los desconocidos no pueden coincidir con nada: se omiten)."""
+        encoded = [vocab.encode(kind, list(s)) for s in sets]
+        return [ids[ids >= 0].tolist() for ids in encoded]
+
+    def signatures_sets(self, sets, vocab=None, kind="track"):
+        """
+        Firmas de una lista de conjuntos de ítems. Con `vocab`, los ítems son
+        track_id (o URIs) y se codifican como las columnas de la matriz.
+        """
+        if vocab is not None:
+            sets = self._encode_sets(sets, vocab, kind)
+        sets = [list(dict.fromkeys(s)) for s in sets]
+        indptr = np.zeros(len(sets) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in sets], out=indptr[1:])
+        flat = [it for s in sets for it in s]
+        return self.signatures_csr(indptr, item_hashes(flat) if flat else np.empty(0, dtype=np.uint64))
+
+    def _band_keys(self, sig):
+        """(n, bands) claves uint64: cada banda de `rows` valores mezclada con su sal."""
+        bands = sig.reshape(len(sig), self.bands, self.rows).astype(np.uint64)
+        keys = np.broadcast_to(self._band_salt, (len(sig), self.bands)).copy()
+        for j in range(self.rows):
+            keys = (keys ^ bands[:, :, j]) * _MIX
+            keys ^= keys >> np.uint64(29)
+        return keys
+
+    # --------------------------------------------------------
+    # Inserción (streaming)
+    # --------------------------------------------------------
+    def _reserve(self, extra):
+        needed = self.n + extra
+        if needed <= len(self._sig):
+            return
+        capacity = max(needed, 2 * len(self._sig), 1024)
+        sig = np.empty((capacity, self.num_perm), dtype=np.uint32)
+        sig[:self.n] = self.signatures
+        pids = np.empty(capacity, dtype=np.int64)
+        pids[:self.n] = self.pids
+        self._sig, self._pids = sig, pids
+
+    def add_signatures(self, pids, sig):
+        """Agrega firmas ya calculadas (pids nuevos)."""
+        pids = np.asarray(pids, dtype=np.int64)
+        dup = [p for p in pids.tolist() if p in self._position]
+        if dup:
+            raise ValueError(f"pids ya indexados: {dup[:5]}")
+        rows = np.arange(self.n, self.n + len(pids), dtype=np.int32)
+        self._reserve(len(pids))
+        self._sig[rows] = sig
+        self._pids[rows] = pids
+        self._position.update(zip(pids.tolist(), rows.tolist()))
+        self.n += len(pids)
+
+        self._delta_keys.append(self._band_keys(sig).ravel())
+        self._delta_rows.append(np.repeat(rows, self.bands))
+        self._delta_sorted = None
+        if sum(len(k) for k in self._delta_keys) > max(1 << 18, len(self._keys) // 4):
+            self.compact()
+        return len(pids)
+
+    def add_matrix(self, tm, batch_rows=100_000):
+        """Todas las playlists de una TransactionMatrix (columnas = track_id o ids enteros), por bloques."""
+        m = tm.matrix
+        hashes = item_hashes(tm.items)
+        self._reserve(m.shape[0])
+        for start in range(0, m.shape[0], batch_rows):
+            stop = min(start + batch_rows, m.shape[0])
+            indptr = m.indptr[start:stop + 1]
+            sig = self.signatures_csr(indptr - indptr[0], hashes[m.indices[indptr[0]:indptr[-1]]])
+            self.add_signatures(tm.pids[start:stop], sig)
+        return m.shape[0]
+
+    def add_playlists(self, pids, sets, vocab=None, kind="track"):
+        """
+        Nuevas playlists como listas de pistas, con el mismo tipo de ítem que
+        la matriz indexada; si esa usa ids del vocabulario, pasar track_id y vocab=.
+        """
+        return self.add_signatures(pids, self.signatures_sets(sets, vocab, kind))
+
+    def compact(self):
+        """Funde el delta con el bloque principal ordenado."""
+        if not self._delta_keys:
+            return
+        keys = np.concatenate([self._keys] + self._delta_keys)
+        rows = np.concatenate([self._key_rows] + self._delta_rows)
+        order = np.argsort(keys, kind="stable")
+        self._keys, self._key_rows = keys[order], rows[order]
+        self._delta_keys, self._delta_rows, self._delta_sorted = [], [], None
+
+    def _delta(self):
+        if self._delta_sorted is None:
+            if self._delta_keys:
+                keys, rows = np.concatenate(self._delta_keys), np.concatenate(self._delta_rows)
+                order = np.argsort(keys, kind="stable")
+                self._delta_sorted = keys[order], rows[order]
+            else:
+                self._delta_sorted = self._keys[:0], self._key_rows[:0]
+        return self._delta_sorted
+
+    # --------------------------------------------------------
+    # Consultas
+    # --------------------------------------------------------
+    def _candidates(self, keys):
+        """Pares (consulta, fila) que comparten al menos una banda."""
+        q_of = np.repeat(np.arange(len(keys)), self.bands)
+        flat = keys.ravel()
+        out_q, out_rows = [], []
+        for sorted_keys, sorted_rows in ((self._keys, self._key_rows), self._delta()):
+            lo = np.searchsorted(sorted_keys, flat, side="left")
+            hi = np.searchsorted(sorted_keys, flat, side="right")
+            lengths = np.minimum(hi - lo, self.max_bucket)
+            total = int(lengths.sum())
+            if not total:
+                continue
+            offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+            gather = np.repeat(lo, lengths) + np.arange(total) - offsets
+            out_q.append(np.repeat(q_of, lengths))
+            out_rows.append(sorted_rows[gather].astype(np.int64))
+        if not out_q:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        pair = np.unique(np.concatenate(out_q) * max(self.n, 1) + np.concatenate(out_rows))
+        return pair // max(self.n, 1), pair % max(self.n, 1)
+
+    def query_signatures(self, sig, k=10, min_jaccard=0.0, exclude_rows=None):
+        """
+        Top-k por Jaccard estimado (fracción de posiciones iguales de la firma)
+        entre los candidatos LSH. Retorna (consulta, fila, jaccard) ordenado.
+        """
+        q, rows = self._candidates(self._band_keys(sig))
+        if exclude_rows is not None:
+            keep = rows != np.asarray(exclude_rows)[q]
+            q, rows = q[keep], rows[keep]
+        est = np.empty(len(q), dtype=np.float32)
+        for start in range(0, len(q), 1 << 16):    # bloques: (pares × num_perm) comparaciones
+            s = slice(start, start + (1 << 16))
+            est[s] = (self._sig[rows[s]] == sig[q[s]]).mean(axis=1)
+        keep = est >= min_jaccard
+        q, rows, est = q[keep], rows[keep], est[keep]
+        order = np.lexsort((-est, q))
+        q, rows, est = q[order], rows[order], est[order]
+        rank = np.arange(len(q)) - np.searchsorted(q, q)
+        top = rank < k
+        return q[top], rows[top], est[top]
+
+    def similar(self, pids, k=10, min_jaccard=0.0):
+        """Playlists ya indexadas más parecidas a cada pid (sin sí misma)."""
+        pids = np.asarray(pids, dtype=np.int64)
+        rows = np.fromiter((self._position[p] for p in pids.tolist()), dtype=np.int64, count=len(pids))
+        q, r, est = self.query_signatures(self._sig[rows], k, min_jaccard, exclude_rows=rows)
+        return pd.DataFrame({"pid": pids[q], "similar_pid": self._pids[r], "jaccard": est})
+
+    def query(self, sets, k=10, min_jaccard=0.0, vocab=None, kind="track"):
+        """Playlists parecidas a conjuntos de pistas nuevos (no indexados); vocab= como en add_playlists()."""
+        q, r, est = self.query_signatures(self.signatures_sets(sets, vocab, kind), k, min_jaccard)
+        return pd.DataFrame({"query": q, "similar_pid": self._pids[r], "jaccard": est})
+
+    # --------------------------------------------------------
+    # Persistencia
+    # --------------------------------------------------------
+    def save(self, path):
+        self.compact()
+        path = str(path)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, signatures=self.signatures, pids=self.pids, keys=self._keys, key_rows=self._key_rows,
+                 params=np.array([self.num_perm, self.bands, self.seed, self.max_bucket, self.chunk_nnz],
+                                 dtype=np.int64),
+                 threshold=np.array(self.threshold))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            num_perm, bands, seed, max_bucket, chunk_nnz = (int(v) for v in z["params"])
+            lsh = cls(num_perm, float(z["threshold"]), bands=bands, seed=seed,
+                      max_bucket=max_bucket, chunk_nnz=chunk_nnz)
+            lsh._sig, lsh._pids = z["signatures"], z["pids"]
+            lsh._keys, lsh._key_rows = z["keys"], z["key_rows"]
+        lsh.n = len(lsh._pids)
+        lsh._position = dict(zip(lsh._pids.tolist(), range(lsh.n)))
+        return lsh
+
+
+# ------------------------------------------------------------
+# Validación contra Jaccard exacto
+# ------------------------------------------------------------
+def exact_jaccard_topk(tm, rows, k=10, min_jaccard=0.0):
+    """Top-k exacto por Jaccard de esas filas contra toda la matriz (sin sí mismas)."""
+    x = tm.matrix.astype(np.int32)
+    sizes = np.diff(x.indptr)
+    inter = (x[rows] @ x.T).tocoo()
+    jac = inter.data / (sizes[rows][inter.row] + sizes[inter.col] - inter.data)
+    keep = (inter.col != np.asarray(rows)[inter.row]) & (jac >= min_jaccard)
+    q, col, jac = inter.row[keep], inter.col[keep], jac[keep]
+    order = np.lexsort((-jac, q))
+    q, col, jac = q[order], col[order], jac[order]
+    rank = np.arange(len(q)) - np.searchsorted(q, q)
+    return q[rank < k], col[rank < k], jac[rank < k]
+
+
+def evaluate(lsh, tm, n_queries=1000, k=10, min_jaccard=None, seed=0):
+    """
+    recall@k: de los k vecinos exactos con Jaccard >= min_jaccard (por
+    defecto el umbral del índice), cuántos devuelve el LSH. tm debe ser la
+    matriz indexada en lsh.
+    """
+    min_jaccard = lsh.threshold if min_jaccard is None else min_jaccard
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(tm.shape[0], min(n_queries, tm.shape[0]), replace=False))
+    pids = tm.pids[rows]
+
+    t0 = time.perf_counter()
+    approx = lsh.similar(pids, k)
+    elapsed = time.perf_counter() - t0
+    q, col, jac = exact_jaccard_topk(tm, rows, k, min_jaccard)
+
+    exact_pairs = set(zip(pids[q].tolist(), tm.pids[col].tolist()))
+    approx_pairs = set(zip(approx["pid"].tolist(), approx["similar_pid"].tolist()))
+    recall = len(exact_pairs & approx_pairs) / len(exact_pairs) if exact_pairs else float("nan")
+    return {"recall": recall, "exact_pairs": len(exact_pairs), "qps": len(rows) / elapsed,
+            "candidates_per_query": len(approx) / len(rows)}
+
+
+def benchmark(tm, num_perm=128, thresholds=(0.2, 0.3, 0.5), k=10, n_queries=1000):
+    print(f"📊 {tm!r}")
+    print(f"{'umbral':>7} {'bandas':>7} {'build':>8} {'MB':>7} {'recall@k':>9} {'pares':>7} {'QPS':>8}")
+    for t in thresholds:
+        t0 = time.perf_counter()
+        lsh = MinHashLSH(num_perm, threshold=t)
+        lsh.add_matrix(tm)
+        lsh.compact()
+        t_build = time.perf_counter() - t0
+        res = evaluate(lsh, tm, n_queries, k)
+        print(f"{t:>7.2f} {f'{lsh.bands}×{lsh.rows}':>7} {t_build:>7.2f}s {lsh.memory_bytes() / 1024**2:>7.1f} "
+              f"{res['recall']:>9.3f} {res['exact_pairs']:>7} {res['qps']:>8.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MinHash LSH sobre los conjuntos de pistas de cada playlist")
+    parser.add_argument("matrix", nargs="?", default="data/processed_for_modeling/transactions_matrix.npz")
+    parser.add_argument("--challenge", default=None,
+                        help="Construir desde el challenge set (.json) en vez de la matriz")
+    parser.add_argument("--num-perm", type=int, default=128)
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--output", default="data/processed_for_modeling/minhash_lsh.npz")
+    parser.add_argument("--benchmark", action="store_true", help="recall@k contra Jaccard exacto y QPS")
+    args = parser.parse_args()
+
+    if args.challenge:
+        from interactions import Interactions
+        inter = Interactions.from_challenge(args.challenge, min_samples=1)
+        tm = TransactionMatrix.from_interactions(inter)     # ids del vocabulario, como el notebook
+    else:
+        tm = TransactionMatrix.load(args.matrix)
+
+    if args.benchmark:
+        benchmark(tm, args.num_perm, k=10)
+    else:
+        t0 = time.perf_counter()
+        lsh = MinHashLSH(args.num_perm, args.threshold)
+        lsh.add_matrix(tm)
+        lsh.save(args.output)
+        print(f"✅ {lsh!r} → '{args.output}' ({time.perf_counter() - t0:.1f}s)")
@@ -0,0 +1,195 @@
+"""
+parallel_rules.py
+
+Minería de reglas por cluster en paralelo: en vez de recorrer los clusters
+uno tras otro re-filtrando tracks_w_cluster y reconstruyendo el basket de
+cada uno, la matriz de transacciones (CSR) se vuelca una vez a archivos
+.npy que los procesos del pool abren con memory map. Cada tarea recibe solo
+el número de cluster y las filas (posiciones) de sus playlists; nada de
+DataFrames serializados con pickle.
+
+La salida es una única tabla de reglas con la columna `cluster` (y el dict
+{cluster: reglas} que usaba el notebook).
+
+Uso:
+    rules = mine_rules_by_cluster(tm, df_playlist.set_index("pid")["cluster_hybrid"], n_jobs=4)
+
+    python parallel_rules.py transactions_matrix.npz df_playlist_with_clusters.parquet \
+        --cluster-column cluster_hybrid --benchmark
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from transaction_matrix import TransactionMatrix
+from rule_mining import rules_for_cluster
+
+# Arrays compartidos del proceso worker (se abren en el initializer)
+_SHARED = {}
+
+
+def cluster_min_support(n_cluster, n_total, base=0.003, floor=0.0005):
+    """Heurística del notebook: min_support proporcional al tamaño del cluster, con piso."""
+    return max(floor, base * (n_cluster / n_total))
+
+
+# ------------------------------------------------------------
+# 1) Memoria compartida vía memmap
+# ------------------------------------------------------------
+def dump_shared(tm, directory):
+    """Vuelca indptr/indices/items de la CSR a .npy para abrirlos con mmap_mode='r'."""
+    m = tm.matrix
+    np.save(os.path.join(directory, "indptr.npy"), m.indptr)
+    np.save(os.path.join(directory, "indices.npy"), m.indices)
+    items = tm.items.astype(str) if tm.items.dtype == object else tm.items
+    np.save(os.path.join(directory, "items.npy"), items)
+    return directory
+
+
+def _open_shared(directory):
+    for name in ("indptr", "indices", "items"):
+        _SHARED[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+
+def take_rows(indptr, indices, rows):
+    """Sub-CSR (indptr, indices) de esas filas, sin recorrerlas en Python."""
+    starts = np.asarray(indptr[rows], dtype=np.int64)
+    lengths = np.asarray(indptr[rows + 1], dtype=np.int64) - starts
+    new_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_indptr[1:])
+    gather = np.repeat(starts - new_indptr[:-1], lengths) + np.arange(new_indptr[-1])
+    return new_indptr, np.asarray(indices[gather])
+
+
+def _cluster_matrix(rows, pids):
+    indptr, indices = take_rows(_SHARED["indptr"], _SHARED["indices"], rows)
+    n_items = len(_SHARED["items"])
+    m = sp.csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr), shape=(len(rows), n_items))
+    sub = TransactionMatrix(m, pids, np.arange(n_items))
+    # Solo los ítems del cluster; las etiquetas se leen del memmap al final
+    sub = sub.filter_items(1)
+    return TransactionMatrix(sub.matrix, sub.pids, np.asarray(_SHARED["items"][sub.items]))
+
+
+def _mine_one(cluster, rows, pids, n_total, params):
+    t0 = time.perf_counter()
+    tm = _cluster_matrix(rows, pids)
+    kwargs = dict(params)
+    base = kwargs.pop("base_min_support", None)
+    if base is not None:
+        kwargs["min_support"] = cluster_min_support(len(rows), n_total, base)
+    rules = rules_for_cluster(tm, **kwargs)
+    return cluster, rules, time.perf_counter() - t0
+
+
+# ------------------------------------------------------------
+# 2) Driver
+# ------------------------------------------------------------
+def _cluster_tasks(tm, labels):
+    """(cluster, filas de tm, pids) por cluster, de mayor a menor (balanceo del pool)."""
+    labels = pd.Series(labels)
+    if not len(tm.pids) or labels.empty:
+        return []
+    pos = np.searchsorted(tm.pids, labels.index.to_numpy())
+    pos = np.minimum(pos, len(tm.pids) - 1)
+    found = tm.pids[pos] == labels.index.to_numpy()
+    pos, values = pos[found], labels.to_numpy()[found]
+    tasks = []
+    for c in pd.unique(values):
+        rows = np.sort(pos[values == c])
+        tasks.append((c, rows, tm.pids[rows]))
+    tasks.sort(key=lambda t: -len(t[1]))
+    return tasks
+
+
+def mine_rules_by_cluster(tm, labels, n_jobs=None, min_playlists=5, base_min_support=0.003,
+                          min_lift=1.3, top_n=30, verbose=True):
+    """
+    Reglas de cada cluster en un pool de n_jobs procesos (None = todos los núcleos).
+    labels: Series pid → cluster. min_support de cada cluster con cluster_min_support.
+    Retorna (tabla combinada con columna 'cluster', {cluster: reglas}, {cluster: segundos}).
+    """
+    n_jobs = n_jobs or os.cpu_count()
+    tasks = _cluster_tasks(tm, labels)
+    if not tasks:
+        if verbose:
+            print("⚠️ Ningún pid de labels está en la matriz de transacciones; no hay clusters que minar.")
+        return pd.DataFrame(), {}, {}
+    n_total = sum(len(rows) for _, rows, _ in tasks)
+    params = dict(min_playlists=min_playlists, base_min_support=base_min_support,
+                  min_lift=min_lift, top_n=top_n)
+
+    shared_dir = tempfile.mkdtemp(prefix="rules_shm_", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    results, timings = {}, {}
+
+    def collect(c, rules, seconds):
+        results[c], timings[c] = rules, seconds
+        if verbose:
+            print(f"✓ Cluster {c}: {len(rules)} reglas ({seconds:.2f}s)")
+
+    try:
+        dump_shared(tm, shared_dir)
+        if n_jobs == 1:
+            _open_shared(shared_dir)
+            for c, rows, pids in tasks:
+                collect(*_mine_one(c, rows, pids, n_total, params))
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_open_shared,
+                                     initargs=(shared_dir,)) as pool:
+                futures = [pool.submit(_mine_one, c, rows, pids, n_total, params) for c, rows, pids in tasks]
+                for f in as_completed(futures):
+                    collect(*f.result())
+    finally:
+        _SHARED.clear()
+        shutil.rmtree(shared_dir, ignore_errors=True)
+
+    rules_by_cluster = {c: results[c] for c in sorted(results)}
+    frames = [r.assign(cluster=c) for c, r in rules_by_cluster.items() if len(r)]
+    combined = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return combined, rules_by_cluster, timings
+
+
+# ------------------------------------------------------------
+# 3) Benchmark de escalado
+# ------------------------------------------------------------
+def benchmark(tm, labels, max_jobs=None, **kwargs):
+    max_jobs = max_jobs or os.cpu_count()
+    base = None
+    print(f"{'procesos':>9} {'tiempo':>8} {'speedup':>8}")
+    for n_jobs in range(1, max_jobs + 1):
+        t0 = time.perf_counter()
+        combined, _, _ = mine_rules_by_cluster(tm, labels, n_jobs=n_jobs, verbose=False, **kwargs)
+        elapsed = time.perf_counter() - t0
+        base = base or elapsed
+        print(f"{n_jobs:>9} {elapsed:>7.2f}s {base / elapsed:>7.2f}x   ({len(combined)} reglas)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reglas de asociación por cluster en paralelo")
+    parser.add_argument("matrix", nargs="?", default="data/processed_for_modeling/transactions_matrix.npz")
+    parser.add_argument("clusters", nargs="?", default="data/processed_for_modeling/df_playlist_with_clusters.parquet")
+    parser.add_argument("--cluster-column", default="cluster_hybrid")
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--output", default="data/processed_for_modeling/rules_by_cluster.parquet")
+    parser.add_argument("--benchmark", action="store_true", help="Escalado de 1 a --jobs procesos")
+    args = parser.parse_args()
+
+    tm = TransactionMatrix.load(args.matrix)
+    labels = pd.read_parquet(args.clusters, columns=["pid", args.cluster_column]) \
+        .set_index("pid")[args.cluster_column]
+    if args.benchmark:
+        benchmark(tm, labels, args.jobs)
+    else:
+        combined, _, _ = mine_rules_by_cluster(tm, labels, n_jobs=args.jobs)
+        out = combined.assign(antecedents=combined["antecedents"].map(sorted),
+                              consequents=combined["consequents"].map(sorted)) if len(combined) else combined
+        out.to_parquet(args.output, index=False)
+        print(f"✅ {len(combined)} reglas → '{args.output}'")
@@ -0,0 +1,368 @@
+"""
+playlist_profiles.py
+
+Perfil agregado por playlist (df_playlist de preprocessing.ipynb) mantenido
+de forma incremental, en vez de recalcular
+df_processed.groupby("pid").agg(agg_dict) + nunique de track_id + merge del
+nombre cada vez que cambia una playlist.
+
+Por playlist y columna se guardan suma, suma de cuadrados y conteo de
+valores no nulos (la media de pandas ignora NaN), más el número de filas y
+las veces que aparece cada track_id (n_tracks = pistas distintas). Agregar
+o quitar una pista cuesta O(features); la reconstrucción completa ordena
+por pid y reduce por segmentos (np.add.reduceat), sin groupby.
+
+to_frame() devuelve las mismas columnas y en el mismo orden que df_playlist:
+pid, avg_bpm, avg_energy, avg_danceability_ll, avg_loudness, medias del
+resto de columnas numéricas, total_duration_ms, n_tracks, name.
+
+Uso:
+    store = PlaylistProfileStore.build(df_processed)
+    store.add_tracks(df_nuevas_filas)        # filas con pid, track_id, name y features
+    store.remove_tracks(df_filas_quitadas)
+    df_playlist = store.to_frame()
+    store.save("data/processed_for_modeling/playlist_profiles")
+
+    python playlist_profiles.py data/processed_for_modeling/df_processed_full.parquet --check
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+BASIC_AVG = ["bpm", "energy", "danceability_ll", "loudness"]
+DURATION_COL = "duration_ms"
+ID_COLS = ["pid", "track_id"]
+
+
+def notebook_columns(df):
+    """Columnas a promediar en el orden del agg_dict del notebook (celda de df_playlist)."""
+    num_cols = df.select_dtypes("number").columns.difference(ID_COLS + [DURATION_COL] + BASIC_AVG)
+    return BASIC_AVG + list(num_cols)
+
+
+def _segments(keys):
+    """Orden estable por clave, claves únicas y comienzo de cada segmento."""
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    if not len(keys):                   # sin filas: ningún segmento
+        return order, sorted_keys, np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    return order, sorted_keys[starts], starts
+
+
+class PlaylistProfileStore:
+    """Sumas, sumas de cuadrados y conteos por (playlist, columna) con altas/bajas de pistas."""
+
+    def __init__(self, mean_cols, sum_cols=(DURATION_COL,)):
+        self.mean_cols = list(mean_cols)
+        self.sum_cols = list(sum_cols)
+        self.columns = self.mean_cols + self.sum_cols
+        n_feat = len(self.columns)
+        self.pids = np.empty(0, dtype=np.int64)
+        self.sums = np.empty((0, n_feat))
+        self.sq_sums = np.empty((0, n_feat))
+        self.counts = np.empty((0, n_feat), dtype=np.int64)
+        self.n_rows = np.empty(0, dtype=np.int64)
+        self.names = np.empty(0, dtype=object)
+        self._row = {}
+        # Multiplicidad de (playlist, pista): arrays ordenados de la última
+        # reconstrucción + dicts de las playlists tocadas desde entonces
+        self._track_code = {}
+        self._pair_keys = np.empty(0, dtype=np.int64)
+        self._pair_counts = np.empty(0, dtype=np.int64)
+        self._pair_stride = 1
+        self._touched = {}
+        self._n_unique = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return int((self.n_rows > 0).sum())
+
+    def __repr__(self):
+        return f"PlaylistProfileStore({len(self)} playlists, {len(self.columns)} columnas)"
+
+    # --------------------------------------------------------
+    # Reconstrucción completa (vectorizada)
+    # --------------------------------------------------------
+    @classmethod
+    def build(cls, df, mean_cols=None, sum_cols=(DURATION_COL,)):
+        store = cls(notebook_columns(df) if mean_cols is None else mean_cols, sum_cols)
+        store.rebuild(df)
+        return store
+
+    def _values(self, df):
+        return df[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    def rebuild(self, df):
+        pids = df["pid"].to_numpy(dtype=np.int64)
+        order, uniq, starts = _segments(pids)
+        values = self._values(df)[order]
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0.0)
+
+        self.pids = uniq
+        self._row = dict(zip(uniq.tolist(), range(len(uniq))))
+        self.sums = np.add.reduceat(filled, starts, axis=0) if len(uniq) else self.sums[:0]
+        self.sq_sums = np.add.reduceat(filled * filled, starts, axis=0) if len(uniq) else self.sq_sums[:0]
+        self.counts = np.add.reduceat(present.astype(np.int64), starts, axis=0) if len(uniq) else self.counts[:0]
+        self.n_rows = np.diff(np.r_[starts, len(pids)])
+        # Nombre: primera fila de cada playlist (merge + drop_duplicates del notebook)
+        self.names = df["name"].to_numpy(dtype=object)[order[starts]] if "name" in df else \
+            np.full(len(uniq), None, dtype=object)
+
+        # Pistas distintas: pares (fila de playlist, código de pista) ordenados
+        codes, track_ids = pd.factorize(df["track_id"], use_na_sentinel=True)
+        self._track_code = dict(zip(track_ids.tolist(), range(len(track_ids))))
+        row_of = np.repeat(np.arange(len(uniq)), self.n_rows)
+        keys = row_of * (len(track_ids) + 1) + codes[order]
+        keys = keys[codes[order] >= 0]
+        self._pair_keys, self._pair_counts = np.unique(keys, return_counts=True)
+        self._pair_stride = len(track_ids) + 1
+        self._n_unique = np.bincount(self._pair_keys // self._pair_stride, minlength=len(uniq))
+        self._touched = {}
+        return self
+
+    # --------------------------------------------------------
+    # Deltas
+    # --------------------------------------------------------
+    def _ensure_rows(self, pids, names):
+        new = [(p, n) for p, n in zip(pids, names) if p not in self._row]
+        new = list(dict(new).items())
+        if not new:
+            return
+        extra = len(new)
+        start = len(self.pids)
+        self.pids = np.r_[self.pids, [p for p, _ in new]].astype(np.int64)
+        for i, (p, _) in enumerate(new, start=start):
+            self._row[p] = i
+        self.sums = np.vstack([self.sums, np.zeros((extra, len(self.columns)))])
+        self.sq_sums = np.vstack([self.sq_sums, np.zeros((extra, len(self.columns)))])
+        self.counts = np.vstack([self.counts, np.zeros((extra, len(self.columns)), dtype=np.int64)])
+        self.n_rows = np.r_[self.n_rows, np.zeros(extra, dtype=np.int64)]
+        self._n_unique = np.r_[self._n_unique, np.zeros(extra, dtype=np.int64)]
+        self.names = np.r_[self.names, np.array([n for _, n in new], dtype=object)]
+
+    def _track_counter(self, row):
+        """Conteo por pista de una playlist (se materializa la primera vez que se toca)."""
+        counter = self._touched.get(row)
+        if counter is None:
+            lo = np.searchsorted(self._pair_keys, row * self._pair_stride)
+            hi = np.searchsorted(self._pair_keys, (row + 1) * self._pair_stride)
+            codes = (self._pair_keys[lo:hi] % self._pair_stride).tolist()
+            counter = self._touched[row] = dict(zip(codes, self._pair_counts[lo:hi].tolist()))
+        return counter
+
+    def update(self, pids, track_ids, values, names=None, sign=+1):
+        """
+        Delta sin pandas: values (n, len(self.columns)) en el orden de
+        self.columns, sign=+1 alta / -1 baja. O(features) por fila.
+        """
+        pids = np.atleast_1d(np.asarray(pids, dtype=np.int64)).tolist()
+        values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+        names = [None] * len(pids) if names is None else list(names)
+        if sign > 0:
+            self._ensure_rows(pids, names)
+        elif any(p not in self._row for p in pids):
+            raise KeyError("No se pueden quitar pistas de playlists que no están en el store")
+        rows = np.fromiter((self._row[p] for p in pids), dtype=np.int64, count=len(pids))
+
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0.0)
+        np.add.at(self.sums, rows, sign * filled)
+        np.add.at(self.sq_sums, rows, sign * filled * filled)
+        np.add.at(self.counts, rows, sign * present.astype(np.int64))
+        np.add.at(self.n_rows, rows, sign)
+
+        for row, track in zip(rows.tolist(), track_ids):
+            if track is None or track != track:          # NaN: nunique lo ignora
+                continue
+            code = self._track_code.setdefault(track, len(self._track_code))
+            counter = self._track_counter(row)
+            before = counter.get(code, 0)
+            after = before + sign
+            if after < 0:
+                raise ValueError(f"La pista {track!r} no está en la playlist {self.pids[row]}")
+            counter[code] = after
+            self._n_unique[row] += (after > 0) - (before > 0)
+
+    def _apply(self, df, sign):
+        names = df["name"].tolist() if "name" in df else None
+        self.update(df["pid"].to_numpy(), df["track_id"].tolist(), self._values(df), names, sign)
+
+    def add_tracks(self, df):
+        """Suma filas (pid, track_id, name, features) a sus playlists; crea playlists nuevas."""
+        self._apply(df, +1)
+
+    def remove_tracks(self, df):
+        """Resta filas que salieron de sus playlists (mismos valores con los que entraron)."""
+        self._apply(df, -1)
+
+    # --------------------------------------------------------
+    # Salidas
+    # --------------------------------------------------------
+    def means(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.counts > 0, self.sums / self.counts, np.nan)
+
+    def std(self, ddof=1):
+        """Desviación estándar por (playlist, columna) a partir de las sumas de cuadrados."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.sums / self.counts
+            var = (self.sq_sums - self.counts * mean * mean) / (self.counts - ddof)
+        var = np.where(self.counts > ddof, np.maximum(var, 0.0), np.nan)
+        return pd.DataFrame(np.sqrt(var), index=pd.Index(self.pids, name="pid"), columns=self.columns)
+
+    def to_frame(self):
+        """df_playlist: mismas columnas y orden que el notebook, pids ordenados."""
+        alive = np.flatnonzero(self.n_rows > 0)
+        alive = alive[np.argsort(self.pids[alive], kind="stable")]
+        n_mean = len(self.mean_cols)
+        means = self.means()[alive, :n_mean]
+        df = pd.DataFrame(means, columns=self.mean_cols)
+        for j, col in enumerate(self.sum_cols):
+            df[col] = self.sums[alive, n_mean + j]
+        df = df.rename(columns={c: f"avg_{c}" for c in BASIC_AVG} | {DURATION_COL: "total_duration_ms"})
+        df.insert(0, "pid", self.pids[alive])
+        df["n_tracks"] = self._n_unique[alive]
+        df["name"] = self.names[alive]
+        return df
+
+    # --------------------------------------------------------
+    # Persistencia
+    # --------------------------------------------------------
+    def _consolidate_pairs(self):
+        """Vuelve a juntar los conteos de pistas de las playlists tocadas en los arrays ordenados."""
+        if not self._touched:
+            return
+        stride = max(self._pair_stride, len(self._track_code) + 1)
+        rows, codes = np.divmod(self._pair_keys, self._pair_stride)
+        keep = ~np.isin(rows, list(self._touched))
+        keys = [rows[keep] * stride + codes[keep]]
+        counts = [self._pair_counts[keep]]
+        for row, counter in self._touched.items():
+            c = np.fromiter(counter.keys(), dtype=np.int64, count=len(counter))
+            n = np.fromiter(counter.values(), dtype=np.int64, count=len(counter))
+            keys.append(row * stride + c[n > 0])
+            counts.append(n[n > 0])
+        keys, counts = np.concatenate(keys), np.concatenate(counts)
+        order = np.argsort(keys)
+        self._pair_keys, self._pair_counts, self._pair_stride = keys[order], counts[order], stride
+        self._touched = {}
+
+    def save(self, directory):
+        self._consolidate_pairs()
+        directory = str(directory)
+        os.makedirs(directory, exist_ok=True)
+        tracks = np.array(list(self._track_code), dtype=object)
+        np.savez(os.path.join(directory, "profiles.npz"), pids=self.pids, sums=self.sums,
+                 sq_sums=self.sq_sums, counts=self.counts, n_rows=self.n_rows, n_unique=self._n_unique,
+                 pair_keys=self._pair_keys, pair_counts=self._pair_counts,
+                 pair_stride=np.array(self._pair_stride), tracks=tracks.astype(str))
+        pd.DataFrame({"name": self.names}).to_parquet(os.path.join(directory, "names.parquet"))
+        with open(os.path.join(directory, "columns.json"), "w", encoding="utf-8") as f:
+            json.dump({"mean_cols": self.mean_cols, "sum_cols": self.sum_cols}, f, indent=2, ensure_ascii=False)
+        return directory
+
+    @classmethod
+    def load(cls, directory):
+        directory = str(directory)
+        with open(os.path.join(directory, "columns.json"), encoding="utf-8") as f:
+            cols = json.load(f)
+        store = cls(cols["mean_cols"], cols["sum_cols"])
+        with np.load(os.path.join(directory, "profiles.npz"), allow_pickle=False) as z:
+            store.pids, store.sums, store.sq_sums = z["pids"], z["sums"], z["sq_sums"]
+            store.counts, store.n_rows, store._n_unique = z["counts"], z["n_rows"], z["n_unique"]
+            store._pair_keys, store._pair_counts = z["pair_keys"], z["pair_counts"]
+            store._pair_stride = int(z["pair_stride"])
+            store._track_code = dict(zip(z["tracks"].tolist(), range(len(z["tracks"]))))
+        store.names = pd.read_parquet(os.path.join(directory, "names.parquet"))["name"].to_numpy(dtype=object)
+        store._row = dict(zip(store.pids.tolist(), range(len(store.pids))))
+        return store
+
+
+# ------------------------------------------------------------
+# Comparación con la celda del notebook
+# ------------------------------------------------------------
+def notebook_playlist(df_processed):
+    """Lo que hacen las celdas de df_playlist de preprocessing.ipynb (groupby + nunique + merge)."""
+    basic_avg = BASIC_AVG
+    num_cols = df_processed.select_dtypes("number").columns.difference(ID_COLS + [DURATION_COL] + basic_avg)
+    agg_dict = {c: "mean" for c in basic_avg}
+    agg_dict.update({c: "mean" for c in num_cols})
+    agg_dict[DURATION_COL] = "sum"
+    df_playlist = (df_processed.groupby("pid").agg(agg_dict)
+                   .rename(columns={"bpm": "avg_bpm", "energy": "avg_energy",
+                                    "danceability_ll": "avg_danceability_ll", "loudness": "avg_loudness",
+                                    DURATION_COL: "total_duration_ms"})
+                   .reset_index())
+    df_playlist["n_tracks"] = df_processed.groupby("pid")["track_id"].nunique().values
+    df_playlist = df_playlist.merge(df_processed[["pid", "name"]], on="pid", how="left")
+    return df_playlist.drop_duplicates(subset=["pid"]).reset_index(drop=True)
+
+
+def check(df_processed, store=None):
+    """Compara to_frame() con la celda del notebook (columnas, n_tracks, nombres y valores)."""
+    t0 = time.perf_counter()
+    expected = notebook_playlist(df_processed)
+    t_nb = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    store = store or PlaylistProfileStore.build(df_processed)
+    got = store.to_frame()
+    t_store = time.perf_counter() - t0
+
+    assert list(got.columns) == list(expected.columns), "columnas distintas"
+    assert (got["pid"].to_numpy() == expected["pid"].to_numpy()).all()
+    assert (got["n_tracks"].to_numpy() == expected["n_tracks"].to_numpy()).all()
+    assert (got["name"].astype(str).to_numpy() == expected["name"].astype(str).to_numpy()).all()
+    num = [c for c in got.columns if c not in ("pid", "n_tracks", "name")]
+    # pandas promedia las columnas float32 en float32; aquí se acumula en float64
+    np.testing.assert_allclose(got[num].to_numpy(dtype=float), expected[num].to_numpy(dtype=float),
+                               rtol=1e-6, atol=1e-6, equal_nan=True)
+    print(f"✅ Igual a la celda del notebook ({len(got)} playlists × {got.shape[1]} columnas). "
+          f"groupby: {t_nb:.2f}s, reconstrucción por segmentos: {t_store:.2f}s")
+    return store
+
+
+def benchmark(df_processed, n_updates=1000, seed=0):
+    """Latencia de una alta/baja incremental frente a recalcular todo el groupby."""
+    rng = np.random.default_rng(seed)
+    store = PlaylistProfileStore.build(df_processed)
+    rows = df_processed.iloc[rng.choice(len(df_processed), n_updates, replace=False)]
+    pids, tracks, values = rows["pid"].to_numpy(), rows["track_id"].tolist(), store._values(rows)
+    t0 = time.perf_counter()
+    for i in range(n_updates):
+        store.update(pids[i], tracks[i:i + 1], values[i], sign=-1)
+    t_remove = (time.perf_counter() - t0) / n_updates
+    t0 = time.perf_counter()
+    for i in range(n_updates):
+        store.update(pids[i], tracks[i:i + 1], values[i], sign=+1)
+    t_add = (time.perf_counter() - t0) / n_updates
+    t0 = time.perf_counter()
+    notebook_playlist(df_processed)
+    t_full = time.perf_counter() - t0
+    check(df_processed, store)
+    print(f"   alta de una pista: {t_add * 1e3:.3f} ms | baja: {t_remove * 1e3:.3f} ms | "
+          f"recalcular groupby completo: {t_full * 1e3:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perfiles de playlist incrementales (df_playlist)")
+    parser.add_argument("input", nargs="?", default="data/processed_for_modeling/df_processed_full.parquet")
+    parser.add_argument("--output", default="data/processed_for_modeling/playlist_profiles")
+    parser.add_argument("--check", action="store_true", help="Comparar con el groupby del notebook")
+    parser.add_argument("--benchmark", action="store_true", help="Altas/bajas incrementales vs. recalcular")
+    args = parser.parse_args()
+
+    df = pd.read_parquet(args.input)
+    if args.benchmark:
+        benchmark(df)
+    elif args.check:
+        check(df)
+    else:
+        store = PlaylistProfileStore.build(df)
+        store.save(args.output)
+        print(f"✅ {store!r} → '{args.output}'")
@@ -0,0 +1,370 @@
+"""
+rule_mining.py
+
+Minería de ítems frecuentes y reglas de asociación directamente sobre la
+matriz de transacciones dispersa (transaction_matrix.py), sin construir el
+basket denso `pivot_table` de cada cluster que rules_for_cluster pasaba a
+mlxtend (con min_support bajo esa matriz crece como playlists × pistas).
+
+  - Pares (max_len=2): co-ocurrencias con una sola multiplicación dispersa
+    XᵀX sobre los ítems frecuentes, filtradas por soporte; las reglas y sus
+    métricas se calculan vectorizadas.
+  - Itemsets más largos: FP-tree (FP-Growth clásico con árbol condicional).
+
+La salida reproduce la de mlxtend: `frequent_itemsets` = fpgrowth
+(columnas support / itemsets con frozensets) y `association_rules` /
+`pair_rules` = association_rules (antecedents, consequents y las mismas
+columnas de métricas), con los mismos umbrales (conteo mínimo
+ceil(min_support · n) y soporte ≥ min_support).
+
+Uso:
+    from rule_mining import rules_for_cluster
+    rules = rules_for_cluster(subset, min_support=0.003, min_lift=1.3, top_n=30)
+
+    python rule_mining.py data/processed_for_modeling/transactions_matrix.npz --check
+"""
+
+import math
+import time
+import argparse
+from collections import defaultdict
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from transaction_matrix import TransactionMatrix
+
+# Columnas de association_rules de mlxtend, en el mismo orden
+METRICS = [
+    "antecedent support", "consequent support", "support", "confidence", "lift",
+    "representativity", "leverage", "conviction", "zhangs_metric", "jaccard",
+    "certainty", "kulczynski",
+]
+
+
+def _as_matrix(data):
+    """TransactionMatrix a partir de una TransactionMatrix, un DataFrame de bools o listas de ítems."""
+    if isinstance(data, TransactionMatrix):
+        return data
+    if isinstance(data, pd.DataFrame):
+        if all(isinstance(t, pd.SparseDtype) for t in data.dtypes):
+            m = data.sparse.to_coo()
+        else:
+            m = sp.csr_matrix(data.to_numpy(dtype=bool))
+        return TransactionMatrix(sp.csr_matrix(m, dtype=bool), data.index.to_numpy(), data.columns.to_numpy())
+    pairs = [(i, item) for i, items in enumerate(data) for item in items]
+    tm = TransactionMatrix.from_pairs([p for p, _ in pairs], [it for _, it in pairs])
+    if tm.shape[0] < len(data):     # transacciones vacías también cuentan en n
+        m = sp.csr_matrix((tm.matrix.data, tm.matrix.indices,
+                           np.r_[tm.matrix.indptr, np.full(len(data) - tm.shape[0], tm.nnz)]),
+                          shape=(len(data), tm.shape[1]))
+        tm = TransactionMatrix(m, np.arange(len(data)), tm.items)
+    return tm
+
+
+def _min_count(min_support, n):
+    """Conteo mínimo que usa mlxtend: ceil(min_support · n)."""
+    return math.ceil(min_support * n)
+
+
+def _frequent_items(tm, min_support):
+    n = tm.shape[0]
+    counts = tm.item_counts()
+    keep = np.flatnonzero((counts / float(n) >= min_support) & (counts >= _min_count(min_support, n)))
+    return keep, counts
+
+
+# ------------------------------------------------------------
+# 1) Pares: XᵀX disperso
+# ------------------------------------------------------------
+def frequent_pairs(tm, min_support):
+    """
+    Ítems y pares frecuentes.
+    Retorna (items, item_counts, i, j, pair_counts) con i < j índices de columna de tm.
+    """
+    n = tm.shape[0]
+    items, counts = _frequent_items(tm, min_support)
+    x = tm.csc()[:, items].astype(np.int32)
+    co = sp.triu(x.T @ x, k=1).tocoo()
+    ok = (co.data >= _min_count(min_support, n)) & (co.data / float(n) >= min_support)
+    return items, counts[items], items[co.row[ok]], items[co.col[ok]], co.data[ok]
+
+
+# ------------------------------------------------------------
+# 2) FP-tree para itemsets de cualquier largo
+# ------------------------------------------------------------
+class _Node:
+    __slots__ = ("item", "count", "parent", "children")
+
+    def __init__(self, item, parent):
+        self.item = item
+        self.count = 0
+        self.parent = parent
+        self.children = {}
+
+
+class FPTree:
+    """Árbol de prefijos con tabla de cabecera ítem → nodos."""
+
+    def __init__(self):
+        self.root = _Node(None, None)
+        self.header = defaultdict(list)
+
+    def insert(self, items, count=1):
+        """`items` ya ordenados por frecuencia global descendente."""
+        node = self.root
+        for item in items:
+            child = node.children.get(item)
+            if child is None:
+                child = node.children[item] = _Node(item, node)
+                self.header[item].append(child)
+            child.count += count
+            node = child
+
+    def item_count(self, item):
+        return sum(node.count for node in self.header[item])
+
+    def prefix_paths(self, item):
+        """Base de patrones condicional de `item`: (camino desde la raíz, conteo)."""
+        for node in self.header[item]:
+            path = []
+            parent = node.parent
+            while parent.item is not None:
+                path.append(parent.item)
+                parent = parent.parent
+            if path:
+                yield path[::-1], node.count
+
+    def conditional_tree(self, item, min_count):
+        paths = list(self.prefix_paths(item))
+        counts = defaultdict(int)
+        for path, c in paths:
+            for it in path:
+                counts[it] += c
+        tree = FPTree()
+        for path, c in paths:
+            kept = [it for it in path if counts[it] >= min_count]
+            if kept:
+                tree.insert(kept, c)
+        return tree
+
+
+def _fp_growth(tree, suffix, min_count, max_len, out):
+    # Del ítem menos frecuente al más frecuente (rango mayor primero)
+    for item in sorted(tree.header, reverse=True):
+        count = tree.item_count(item)
+        if count < min_count:
+            continue
+        itemset = suffix + (item,)
+        out.append((itemset, count))
+        if max_len is not None and len(itemset) >= max_len:
+            continue
+        cond = tree.conditional_tree(item, min_count)
+        if cond.header:
+            _fp_growth(cond, itemset, min_count, max_len, out)
+
+
+def fp_growth(tm, min_support, max_len=None):
+    """Lista de (tupla de columnas de tm, conteo) de los itemsets frecuentes."""
+    n = tm.shape[0]
+    items, counts = _frequent_items(tm, min_support)
+    # rango 0 = ítem más frecuente; las transacciones se insertan en orden de rango
+    order = items[np.argsort(-counts[items], kind="stable")]
+    rank = np.full(tm.shape[1], -1, dtype=np.int64)
+    rank[order] = np.arange(len(order))
+
+    tree = FPTree()
+    m = tm.matrix
+    for r in range(m.shape[0]):
+        ranks = rank[m.indices[m.indptr[r]:m.indptr[r + 1]]]
+        ranks = np.sort(ranks[ranks >= 0])
+        if len(ranks):
+            tree.insert(ranks.tolist())
+
+    out = []
+    _fp_growth(tree, (), _min_count(min_support, n), max_len, out)
+    return [(tuple(int(order[r]) for r in itemset), c) for itemset, c in out
+            if c / float(n) >= min_support]
+
+
+# ------------------------------------------------------------
+# 3) Interfaz tipo mlxtend
+# ------------------------------------------------------------
+def frequent_itemsets(data, min_support=0.5, use_colnames=False, max_len=None):
+    """Equivalente a mlxtend fpgrowth: DataFrame con columnas support e itemsets (frozenset)."""
+    tm = _as_matrix(data)
+    n = float(tm.shape[0])
+    labels = tm.items.tolist() if use_colnames else list(range(tm.shape[1]))
+    if max_len is not None and max_len <= 2:
+        items, item_counts, i, j, pair_counts = frequent_pairs(tm, min_support)
+        sets = [frozenset((labels[a],)) for a in items]
+        counts = list(item_counts)
+        if max_len == 2:
+            sets += [frozenset((labels[a], labels[b])) for a, b in zip(i, j)]
+            counts += list(pair_counts)
+    else:
+        found = fp_growth(tm, min_support, max_len)
+        sets = [frozenset(labels[a] for a in itemset) for itemset, _ in found]
+        counts = [c for _, c in found]
+    return pd.DataFrame({"support": np.asarray(counts, dtype=float) / n, "itemsets": sets})
+
+
+def _rule_metrics(sAC, sA, sC):
+    """Mismas fórmulas que mlxtend.association_rules (sin valores nulos)."""
+    conf = sAC / sA
+    lift = conf / sC
+    leverage = sAC - sA * sC
+    conviction = np.full(conf.shape, np.inf)
+    conviction[conf < 1.0] = (1.0 - sC[conf < 1.0]) / (1.0 - conf[conf < 1.0])
+    denom = np.maximum(sAC * (1 - sA), sA * (sC - sAC))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zhang = np.where(denom == 0, 0, leverage / denom)
+        certainty = np.where(1 - sC == 0, 0, (conf - sC) / (1 - sC))
+    return {
+        "antecedent support": sA, "consequent support": sC, "support": sAC,
+        "confidence": conf, "lift": lift, "representativity": np.ones_like(sAC),
+        "leverage": leverage, "conviction": conviction, "zhangs_metric": zhang,
+        "jaccard": sAC / (sA + sC - sAC), "certainty": certainty,
+        "kulczynski": (sAC / sA + sAC / sC) / 2,
+    }
+
+
+def _rules_frame(antecedents, consequents, metrics, keep):
+    """DataFrame de reglas con las filas `keep` (antecedentes/consecuentes ya filtrados)."""
+    rules = pd.DataFrame({"antecedents": antecedents, "consequents": consequents})
+    for name in METRICS:
+        rules[name] = metrics[name][keep]
+    return rules
+
+
+def association_rules(itemsets, metric="confidence", min_threshold=0.8):
+    """Equivalente a mlxtend association_rules sobre la salida de frequent_itemsets."""
+    if not len(itemsets):
+        raise ValueError("El DataFrame de itemsets frecuentes está vacío.")
+    support = dict(zip(itemsets["itemsets"], itemsets["support"]))
+    antecedents, consequents, s = [], [], []
+    for k, sAC in support.items():
+        for size in range(len(k) - 1, 0, -1):
+            for c in combinations(k, size):
+                a = frozenset(c)
+                antecedents.append(a)
+                consequents.append(k - a)
+                s.append((sAC, support[a], support[k - a]))
+    if not s:
+        return pd.DataFrame(columns=["antecedents", "consequents"] + METRICS)
+    sAC, sA, sC = np.array(s, dtype=float).T
+    metrics = _rule_metrics(sAC, sA, sC)
+    keep = np.flatnonzero(metrics[metric] >= min_threshold)
+    return _rules_frame([antecedents[k] for k in keep], [consequents[k] for k in keep], metrics, keep)
+
+
+def pair_rules(data, min_support, metric="lift", min_threshold=1.0):
+    """
+    Reglas A → B entre pares frecuentes, vectorizadas desde XᵀX. Igual a
+    association_rules(frequent_itemsets(data, min_support, use_colnames=True, max_len=2), ...).
+    """
+    tm = _as_matrix(data)
+    n = float(tm.shape[0])
+    items, item_counts, i, j, pair_counts = frequent_pairs(tm, min_support)
+    count = np.zeros(tm.shape[1])
+    count[items] = item_counts
+    ant = np.concatenate([i, j])       # ambas direcciones de cada par
+    con = np.concatenate([j, i])
+    sAC = np.concatenate([pair_counts, pair_counts]) / n
+    metrics = _rule_metrics(sAC, count[ant] / n, count[con] / n)
+    keep = np.flatnonzero(metrics[metric] >= min_threshold)
+    labels = tm.items
+    return _rules_frame([frozenset((x,)) for x in labels[ant[keep]].tolist()],
+                        [frozenset((x,)) for x in labels[con[keep]].tolist()], metrics, keep)
+
+
+def rules_for_cluster(df_cluster, min_playlists=5, min_support=0.0005, min_lift=1.2, top_n=25,
+                      item_col="track_id"):
+    """
+    Misma lógica que rules_for_cluster de associationRules&Clustering.ipynb
+    (soporte absoluto mínimo, pares, lift, confidence < 0.95, top por lift),
+    sobre la matriz dispersa. df_cluster: DataFrame con pid/item_col o TransactionMatrix.
+    """
+    tm = df_cluster if isinstance(df_cluster, TransactionMatrix) else \
+        TransactionMatrix.from_frame(df_cluster, row="pid", col=item_col)
+    n_play = tm.shape[0]
+    abs_sup = max(min_playlists, int(min_support * n_play))
+    rel_sup = abs_sup / n_play
+
+    # Mantén solo ítems que superan el soporte absoluto
+    tm = tm.filter_items(abs_sup)
+    if tm.shape[1] < 2:       # no hay pares posibles
+        return pd.DataFrame()
+
+    rules = pair_rules(tm, rel_sup, metric="lift", min_threshold=min_lift)
+    if rules.empty:
+        return rules
+    rules = (rules.query('confidence < 0.95')        # filtra reglas “perfectas”
+             .sort_values('lift', ascending=False)
+             .head(top_n))
+    return rules.reset_index(drop=True)
+
+
+# ------------------------------------------------------------
+# Comparación con mlxtend
+# ------------------------------------------------------------
+def _rule_key(rules):
+    return rules.assign(
+        a=rules["antecedents"].map(lambda s: tuple(sorted(map(str, s)))),
+        c=rules["consequents"].map(lambda s: tuple(sorted(map(str, s)))),
+    ).set_index(["a", "c"])[METRICS].sort_index()
+
+
+def check_against_mlxtend(tm, min_support, max_len=2, min_lift=1.0):
+    """Compara itemsets y reglas con mlxtend sobre la misma entrada; imprime tiempos."""
+    from mlxtend.frequent_patterns import fpgrowth, association_rules as mlx_rules
+
+    basket = tm.to_sparse_frame()
+
+    t0 = time.perf_counter()
+    ref = fpgrowth(basket, min_support=min_support, use_colnames=True, max_len=max_len)
+    ref_rules = mlx_rules(ref, metric="lift", min_threshold=min_lift) if len(ref) else None
+    t_ref = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    own = frequent_itemsets(tm, min_support=min_support, use_colnames=True, max_len=max_len)
+    own_rules = association_rules(own, metric="lift", min_threshold=min_lift) if len(own) else None
+    t_own = time.perf_counter() - t0
+
+    a = ref.assign(k=ref["itemsets"].map(lambda s: tuple(sorted(map(str, s))))).set_index("k")["support"]
+    b = own.assign(k=own["itemsets"].map(lambda s: tuple(sorted(map(str, s))))).set_index("k")["support"]
+    assert a.sort_index().index.equals(b.sort_index().index), "itemsets distintos"
+    assert np.allclose(a.sort_index(), b.sort_index())
+    if ref_rules is not None:
+        r, o = _rule_key(ref_rules), _rule_key(own_rules)
+        assert r.index.equals(o.index), "reglas distintas"
+        if len(r):
+            assert np.allclose(r.to_numpy(dtype=float), o.to_numpy(dtype=float), equal_nan=True)
+    if max_len == 2 and len(own):
+        p = _rule_key(pair_rules(tm, min_support, "lift", min_lift))
+        assert p.index.equals(_rule_key(own_rules).index)
+
+    print(f"✓ min_support={min_support} max_len={max_len}: {len(own)} itemsets, "
+          f"{0 if own_rules is None else len(own_rules)} reglas idénticas a mlxtend "
+          f"(mlxtend {t_ref:.2f}s · disperso {t_own:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minería de reglas sobre la matriz de transacciones dispersa")
+    parser.add_argument("matrix", nargs="?", default="data/processed_for_modeling/transactions_matrix.npz")
+    parser.add_argument("--min-support", type=float, default=0.005)
+    parser.add_argument("--min-lift", type=float, default=1.2)
+    parser.add_argument("--max-len", type=int, default=2)
+    parser.add_argument("--check", action="store_true", help="Compara la salida con mlxtend")
+    args = parser.parse_args()
+
+    tm = TransactionMatrix.load(args.matrix)
+    if args.check:
+        check_against_mlxtend(tm, args.min_support, args.max_len, args.min_lift)
+    else:
+        t0 = time.perf_counter()
+        itemsets = frequent_itemsets(tm, args.min_support, use_colnames=True, max_len=args.max_len)
+        rules = association_rules(itemsets, metric="lift", min_threshold=args.min_lift) if len(itemsets) else []
+        print(f"✅ {len(itemsets)} itemsets, {len(rules)} reglas ({time.perf_counter() - t0:.2f}s)")
@@ -0,0 +1,380 @@
+"""
+streaming_clustering.py
+
+Modo incremental del clustering híbrido HDBSCAN + K-Means de
+associationRules&Clustering.ipynb ("CLUSTERING HÍBRIDO HDBSCAN + K-MEANS"):
+mismo modelo (RobustScaler → HDBSCAN marca outliers → K-Means sobre los
+inliers, outliers = etiqueta n_clusters), pero sin re-ajustar todo con
+cada lote de playlists nuevas.
+
+  - predict(): outlier aproximado estilo approximate_predict de hdbscan
+    (distancia de alcanzabilidad mutua al vecino más cercano del conjunto
+    de referencia de HDBSCAN vs. la densidad de su cluster) y, si no es
+    outlier, el centroide K-Means más cercano. Todo vectorizado por lote.
+  - partial_fit(): actualiza los centroides con la regla de MiniBatchKMeans
+    (paso 1/conteo por centroide) y guarda una muestra reservoir de
+    las playlists vistas.
+  - refit(): re-ajuste completo (HDBSCAN + K-Means) sobre la muestra, en
+    un hilo aparte si background=True; el modelo nuevo reemplaza al viejo
+    de forma atómica. Los centroides nuevos se emparejan con los viejos
+    (algoritmo húngaro) para que las etiquetas conserven su id entre
+    versiones.
+
+Uso:
+    model = HybridClusterer(n_clusters=6, min_cluster_size=20).fit(playlist_umap)
+    df_playlist["cluster_hybrid"] = model.labels_
+    model.predict(new_playlists_umap)                     # etiquetas 0..5, outliers = 6
+    model.partial_fit(new_playlists_umap)                 # centroides + muestra
+    model.refit(background=True)                          # versión nueva, mismos ids
+    model.save("data/processed_for_modeling/hybrid_clusterer.joblib")
+
+    python streaming_clustering.py data/processed_for_modeling/playlist_umap_embedding.parquet --benchmark
+"""
+
+import time
+import argparse
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+from sklearn.cluster import HDBSCAN, KMeans
+from sklearn.neighbors import KDTree
+from sklearn.preprocessing import RobustScaler
+
+
+class _FittedState:
+    """Un ajuste completo: escalador, referencia de HDBSCAN y centroides K-Means."""
+
+    def __init__(self, scaler, reference, core, ref_cluster, cluster_reach, centroids, counts):
+        self.scaler = scaler
+        self.reference = reference            # puntos (escalados) sobre los que corrió HDBSCAN
+        self.tree = KDTree(reference)
+        self.core = core                      # distancia de núcleo de cada punto de referencia
+        self.ref_cluster = ref_cluster        # etiqueta HDBSCAN de cada punto (-1 = ruido)
+        self.cluster_reach = cluster_reach    # alcanzabilidad máxima admitida por cluster HDBSCAN
+        self.centroids = centroids            # (n_clusters, d) en el espacio escalado
+        self.counts = counts                  # puntos acumulados por centroide
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["tree"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.tree = KDTree(self.reference)
+
+
+class HybridClusterer:
+    """HDBSCAN (outliers) + K-Means (inliers) con partial_fit/predict y re-ajustes con ids estables."""
+
+    def __init__(self, n_clusters=6, min_cluster_size=20, min_samples=10, cluster_selection_epsilon=0.5,
+                 hdbscan_sample=100_000, reservoir_size=200_000, refit_every=None, n_init=10,
+                 random_state=42):
+        self.n_clusters = n_clusters
+        self.min_cluster_size = min_cluster_size
+        self.min_samples = min_samples
+        self.cluster_selection_epsilon = cluster_selection_epsilon
+        self.hdbscan_sample = hdbscan_sample      # HDBSCAN corre sobre a lo sumo tantas filas
+        self.reservoir_size = reservoir_size      # muestra de lo visto, para los re-ajustes
+        self.refit_every = refit_every            # re-ajuste en segundo plano cada N filas nuevas
+        self.n_init = n_init
+        self.random_state = random_state
+        self.outlier_label = n_clusters           # como final_labels del notebook
+        self.version = 0
+        self._lock = threading.Lock()
+        self._refit_thread = None
+
+    def __repr__(self):
+        if not hasattr(self, "_state"):
+            return f"HybridClusterer(k={self.n_clusters}, sin ajustar)"
+        return (f"HybridClusterer(k={self.n_clusters}, v{self.version}, "
+                f"{len(self._state.reference):,} puntos de referencia, {self.n_seen_:,} vistos)")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lock"], state["_refit_thread"] = None, None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _matrix(self, X):
+        if isinstance(X, pd.DataFrame):
+            if not hasattr(self, "feature_columns_"):
+                self.feature_columns_ = X.select_dtypes(include=np.number).columns.tolist()
+            X = X[self.feature_columns_]
+        return np.asarray(X, dtype=np.float64)
+
+    # --------------------------------------------------------
+    # Ajuste completo
+    # --------------------------------------------------------
+    def _fit_state(self, X, rng):
+        scaler = RobustScaler().fit(X)
+        Xs = scaler.transform(X)
+        sample = Xs if len(Xs) <= self.hdbscan_sample else Xs[rng.choice(len(Xs), self.hdbscan_sample, replace=False)]
+        ref_cluster = HDBSCAN(min_cluster_size=self.min_cluster_size, min_samples=self.min_samples,
+                              cluster_selection_epsilon=self.cluster_selection_epsilon,
+                              metric="euclidean").fit_predict(sample)
+        # min_samples incluye al propio punto (convención de HDBSCAN)
+        core = KDTree(sample).query(sample, k=min(self.min_samples, len(sample)))[0][:, -1]
+        n_hdb = ref_cluster.max() + 1
+        cluster_reach = np.full(max(n_hdb, 0), self.cluster_selection_epsilon)
+        if n_hdb > 0:
+            members = ref_cluster >= 0
+            np.maximum.at(cluster_reach, ref_cluster[members], core[members])
+
+        state = _FittedState(scaler, sample, core, ref_cluster, cluster_reach, None, None)
+        inliers = Xs[~self._outliers(state, Xs)[0]]
+        if len(inliers) < self.n_clusters:
+            raise ValueError(f"Solo {len(inliers)} inliers para {self.n_clusters} clusters")
+        km = KMeans(n_clusters=self.n_clusters, n_init=self.n_init,
+                    random_state=self.random_state).fit(inliers)
+        state.centroids = km.cluster_centers_
+        state.counts = np.bincount(km.labels_, minlength=self.n_clusters).astype(np.float64)
+        return state
+
+    def fit(self, X):
+        X = self._matrix(X)
+        rng = np.random.default_rng(self.random_state)
+        self._state = self._fit_state(X, rng)
+        self.labels_ = self.predict(X)
+        self.n_seen_ = len(X)
+        self._since_refit = 0
+        self._reservoir = X[rng.choice(len(X), min(len(X), self.reservoir_size), replace=False)]
+        self._rng = rng
+        self.version = 1
+        return self
+
+    # --------------------------------------------------------
+    # Predicción aproximada
+    # --------------------------------------------------------
+    def _outliers(self, state, Xs):
+        """
+        (máscara de outliers, score) estilo approximate_predict: alcanzabilidad
+        mutua max(núcleo(x), núcleo(r), d(x, r)) al vecino r más cercano;
+        outlier si r es ruido o si supera la alcanzabilidad admitida por el
+        cluster de r. score > 1 ⇔ outlier.
+        """
+        k = min(max(self.min_samples - 1, 1), len(state.reference))
+        dist, ind = state.tree.query(Xs, k=k)
+        nearest = ind[:, 0]
+        reach = np.maximum.reduce([dist[:, -1], dist[:, 0], state.core[nearest]])
+        cluster = state.ref_cluster[nearest]
+        limit = np.where(cluster >= 0, state.cluster_reach[np.maximum(cluster, 0)], 0.0)
+        score = np.where(cluster >= 0, reach / np.maximum(limit, 1e-12), np.inf)
+        return score > 1.0, score
+
+    @staticmethod
+    def _nearest_centroid(state, Xs):
+        d2 = (Xs ** 2).sum(axis=1)[:, None] - 2 * Xs @ state.centroids.T + (state.centroids ** 2).sum(axis=1)
+        return d2.argmin(axis=1)
+
+    def approximate_predict(self, X):
+        """(etiquetas, score de outlier) para un lote; outliers → outlier_label."""
+        state = self._state                   # referencia local: un refit puede cambiarla
+        Xs = state.scaler.transform(self._matrix(X))
+        outlier, score = self._outliers(state, Xs)
+        labels = self._nearest_centroid(state, Xs)
+        labels[outlier] = self.outlier_label
+        return labels, score
+
+    def predict(self, X):
+        return self.approximate_predict(X)[0]
+
+    # --------------------------------------------------------
+    # Actualización incremental
+    # --------------------------------------------------------
+    def partial_fit(self, X):
+        """Centroides con la regla de MiniBatchKMeans + muestra reservoir; ajusta si es el primer lote."""
+        X = self._matrix(X)
+        if not hasattr(self, "_state"):
+            return self.fit(X)
+        with self._lock:
+            state = self._state
+            Xs = state.scaler.transform(X)
+            outlier, _ = self._outliers(state, Xs)
+            inliers = Xs[~outlier]
+            labels = self._nearest_centroid(state, inliers)
+            n_b = np.bincount(labels, minlength=self.n_clusters).astype(np.float64)
+            sums = np.zeros_like(state.centroids)
+            np.add.at(sums, labels, inliers)
+            hit = n_b > 0
+            counts = state.counts + n_b
+            # c ← c + (media del lote − c) · n_b / (conteo + n_b)
+            state.centroids[hit] += (sums[hit] - n_b[hit, None] * state.centroids[hit]) / counts[hit, None]
+            state.counts = counts
+            self._reservoir_add(X)
+            self.n_seen_ += len(X)
+            self._since_refit += len(X)
+        if self.refit_every and self._since_refit >= self.refit_every and not self.refitting:
+            self.refit(background=True)
+        return self
+
+    def _reservoir_add(self, X):
+        """Muestreo reservoir (algoritmo R) por lote."""
+        room = self.reservoir_size - len(self._reservoir)
+        if room > 0:
+            self._reservoir = np.vstack([self._reservoir, X[:room]])
+            X, start = X[room:], self.n_seen_ + room
+        else:
+            start = self.n_seen_
+        if not len(X):
+            return
+        slots = (self._rng.random(len(X)) * (start + np.arange(1, len(X) + 1))).astype(np.int64)
+        keep = slots < self.reservoir_size
+        self._reservoir[slots[keep]] = X[keep]      # en orden: el último que cae en un hueco gana
+
+    # --------------------------------------------------------
+    # Re-ajuste con ids estables
+    # --------------------------------------------------------
+    @property
+    def refitting(self):
+        return self._refit_thread is not None and self._refit_thread.is_alive()
+
+    def _align(self, old, new):
+        """Permuta los centroides nuevos para que cada uno herede el id del viejo más cercano."""
+        old_c = old.scaler.inverse_transform(old.centroids)
+        new_c = new.scaler.inverse_transform(new.centroids)
+        scale = new.scaler.scale_
+        cost = (((old_c[:, None, :] - new_c[None, :, :]) / scale) ** 2).sum(axis=2)
+        old_idx, new_idx = linear_sum_assignment(cost)
+        perm = np.empty(self.n_clusters, dtype=np.int64)
+        perm[old_idx] = new_idx
+        new.centroids, new.counts = new.centroids[perm], new.counts[perm]
+        return new
+
+    def _refit(self, X):
+        rng = np.random.default_rng(self.random_state + self.version)
+        new = self._fit_state(X, rng)
+        with self._lock:
+            self._state = self._align(self._state, new)
+            self._since_refit = 0
+            self.version += 1
+
+    def refit(self, X=None, background=False):
+        """
+        Ajuste completo sobre X (o la muestra reservoir). Con background=True
+        corre en un hilo y predict() sigue usando la versión anterior hasta el cambio.
+        """
+        X = self._reservoir.copy() if X is None else self._matrix(X)
+        if not background:
+            self._refit(X)
+            return self
+        self._refit_thread = threading.Thread(target=self._refit, args=(X,), daemon=True)
+        self._refit_thread.start()
+        return self._refit_thread
+
+    def wait(self):
+        """Espera al re-ajuste en segundo plano, si hay uno."""
+        if self._refit_thread is not None:
+            self._refit_thread.join()
+        return self
+
+    # --------------------------------------------------------
+    # Persistencia
+    # --------------------------------------------------------
+    def save(self, path):
+        self.wait()
+        joblib.dump(self, path)
+        return path
+
+    @staticmethod
+    def load(path):
+        return joblib.load(path)
+
+
+def evaluate(X, n_clusters=6, train_frac=0.8, batch_size=1000, seed=0, **kwargs):
+    """
+    Ajuste sobre train_frac de las filas y predicción por lotes del resto vs.
+    el ajuste completo del notebook sobre todas: acuerdo de outliers, ARI de
+    los inliers y latencia por lote.
+    """
+    from sklearn.metrics import adjusted_rand_score
+
+    X = np.asarray(X, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    perm = rng.permutation(len(X))
+    n_train = int(train_frac * len(X))
+    train, test = perm[:n_train], perm[n_train:]
+
+    t0 = time.perf_counter()
+    full = HybridClusterer(n_clusters, **kwargs)
+    full_labels = full.fit(X).labels_
+    t_full = time.perf_counter() - t0
+
+    model = HybridClusterer(n_clusters, **kwargs).fit(X[train])
+    t0 = time.perf_counter()
+    pred = np.concatenate([model.predict(X[test[s:s + batch_size]]) for s in range(0, len(test), batch_size)])
+    t_pred = time.perf_counter() - t0
+
+    # Training: approximate_predict vs. la etiqueta HDBSCAN sobre los mismos puntos
+    ref_outlier = model._state.ref_cluster < 0
+    train_outlier = model.labels_ == model.outlier_label
+    both_in = (pred != model.outlier_label) & (full_labels[test] != full.outlier_label)
+    report = {
+        "outliers_train_acuerdo": float(np.mean(train_outlier == ref_outlier)) if len(ref_outlier) == n_train else np.nan,
+        "outliers_test_acuerdo": float(np.mean((pred == model.outlier_label) == (full_labels[test] == full.outlier_label))),
+        "ari_inliers_test": float(adjusted_rand_score(full_labels[test][both_in], pred[both_in])),
+        "ajuste_completo_s": t_full,
+        "ms_por_lote": t_pred / max(1, -(-len(test) // batch_size)) * 1000,
+        "us_por_fila": t_pred / max(len(test), 1) * 1e6,
+    }
+    return pd.Series(report).round(4)
+
+
+def benchmark(X, n_clusters=6, batch_size=1000, **kwargs):
+    """Re-ajuste completo por lote nuevo (como el notebook) vs. partial_fit + predict."""
+    X = np.asarray(X, dtype=np.float64)
+    half = len(X) // 2
+    model = HybridClusterer(n_clusters, **kwargs).fit(X[:half])
+    t0 = time.perf_counter()
+    for s in range(half, len(X), batch_size):
+        batch = X[s:s + batch_size]
+        model.partial_fit(batch)
+        model.predict(batch)
+    t_stream = time.perf_counter() - t0
+    n_batches = -(-(len(X) - half) // batch_size)
+
+    t0 = time.perf_counter()
+    HybridClusterer(n_clusters, **kwargs).fit(X)
+    t_refit = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    model.refit()
+    t_reservoir = time.perf_counter() - t0
+    print(f"📊 {model!r}")
+    print(f"   partial_fit + predict: {t_stream / n_batches * 1000:.2f} ms por lote de {batch_size}")
+    print(f"   re-ajuste completo por lote (notebook): {t_refit * 1000:.0f} ms")
+    print(f"   re-ajuste sobre la muestra reservoir: {t_reservoir * 1000:.0f} ms (v{model.version})")
+
+
+if __name__ == "__main__":
+    # La clase del módulo (no la de __main__), para que el .joblib se abra desde otros módulos
+    from streaming_clustering import HybridClusterer
+
+    parser = argparse.ArgumentParser(description="Clustering híbrido HDBSCAN + K-Means incremental")
+    parser.add_argument("input", nargs="?", default="data/processed_for_modeling/playlist_umap_embedding.parquet")
+    parser.add_argument("--output", default="data/processed_for_modeling/hybrid_clusterer.joblib")
+    parser.add_argument("-k", "--n-clusters", type=int, default=6)
+    parser.add_argument("--min-cluster-size", type=int, default=20)
+    parser.add_argument("--epsilon", type=float, default=0.5, help="cluster_selection_epsilon de HDBSCAN")
+    parser.add_argument("--evaluate", action="store_true", help="Predicción aproximada vs. ajuste completo")
+    parser.add_argument("--benchmark", action="store_true", help="partial_fit/predict vs. re-ajuste por lote")
+    args = parser.parse_args()
+
+    df = pd.read_parquet(args.input).select_dtypes(include=np.number)
+    params = {"min_cluster_size": args.min_cluster_size, "cluster_selection_epsilon": args.epsilon}
+    if args.evaluate:
+        print(evaluate(df.to_numpy(), args.n_clusters, **params).to_string())
+    if args.benchmark:
+        benchmark(df.to_numpy(), args.n_clusters, **params)
+    t0 = time.perf_counter()
+    model = HybridClusterer(args.n_clusters, **params).fit(df)
+    model.save(args.output)
+    counts = pd.Series(model.labels_).value_counts().sort_index()
+    print(f"✅ {model!r} → '{args.output}' ({time.perf_counter() - t0:.1f}s)")
+    print(counts.rename(index={model.outlier_label: "outliers"}).to_string())
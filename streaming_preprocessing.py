@@ -0,0 +1,525 @@
+"""
+streaming_preprocessing.py
+
+Preprocesamiento de preprocessing.ipynb (eliminar columnas, winsorize 1%/99%,
+StandardScaler, KBinsDiscretizer y PCA) por lotes de un Parquet, para el
+MPD completo sin tener df_processed entero en memoria (report.md asume
+8–12 GB de RAM, suficiente para el challenge set pero no para 1M playlists).
+
+Pasadas sobre los row groups del Parquet de entrada:
+
+  1. Sketch de cuantiles mergeable (QuantileSketch, estilo KLL) por columna
+     numérica + conteos exactos → un intervalo de valores alrededor de cada
+     rango de winsorize (int(0.01·n) y n - int(0.01·n) - 1, los mismos que
+     scipy.stats.mstats.winsorize).
+  2. Se guardan solo los valores dentro de esos intervalos (unos 2n/k por
+     columna), los conteos por debajo/encima y los momentos del tramo
+     central (conteo, media, M2 con la fórmula mergeable de Chan) → límites
+     de winsorize exactos, media y escala del StandardScaler y bordes
+     uniformes del KBinsDiscretizer, sin otra pasada.
+  3. IncrementalPCA.partial_fit sobre las filas escaladas de pistas únicas
+     (y de la primera fila de cada pid, como la celda de playlists).
+  4. Transformación lote a lote → df_processed_full.parquet y componentes
+     PCA de pistas / playlists.
+
+Los sketches y los momentos se pueden combinar (merge) entre lotes o
+archivos procesados por separado. check() compara con el camino en memoria
+del notebook sobre un archivo que sí entre en RAM.
+
+Uso:
+    pre = StreamingPreprocessor().fit("data/processed/playlist_tracks_complete.parquet")
+    pre.transform_file("data/processed/playlist_tracks_complete.parquet", "data/processed_for_modeling")
+    joblib.dump(pre.to_scaler(), "scaler_audio_features.joblib")
+
+    python streaming_preprocessing.py data/processed/playlist_tracks_complete.parquet --check
+"""
+
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sklearn.decomposition import IncrementalPCA
+from sklearn.preprocessing import StandardScaler
+
+# Celda 3.3 de preprocessing.ipynb: columnas irrelevantes o redundantes
+DROP_COLUMNS = [
+    "pos", "mbid", "artist_uri", "album_uri", "track_uri",
+    "danceability_not_danceable", "danceability_prob", "danceability_value",
+    "gender_male", "gender_prob", "gender_value",
+    "genre_dortmund_prob", "genre_dortmund_value",
+    "genre_electronic_prob", "genre_electronic_value",
+    "genre_rosamerica_prob", "genre_rosamerica_value",
+    "genre_tzanetakis_prob", "genre_tzanetakis_value",
+    "ismir04_rhythm_prob", "ismir04_rhythm_value",
+    "mood_acoustic_not_acoustic", "mood_acoustic_prob", "mood_acoustic_value",
+    "mood_aggressive_not_aggressive", "mood_aggressive_prob", "mood_aggressive_value",
+    "mood_electronic_not_electronic", "mood_electronic_prob", "mood_electronic_value",
+    "mood_happy_not_happy", "mood_happy_prob", "mood_happy_value",
+    "mood_party_not_party", "mood_party_prob", "mood_party_value",
+    "mood_relaxed_not_relaxed", "mood_relaxed_prob", "mood_relaxed_value",
+    "mood_sad_not_sad", "mood_sad_prob", "mood_sad_value",
+    "moods_mirex_prob", "moods_mirex_value",
+    "timbre_dark", "timbre_prob", "timbre_value",
+    "tonal_atonal_tonal", "tonal_atonal_prob", "tonal_atonal_value",
+    "voice_instrumental_instrumental", "voice_instrumental_prob", "voice_instrumental_value",
+]
+# Celda 3.5: no se recortan ni escalan
+EXCLUDE_COLUMNS = ["pid", "pos", "duration_ms", "was_imputed"]
+# Celda de discretización para reglas de asociación
+DISCRETIZE_COLUMNS = ["energy", "danceability_ll", "bpm"]
+BIN_LABELS = {0.0: "bajo", 1.0: "medio", 2.0: "alto"}
+# Atributos que deja fit_stats()
+STAT_ATTRIBUTES = ("columns_", "n_samples_seen_", "clip_low_", "clip_high_", "mean_", "var_", "scale_",
+                   "scaled_min_", "scaled_max_", "bin_edges_")
+
+
+def numerical_columns(schema, drop_columns=DROP_COLUMNS, exclude=EXCLUDE_COLUMNS):
+    """Columnas numéricas que el notebook recorta y escala, en el orden del esquema."""
+    return [f.name for f in schema
+            if (pa.types.is_integer(f.type) or pa.types.is_floating(f.type))
+            and f.name not in drop_columns and f.name not in exclude]
+
+
+# ------------------------------------------------------------
+# Sketch de cuantiles mergeable
+# ------------------------------------------------------------
+class QuantileSketch:
+    """
+    Compactadores por nivel (KLL simplificado) para varias columnas a la vez:
+    el nivel h guarda valores de peso 2^h; al superar 2k filas se ordena cada
+    columna y pasa uno de cada dos valores al nivel siguiente. Los NaN se
+    ordenan al final y se descuentan en la consulta con los conteos exactos.
+    """
+
+    def __init__(self, n_columns, k=2048, seed=0):
+        self.n_columns = n_columns
+        self.k = k
+        self.levels = []
+        self.counts = np.zeros(n_columns, dtype=np.int64)     # no nulos exactos
+        self._rng = np.random.default_rng(seed)
+
+    def _push(self, h, values):
+        while len(self.levels) <= h:
+            self.levels.append(np.empty((0, self.n_columns)))
+        buf = np.concatenate([self.levels[h], values]) if len(self.levels[h]) else values
+        if len(buf) < 2 * self.k:
+            self.levels[h] = buf
+            return
+        buf = np.sort(buf, axis=0)
+        even = len(buf) // 2 * 2
+        self.levels[h] = buf[even:]
+        self._push(h + 1, buf[self._rng.integers(2):even:2])
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.counts += (~np.isnan(values)).sum(axis=0)
+        self._push(0, values)
+        return self
+
+    def merge(self, other):
+        self.counts += other.counts
+        for h, level in enumerate(other.levels):
+            if len(level):
+                self._push(h, level)
+        return self
+
+    @property
+    def n_rows(self):
+        """Filas retenidas en el sketch (0 si nunca recibió datos)."""
+        return sum(len(level) for level in self.levels)
+
+    def value_at_rank(self, ranks):
+        """Valor de rango (0-based, entre no nulos) ranks[j] en cada columna j."""
+        if not self.n_rows:
+            raise ValueError("QuantileSketch vacío: no se actualizó con ninguna fila")
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(l), 2.0 ** h) for h, l in enumerate(self.levels)])
+        order = np.argsort(values, axis=0)             # NaN al final
+        sorted_vals = np.take_along_axis(values, order, axis=0)
+        w = np.where(np.isnan(sorted_vals), 0.0, weights[order])
+        cum = np.cumsum(w, axis=0)
+        total = cum[-1]
+        target = (np.asarray(ranks, dtype=np.float64) + 0.5) / np.maximum(self.counts, 1) * total
+        pos = np.array([np.searchsorted(cum[:, j], target[j], side="right") for j in range(self.n_columns)])
+        pos = np.clip(pos, 0, np.maximum((~np.isnan(sorted_vals)).sum(axis=0) - 1, 0))
+        return sorted_vals[pos, np.arange(self.n_columns)]
+
+
+# ------------------------------------------------------------
+# Momentos mergeables (Chan et al.)
+# ------------------------------------------------------------
+class RunningMoments:
+    """Conteo, media, M2, mínimo y máximo por columna, ignorando NaN."""
+
+    def __init__(self, n_columns):
+        self.n = np.zeros(n_columns)
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros(n_columns)
+        self.min = np.full(n_columns, np.inf)
+        self.max = np.full(n_columns, -np.inf)
+
+    def _combine(self, n_b, mean_b, m2_b):
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean = np.where(n > 0, self.mean + delta * n_b / np.maximum(n, 1), 0.0)
+            self.m2 = self.m2 + m2_b + delta ** 2 * self.n * n_b / np.maximum(n, 1)
+        self.n = n
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        n_b = present.sum(axis=0).astype(np.float64)
+        filled = np.where(present, values, 0.0)
+        mean_b = filled.sum(axis=0) / np.maximum(n_b, 1)
+        m2_b = (np.where(present, values - mean_b, 0.0) ** 2).sum(axis=0)
+        self._combine(n_b, mean_b, m2_b)
+        self.min = np.fmin(self.min, np.nanmin(np.where(present, values, np.inf), axis=0))
+        self.max = np.fmax(self.max, np.nanmax(np.where(present, values, -np.inf), axis=0))
+        return self
+
+    def merge(self, other):
+        self._combine(other.n, other.mean, other.m2)
+        self.min, self.max = np.fmin(self.min, other.min), np.fmax(self.max, other.max)
+        return self
+
+    def add_constant(self, counts, values):
+        """Suma counts[j] copias de values[j] a cada columna j."""
+        counts = np.asarray(counts, dtype=np.float64)
+        self._combine(counts, np.where(counts > 0, values, 0.0), np.zeros_like(counts))
+        self.min = np.where(counts > 0, np.fmin(self.min, values), self.min)
+        self.max = np.where(counts > 0, np.fmax(self.max, values), self.max)
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / np.maximum(self.n, 1)          # ddof=0, como StandardScaler
+
+
+# ------------------------------------------------------------
+# Pipeline
+# ------------------------------------------------------------
+class StreamingPreprocessor:
+    """Ajuste en varias pasadas por lotes y transformación lote a lote del Parquet."""
+
+    def __init__(self, limits=(0.01, 0.01), n_components=10, pca_keys=("track_id", "pid"),
+                 batch_size=200_000, sketch_k=2048, drop_columns=DROP_COLUMNS,
+                 discretize_columns=DISCRETIZE_COLUMNS, n_bins=3, verbose=True):
+        self.limits = limits
+        self.n_components = n_components
+        self.pca_keys = tuple(pca_keys)
+        self.batch_size = batch_size
+        self.sketch_k = sketch_k
+        self.drop_columns = list(drop_columns)
+        self.discretize_columns = list(discretize_columns)
+        self.n_bins = n_bins
+        self.verbose = verbose
+
+    def _log(self, msg):
+        if self.verbose:
+            print(msg)
+
+    def _batches(self, path, columns=None):
+        pf = pq.ParquetFile(path)
+        for batch in pf.iter_batches(batch_size=self.batch_size, columns=columns):
+            yield batch.to_pandas()
+
+    def _matrix(self, df):
+        return df[self.columns_].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # --- transformaciones de un lote ---
+    def clip(self, x):
+        return np.clip(x, self.clip_low_, self.clip_high_)
+
+    def scale(self, x):
+        return (x - self.mean_) / self.scale_
+
+    def _pca_rows(self, df, key, seen):
+        """Filas del lote cuyo `key` no se vio antes (primera aparición global)."""
+        h = pd.util.hash_pandas_object(df[key], index=False).to_numpy()
+        first = ~pd.Series(h).duplicated().to_numpy()
+        if len(seen[key]):
+            pos = np.minimum(np.searchsorted(seen[key], h), len(seen[key]) - 1)
+            first &= seen[key][pos] != h
+        seen[key] = np.union1d(seen[key], h[first])
+        return first
+
+    def _clipped_moments(self, path, sketch, low_rank, high_rank):
+        """
+        Una pasada: valores en [L1, L2] (alrededor de low_rank) y [H1, H2]
+        (alrededor de high_rank) según el sketch, conteos fuera de ellos y
+        momentos del tramo central, que el recorte no toca. Con eso se eligen
+        los valores de rango exacto y se completan los momentos recortados.
+        """
+        n_cols = len(self.columns_)
+        n = sketch.counts
+        width = 2 * n // self.sketch_k + 64        # ~4x el error de rango medido del sketch
+        last = np.maximum(n - 1, 0)
+        L1 = np.where(low_rank - width > 0, sketch.value_at_rank(np.maximum(low_rank - width, 0)), -np.inf)
+        L2 = sketch.value_at_rank(np.minimum(low_rank + width, last))
+        H1 = sketch.value_at_rank(np.maximum(high_rank - width, 0))
+        H2 = np.where(high_rank + width < last, sketch.value_at_rank(np.minimum(high_rank + width, last)), np.inf)
+
+        middle = RunningMoments(n_cols)
+        n_below = np.zeros(n_cols, dtype=np.int64)
+        n_above = np.zeros(n_cols, dtype=np.int64)
+        n_middle = np.zeros(n_cols, dtype=np.int64)
+        low_vals = [[] for _ in range(n_cols)]
+        high_vals = [[] for _ in range(n_cols)]
+        with np.errstate(invalid="ignore"):
+            for df in self._batches(path, self.columns_):
+                x = self._matrix(df)
+                in_low = (x >= L1) & (x <= L2)
+                in_high = (x >= H1) & (x <= H2) & ~in_low
+                in_middle = (x > L2) & (x < H1)
+                n_below += (x < L1).sum(axis=0)
+                n_above += (x > H2).sum(axis=0)
+                n_middle += in_middle.sum(axis=0)
+                middle.update(np.where(in_middle, x, np.nan))
+                for j in range(n_cols):
+                    low_vals[j].append(x[in_low[:, j], j])
+                    high_vals[j].append(x[in_high[:, j], j])
+
+        self.clip_low_ = np.empty(n_cols)
+        self.clip_high_ = np.empty(n_cols)
+        bracket_moments = RunningMoments(n_cols)
+        low_sorted, high_sorted = [], []
+        missed = []
+        for j in range(n_cols):
+            low_j, high_j = np.sort(np.concatenate(low_vals[j])), np.sort(np.concatenate(high_vals[j]))
+            i_low = low_rank[j] - n_below[j]
+            i_high = high_rank[j] - (n_below[j] + len(low_j) + n_middle[j])
+            if 0 <= i_low < len(low_j) and 0 <= i_high < len(high_j):
+                self.clip_low_[j], self.clip_high_[j] = low_j[i_low], high_j[i_high]
+            else:
+                # El rango cayó fuera del intervalo: límite aproximado del sketch
+                missed.append(self.columns_[j])
+                self.clip_low_[j] = sketch.value_at_rank(low_rank)[j]
+                self.clip_high_[j] = sketch.value_at_rank(high_rank)[j]
+            low_sorted.append(low_j)
+            high_sorted.append(high_j)
+        if missed:
+            self._log(f"   ⚠️ límites aproximados (subir sketch_k) en: {missed}")
+
+        # Valores de los intervalos recortados (matriz con NaN de relleno)
+        for group in (low_sorted, high_sorted):
+            width_max = max((len(v) for v in group), default=0)
+            padded = np.full((width_max, n_cols), np.nan)
+            for j, v in enumerate(group):
+                padded[:len(v), j] = v
+            bracket_moments.update(self.clip(padded))
+        # Debajo / encima de los intervalos todo vale el límite
+        bracket_moments.add_constant(n_below, self.clip_low_)
+        bracket_moments.add_constant(n_above, self.clip_high_)
+        return middle.merge(bracket_moments)
+
+    # --- ajuste ---
+    def fit(self, path):
+        return self.fit_stats(path).fit_pca(path)
+
+    def get_stats(self):
+        """Límites, media/escala y bordes ajustados (pasadas 1–2), para guardarlos aparte."""
+        return {name: getattr(self, name) for name in STAT_ATTRIBUTES}
+
+    def set_stats(self, stats):
+        for name in STAT_ATTRIBUTES:
+            setattr(self, name, stats[name])
+        return self
+
+    def fit_stats(self, path):
+        """Pasadas 1–2: límites de winsorize, StandardScaler y bordes del discretizador."""
+        schema = pq.read_schema(path)
+        self.columns_ = numerical_columns(schema, self.drop_columns)
+        n_cols = len(self.columns_)
+
+        # 1) cuantiles aproximados → intervalos alrededor de cada rango de corte
+        t0 = time.perf_counter()
+        sketch = QuantileSketch(n_cols, self.sketch_k)
+        for df in self._batches(path, self.columns_):
+            sketch.update(self._matrix(df))
+        if not sketch.n_rows:
+            raise ValueError(f"'{path}' no tiene filas: no hay datos para ajustar las estadísticas")
+        n = sketch.counts
+        lo, hi = self.limits
+        low_rank = (lo * n).astype(np.int64)
+        high_rank = n - (n * hi).astype(np.int64) - 1
+        self.n_samples_seen_ = n
+        self._log(f"1/3 sketch de cuantiles ({time.perf_counter() - t0:.1f}s)")
+
+        # 2) límites exactos y momentos de los valores recortados
+        t0 = time.perf_counter()
+        moments = self._clipped_moments(path, sketch, low_rank, high_rank)
+        self.mean_, self.var_ = moments.mean, moments.var
+        self.scale_ = np.where(np.sqrt(self.var_) > 10 * np.finfo(np.float64).eps, np.sqrt(self.var_), 1.0)
+        self.scaled_min_ = (moments.min - self.mean_) / self.scale_
+        self.scaled_max_ = (moments.max - self.mean_) / self.scale_
+        self.bin_edges_ = {c: np.linspace(self.scaled_min_[j], self.scaled_max_[j], self.n_bins + 1)
+                           for j, c in enumerate(self.columns_) if c in self.discretize_columns}
+        self._log(f"2/3 límites de winsorize, media y escala ({time.perf_counter() - t0:.1f}s)")
+        return self
+
+    def fit_pca(self, path):
+        """Pasada 3: IncrementalPCA por clave (pistas únicas / primera fila de cada playlist)."""
+        schema = pq.read_schema(path)
+        read_cols = list(dict.fromkeys(self.columns_ + [k for k in self.pca_keys if k in schema.names]))
+        t0 = time.perf_counter()
+        keys = [k for k in self.pca_keys if k in schema.names]
+        self.pca_ = {k: IncrementalPCA(n_components=self.n_components) for k in keys}
+        seen = {k: np.empty(0, dtype=np.uint64) for k in keys}
+        pending = {k: [] for k in keys}
+        held = {k: None for k in keys}       # un lote de retraso: la cola final se suma al último
+        min_rows = max(self.batch_size // 4, 5 * self.n_components)
+        for df in self._batches(path, read_cols):
+            x = self.scale(self.clip(self._matrix(df)))
+            for k in keys:
+                pending[k].append(x[self._pca_rows(df, k, seen)])
+                if sum(len(p) for p in pending[k]) >= min_rows:
+                    if held[k] is not None:
+                        self.pca_[k].partial_fit(held[k])
+                    held[k], pending[k] = np.concatenate(pending[k]), []
+        for k in keys:
+            last = np.concatenate(([held[k]] if held[k] is not None else []) + pending[k])
+            self.pca_[k].partial_fit(last)
+        self._log(f"3/3 IncrementalPCA {list(self.pca_)} ({time.perf_counter() - t0:.1f}s)")
+        return self
+
+    # --- transformación ---
+    def transform_frame(self, df, discretize=True):
+        """Un lote de filas crudas → filas como df_processed tras la celda de escalado."""
+        df = df.drop(columns=[c for c in self.drop_columns if c in df.columns])
+        if "name" in df:
+            df["name"] = df["name"].fillna("sin nombre")
+        x = self.scale(self.clip(self._matrix(df)))
+        # Como fit_transform: float32 si todas las columnas lo son
+        dtype = np.float32 if all(df[c].dtype == np.float32 for c in self.columns_) else np.float64
+        df[self.columns_] = pd.DataFrame(x.astype(dtype), columns=self.columns_, index=df.index)
+        if discretize:
+            for c, edges in self.bin_edges_.items():
+                v = df[c].to_numpy(dtype=np.float64)
+                v = v + 1e-8 + 1e-5 * np.abs(v)     # tolerancia de KBinsDiscretizer
+                b = np.searchsorted(edges[1:-1], v, side="right").astype(np.float64)
+                df[f"{c}_cat"] = pd.Series(b, index=df.index).map(BIN_LABELS)
+        return df
+
+    def transform_file(self, path, output_dir, discretize=False):
+        """
+        Escribe df_processed_full.parquet lote a lote y los componentes PCA de
+        pistas (df_pca_components.parquet) y playlists (playlist_pca_components.parquet).
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        names = {"track_id": "df_pca_components.parquet", "pid": "playlist_pca_components.parquet"}
+        t0 = time.perf_counter()
+        writer = None
+        components = {k: [] for k in self.pca_}
+        seen = {k: np.empty(0, dtype=np.uint64) for k in self.pca_}
+        out_path = os.path.join(output_dir, "df_processed_full.parquet")
+        tmp_path = out_path + ".tmp"
+        try:
+            for df in self._batches(path):
+                out = self.transform_frame(df, discretize)
+                table = pa.Table.from_pandas(out, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+                for k, pca in self.pca_.items():
+                    first = self._pca_rows(out, k, seen)
+                    if not first.any():         # lote sin pid/track_id nuevos
+                        continue
+                    comp = pca.transform(out.loc[first, self.columns_].to_numpy(dtype=np.float64))
+                    components[k].append(pd.DataFrame(comp, index=pd.Index(out.loc[first, k], name=k),
+                                                      columns=[f"PC_{i + 1}" for i in range(comp.shape[1])]))
+        finally:
+            if writer is not None:
+                writer.close()
+        os.replace(tmp_path, out_path)
+        for k, frames in components.items():
+            pd.concat(frames).to_parquet(os.path.join(output_dir, names.get(k, f"{k}_pca_components.parquet")))
+        self._log(f"✅ '{out_path}' y PCA {list(components)} ({time.perf_counter() - t0:.1f}s)")
+        return out_path
+
+    def to_scaler(self):
+        """StandardScaler de sklearn equivalente (para scaler_audio_features.joblib)."""
+        scaler = StandardScaler()
+        scaler.mean_, scaler.var_, scaler.scale_ = self.mean_, self.var_, self.scale_
+        scaler.n_samples_seen_ = self.n_samples_seen_
+        scaler.n_features_in_ = len(self.columns_)
+        scaler.feature_names_in_ = np.array(self.columns_, dtype=object)
+        return scaler
+
+
+# ------------------------------------------------------------
+# Comparación con el camino en memoria del notebook
+# ------------------------------------------------------------
+def in_memory_path(df, n_components=10):
+    """Celdas 3.3–3.7 de preprocessing.ipynb sobre un DataFrame completo."""
+    from scipy.stats.mstats import winsorize
+    from sklearn.decomposition import PCA
+
+    df = df.drop(columns=[c for c in DROP_COLUMNS if c in df.columns])
+    df["name"] = df["name"].fillna("sin nombre")
+    numerical_cols = [c for c in df.select_dtypes(include=np.number).columns if c not in EXCLUDE_COLUMNS]
+    for col in numerical_cols:
+        df[col] = winsorize(df[col], limits=[0.01, 0.01])
+    scaler = StandardScaler()
+    df[numerical_cols] = scaler.fit_transform(df[numerical_cols])
+    pcas = {}
+    for key in ("track_id", "pid"):
+        unique = df.drop_duplicates(subset=[key]).set_index(key)
+        pca = PCA(n_components=n_components)
+        pcas[key] = pd.DataFrame(pca.fit_transform(unique[numerical_cols]), index=unique.index,
+                                 columns=[f"PC_{i + 1}" for i in range(n_components)])
+        pcas[key].attrs["explained_variance_ratio"] = pca.explained_variance_ratio_
+    return df, scaler, pcas
+
+
+def check(path, output_dir, batch_size=50_000, atol=1e-5):
+    """Ajusta por lotes, transforma a output_dir y compara con in_memory_path()."""
+    pre = StreamingPreprocessor(batch_size=batch_size).fit(path)
+    pre.transform_file(path, output_dir)
+    t0 = time.perf_counter()
+    df_mem, scaler, pcas = in_memory_path(pd.read_parquet(path), pre.n_components)
+    t_mem = time.perf_counter() - t0
+
+    df_stream = pd.read_parquet(os.path.join(output_dir, "df_processed_full.parquet"))
+    cols = pre.columns_
+    diff = np.abs(df_stream[cols].to_numpy(dtype=float) - df_mem[cols].to_numpy(dtype=float))
+    print(f"   camino en memoria: {t_mem:.1f}s")
+    print(f"   máx |Δ| escalado: {np.nanmax(diff):.2e} (media {np.nanmean(diff):.2e}), "
+          f"máx |Δ| media del scaler: {np.max(np.abs(pre.mean_ - scaler.mean_)):.2e}, "
+          f"máx Δ relativo de escala: {np.max(np.abs(pre.scale_ / scaler.scale_ - 1)):.2e}")
+
+    names = {"track_id": "df_pca_components.parquet", "pid": "playlist_pca_components.parquet"}
+    for key, expected in pcas.items():
+        got = pd.read_parquet(os.path.join(output_dir, names[key])).loc[expected.index]
+        ratio = pre.pca_[key].explained_variance_ratio_
+        # Los componentes se comparan salvo el signo
+        signs = np.sign((got.to_numpy() * expected.to_numpy()).sum(axis=0))
+        err = np.abs(got.to_numpy() * signs - expected.to_numpy()).max(axis=0) / expected.to_numpy().std(axis=0)
+        print(f"   PCA {key}: varianza explicada {ratio.sum():.4f} vs {expected.attrs['explained_variance_ratio'].sum():.4f}, "
+              f"máx error relativo por componente {np.round(err, 4).tolist()}")
+    assert np.nanmax(diff) <= atol, f"El escalado difiere más de {atol}"
+    return pre
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocesamiento por lotes (winsorize, escalado, PCA) de un Parquet")
+    parser.add_argument("input", nargs="?", default="data/processed/playlist_tracks_complete.parquet")
+    parser.add_argument("--output", default="data/processed_for_modeling")
+    parser.add_argument("--batch-size", type=int, default=200_000)
+    parser.add_argument("--scaler", default="scaler_audio_features.joblib")
+    parser.add_argument("--check", action="store_true", help="Comparar con el camino en memoria (archivo chico)")
+    args = parser.parse_args()
+
+    if args.check:
+        check(args.input, args.output, args.batch_size)
+    else:
+        import joblib
+
+        pre = StreamingPreprocessor(batch_size=args.batch_size).fit(args.input)
+        pre.transform_file(args.input, args.output)
+        joblib.dump(pre.to_scaler(), args.scaler)
+        print(f"   scaler → '{args.scaler}'")
@@ -0,0 +1,211 @@
+"""
+track_feature_store.py
+
+Tabla columnar de features por pista construida una sola vez a partir de la
+salida del enriquecimiento (acousticbrainz_data_updated_clean.json), en vez
+de re-parsear y aplanar los dicts `highlevel` en cada sesión del notebook.
+
+  - Una fila por track_id, ordenada por track_id (búsqueda binaria).
+  - Probabilidades y features numéricas en float32.
+  - Columnas categóricas (*_value, genre_mb, resolved_by) con codificación
+    de diccionario (se cargan como pandas Categorical).
+  - Formato Arrow IPC sin compresión (.arrow/.feather): se abre con memory
+    map y se leen solo las columnas pedidas sin copiar. También acepta
+    .parquet (comprimido, lectura por columnas).
+
+Uso:
+    python track_feature_store.py data/acousticbrainz_data_updated_clean.json \
+        data/processed/tracks_features.arrow
+
+    from track_feature_store import load_track_features
+    df = load_track_features("data/processed/tracks_features.arrow",
+                             columns=["track_id", "bpm", "energy"])
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "DataRecolectionScripts"))
+from challenge_stream import iter_items
+
+# Categorías cuyo dict "all" se despliega (se mantienen TODAS sus probabilidades)
+CAT_WITH_ALL = {
+    "genre_dortmund",
+    "genre_electronic",
+    "genre_rosamerica",
+    "genre_tzanetakis",
+    "ismir04_rhythm",
+    "moods_mirex",
+    "danceability", "gender",
+    "mood_acoustic", "mood_aggressive", "mood_electronic",
+    "mood_happy", "mood_party", "mood_relaxed", "mood_sad",
+    "timbre", "tonal_atonal", "voice_instrumental",
+}
+
+# Columnas de texto con pocos valores distintos → diccionario
+CATEGORICAL_COLS = {"genre_mb", "resolved_by"}
+
+BATCH_ROWS = 20000
+
+
+# ------------------------------------------------------------
+# 1) Aplanado (mismas columnas que la celda 02_load_acoustic_flat_reduce)
+# ------------------------------------------------------------
+def flatten_record(track_id, info):
+    base = {k: v for k, v in info.items() if k != "highlevel"}  # bpm, energy…
+    for cat, cat_dict in (info.get("highlevel") or {}).items():
+        base[f"{cat}_value"] = cat_dict.get("value")
+        base[f"{cat}_prob"] = cat_dict.get("probability")
+        if cat in CAT_WITH_ALL:
+            for subk, p in cat_dict.get("all", {}).items():
+                base[f"{cat}_{subk}"] = p
+    base["track_id"] = track_id
+    return base
+
+
+def _rows_to_table(rows):
+    """Lote de registros aplanados → pyarrow.Table con la unión de columnas del lote."""
+    names = list(dict.fromkeys(k for row in rows for k in row))
+    cols = {}
+    for name in names:
+        values = [row.get(name) for row in rows]
+        try:
+            cols[name] = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Tipos mezclados (p.ej. rating como texto y como número): texto
+            cols[name] = pa.array([None if v is None else str(v) for v in values])
+    return pa.table(cols)
+
+
+def _is_categorical(name):
+    return name in CATEGORICAL_COLS or name.endswith("_value")
+
+
+def _typed_column(name, col):
+    """float64/int → float32 y texto categórico → diccionario."""
+    if name == "track_id":
+        return col
+    if pa.types.is_floating(col.type) or pa.types.is_integer(col.type):
+        return col.cast(pa.float32())
+    if pa.types.is_null(col.type) and not _is_categorical(name):
+        return col.cast(pa.float32())
+    if _is_categorical(name) and (pa.types.is_string(col.type) or pa.types.is_null(col.type)):
+        return col.cast(pa.string()).dictionary_encode()
+    return col
+
+
+def _unify_dictionaries(table):
+    """Tras concatenar batches, cada chunk trae su propio diccionario: unificarlos."""
+    return table.unify_dictionaries().combine_chunks()
+
+
+# ------------------------------------------------------------
+# 2) Construcción
+# ------------------------------------------------------------
+def build_track_feature_store(acoustic_path, output_path, force=False, batch_rows=BATCH_ROWS):
+    """
+    Convierte el JSON {track_id: {..., highlevel: {...}}} en la tabla columnar.
+    El JSON se lee en streaming y se convierte a Arrow por lotes, así que
+    nunca hay un dict Python por cada valor de toda la tabla.
+    No hace nada si output_path ya existe y es más reciente que el JSON.
+    """
+    acoustic_path, output_path = str(acoustic_path), str(output_path)
+    if (not force and os.path.exists(output_path)
+            and os.path.getmtime(output_path) >= os.path.getmtime(acoustic_path)):
+        return output_path
+
+    t0 = time.time()
+    tables, rows = [], []
+    for track_id, info in iter_items(acoustic_path):
+        rows.append(flatten_record(track_id, info))
+        if len(rows) >= batch_rows:
+            tables.append(_rows_to_table(rows))
+            rows = []
+    if rows:
+        tables.append(_rows_to_table(rows))
+    if not tables:
+        raise ValueError(f"'{acoustic_path}' no contiene pistas")
+
+    table = pa.concat_tables(tables, promote_options="permissive")
+    del tables
+    table = pa.table({name: _typed_column(name, table.column(name)) for name in table.column_names})
+    table = _unify_dictionaries(table.sort_by("track_id"))
+
+    # track_id y columnas base primero, luego el resto en el orden de aparición
+    first = ["track_id"] + [c for c in table.column_names if c != "track_id"]
+    table = table.select(first)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    if output_path.endswith(".parquet"):
+        pq.write_table(table, tmp_path, compression="zstd", row_group_size=64 * 1024)
+    else:
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, output_path)
+    print(f"✅ {table.num_rows} pistas × {table.num_columns} columnas → '{output_path}' "
+          f"({os.path.getsize(output_path) / 1e6:.1f} MB, {time.time() - t0:.1f}s)")
+    return output_path
+
+
+# ------------------------------------------------------------
+# 3) Lectura
+# ------------------------------------------------------------
+def read_track_table(path, columns=None):
+    """pyarrow.Table con memory map; solo las columnas pedidas (track_id siempre incluido)."""
+    path = str(path)
+    if columns is not None and "track_id" not in columns:
+        columns = ["track_id"] + list(columns)
+    if path.endswith(".parquet"):
+        return pq.read_table(path, columns=columns, memory_map=True)
+    return feather.read_table(path, columns=columns, memory_map=True)
+
+
+def feature_columns(path):
+    """Nombres de columna disponibles sin leer datos."""
+    path = str(path)
+    if path.endswith(".parquet"):
+        return pq.read_schema(path).names
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+def lookup_positions(track_ids_sorted, track_ids):
+    """
+    Posición de cada track_id en la tabla (ordenada) o -1 si no está.
+    track_ids_sorted: array/columna de la tabla; track_ids: iterable de IDs.
+    """
+    keys = np.asarray(track_ids_sorted, dtype=str)
+    wanted = np.asarray(list(track_ids), dtype=str)
+    pos = np.searchsorted(keys, wanted)
+    pos = np.minimum(pos, max(len(keys) - 1, 0))
+    found = (keys[pos] == wanted) if len(keys) else np.zeros(len(wanted), dtype=bool)
+    return np.where(found, pos, -1)
+
+
+def load_track_features(path, columns=None, track_ids=None):
+    """
+    DataFrame de features (categóricas como pandas Categorical).
+    Con track_ids, solo esas pistas (búsqueda binaria sobre el track_id ordenado).
+    """
+    table = read_track_table(path, columns)
+    if track_ids is not None:
+        pos = lookup_positions(table.column("track_id").to_numpy(zero_copy_only=False), track_ids)
+        table = table.take(pa.array(pos[pos >= 0]))
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construye la tabla columnar de features por pista")
+    parser.add_argument("acoustic", nargs="?", default="data/acousticbrainz_data_updated_clean.json")
+    parser.add_argument("output", nargs="?", default="data/processed/tracks_features.arrow",
+                        help=".arrow/.feather (memory map) o .parquet")
+    parser.add_argument("--force", action="store_true", help="Reconstruir aunque esté al día")
+    args = parser.parse_args()
+    build_track_feature_store(args.acoustic, args.output, force=args.force)
@@ -0,0 +1,256 @@
+"""
+track_similarity.py
+
+Recomendación de pistas por semilla ("más canciones como estas") sobre los
+embeddings de pista que hasta ahora solo se usaban para graficar:
+
+  - df_pca_components.parquet / tracks_umap_embedding.parquet
+    (preprocessing.ipynb, índice = track_id)
+  - track_embeddings.npy del autoencoder (prediction.ipynb): una fila por
+    fila de df_processed_full, así que se deduplica a una fila por track_id.
+
+Los vectores quedan en un .npy float32 que se abre con memory map (índice
+de vector_index.py) y las consultas van por lotes: todas las semillas se
+buscan en una sola llamada al índice. Los filtros usan las probabilidades
+de género/mood de df_processed_full (genre_*, mood_*):
+
+    {"mood_happy_happy": 0.7}                   → columna >= 0.7
+    {"genre_rosamerica_roc": (0.5, None)}       → rango [lo, hi]
+
+Con un filtro se piden más candidatos al índice aproximado; si el filtro
+deja pocas pistas, se busca exacto solo sobre ese subconjunto.
+
+Uso:
+    service = TrackSimilarity.build("data/processed_for_modeling/tracks_umap_embedding.parquet")
+    service.save("data/processed_for_modeling/track_index")
+    service = TrackSimilarity.load("data/processed_for_modeling/track_index")
+    service.similar(["id1", "id2"], k=10, filters={"mood_party_party": 0.6})
+    service.recommend(["id1", "id2"], n=20)
+
+    python track_similarity.py data/processed_for_modeling/df_pca_components.parquet --benchmark
+"""
+
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from vector_index import INDEX_TYPES, BruteForceIndex, load_vectors, open_index
+
+TAG_PREFIXES = ("genre_", "mood_")
+
+
+def load_track_vectors(path, tracks_path=None):
+    """
+    (track_ids, matriz float32). Un .npy (track_embeddings.npy) necesita
+    tracks_path (df_processed_full.parquet): sus filas son las de ese
+    DataFrame y se queda la primera fila de cada track_id.
+    """
+    path = str(path)
+    if not path.endswith(".npy"):
+        return load_vectors(path)
+    if tracks_path is None:
+        raise ValueError("track_embeddings.npy necesita tracks_path (df_processed_full.parquet) para los track_id")
+    row_ids = pd.read_parquet(tracks_path, columns=["track_id"])["track_id"].to_numpy()
+    emb = np.load(path, mmap_mode="r")
+    if len(emb) != len(row_ids):
+        raise ValueError(f"{path} tiene {len(emb)} filas y {tracks_path} {len(row_ids)}")
+    track_ids, first = np.unique(row_ids, return_index=True)
+    order = np.argsort(first)               # lectura secuencial del memmap
+    X = np.empty((len(first), emb.shape[1]), dtype=np.float32)
+    X[order] = emb[first[order]]
+    return track_ids, X
+
+
+def load_track_tags(tracks_path, prefixes=TAG_PREFIXES):
+    """Probabilidades de género/mood por track_id (una fila por pista)."""
+    schema = pq.read_schema(tracks_path)
+    # Solo probabilidades: genre_mb / *_value son etiquetas de texto
+    columns = [f.name for f in schema if f.name.startswith(prefixes)
+               and (pa.types.is_floating(f.type) or pa.types.is_integer(f.type))]
+    df = pd.read_parquet(tracks_path, columns=["track_id"] + columns)
+    return df.drop_duplicates("track_id").set_index("track_id")[columns].astype(np.float32)
+
+
+class TrackSimilarity:
+    """Índice de vecinos sobre embeddings de pista + tabla de etiquetas para filtrar."""
+
+    def __init__(self, index, tags=None, exact_below=0.02, overfetch=8):
+        self.index = index
+        # Etiquetas alineadas con las posiciones del índice (NaN si falta la pista)
+        self.tags = None if tags is None else tags.reindex(index.ids)
+        self.exact_below = exact_below      # fracción de pistas bajo la que se busca exacto
+        self.overfetch = overfetch          # candidatos extra por vecino pedido con filtro
+        self._mask_cache = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __repr__(self):
+        n_tags = 0 if self.tags is None else self.tags.shape[1]
+        return f"TrackSimilarity({self.index!r}, {n_tags} columnas de filtro)"
+
+    @classmethod
+    def build(cls, vectors_path, tracks_path=None, kind="hnsw", metric="cosine", **kwargs):
+        """Índice `kind` (brute / ivf / hnsw) sobre los embeddings; etiquetas de tracks_path si se da."""
+        track_ids, X = load_track_vectors(vectors_path, tracks_path)
+        index = INDEX_TYPES[kind](metric).build(X, track_ids)
+        tags = load_track_tags(tracks_path) if tracks_path is not None else None
+        return cls(index, tags, **kwargs)
+
+    # --------------------------------------------------------
+    # Filtros
+    # --------------------------------------------------------
+    def mask(self, filters):
+        """Máscara booleana (posiciones del índice) de las pistas que cumplen los filtros."""
+        key = tuple(sorted((c, v if not isinstance(v, list) else tuple(v)) for c, v in filters.items()))
+        if key in self._mask_cache:
+            return self._mask_cache[key]
+        if self.tags is None:
+            raise ValueError("Este índice no tiene etiquetas de género/mood para filtrar")
+        mask = np.ones(len(self), dtype=bool)
+        for column, cond in filters.items():
+            values = self.tags[column].to_numpy()
+            lo, hi = cond if isinstance(cond, (tuple, list)) else (cond, None)
+            if lo is not None:
+                mask &= values >= lo
+            if hi is not None:
+                mask &= values <= hi
+        self._mask_cache[key] = mask
+        return mask
+
+    def _exact_subset(self, queries, k, allowed):
+        sub = BruteForceIndex(self.index.metric)
+        sub.vectors, sub.ids = np.asarray(self.index.vectors[allowed]), allowed
+        pos, scores = sub._search(queries, k)
+        return allowed[pos], scores
+
+    def _filtered_search(self, queries, k, mask):
+        allowed = np.flatnonzero(mask)
+        k = min(k, len(allowed))
+        if not k:
+            return np.full((len(queries), 0), -1, dtype=np.int64), np.empty((len(queries), 0), np.float32)
+        if len(allowed) <= self.exact_below * len(self):
+            # Pocas pistas: exacto sobre el subconjunto (una multiplicación de matrices)
+            return self._exact_subset(queries, k, allowed)
+
+        fetch = min(len(self), k * self.overfetch)
+        pos, scores = self.index._search(queries, fetch)
+        ok = (pos >= 0) & mask[np.maximum(pos, 0)]
+        out_pos = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores = np.empty((len(queries), k), dtype=np.float32)
+        for r in range(len(queries)):
+            sel = np.flatnonzero(ok[r])[:k]
+            out_pos[r, :len(sel)] = pos[r, sel]
+            out_scores[r, :len(sel)] = scores[r, sel]
+        # Consultas a las que el sobremuestreo no les alcanzó: exacto sobre el subconjunto
+        short = np.flatnonzero(ok.sum(axis=1) < k)
+        if len(short):
+            out_pos[short], out_scores[short] = self._exact_subset(queries[short], k, allowed)
+        return out_pos, out_scores
+
+    # --------------------------------------------------------
+    # Consultas por lotes
+    # --------------------------------------------------------
+    def similar(self, seeds, k=10, filters=None):
+        """
+        Vecinos de cada semilla (sin las propias semillas), en una sola
+        búsqueda por lotes. DataFrame seed, rank, track_id, score.
+        """
+        seeds = list(seeds)
+        seed_pos = self.index.positions(seeds)
+        queries = np.asarray(self.index.vectors[seed_pos])
+        extra = min(len(seed_pos), k)        # margen para descartar las semillas
+        if filters:
+            pos, scores = self._filtered_search(queries, k + extra, self.mask(filters))
+        else:
+            pos, scores = self.index._search(queries, k + extra)
+
+        keep = (pos >= 0) & ~np.isin(pos, seed_pos)
+        rank = np.cumsum(keep, axis=1) - 1
+        keep &= rank < k
+        r, c = np.nonzero(keep)
+        return pd.DataFrame({"seed": np.asarray(seeds, dtype=object)[r], "rank": rank[r, c] + 1,
+                             "track_id": self.index.ids[pos[r, c]], "score": scores[r, c]})
+
+    def recommend(self, seeds, n=20, filters=None, per_seed=None):
+        """
+        Recomendación para una lista de semillas: suma de las similitudes de
+        cada candidato a las semillas (per_seed vecinos por semilla).
+        """
+        hits = self.similar(seeds, k=per_seed or max(n, 10), filters=filters)
+        if not len(hits):
+            return pd.Series(dtype=np.float32, name="score")
+        score = hits["score"] if self.index.largest else -hits["score"]
+        return score.groupby(hits["track_id"]).sum().nlargest(n)
+
+    def recommend_centroid(self, seeds, n=20, filters=None):
+        """Alternativa: vecinos del vector medio de las semillas (una sola consulta)."""
+        seed_pos = self.index.positions(seeds)
+        q = self.index._prepare(np.asarray(self.index.vectors[seed_pos]).mean(axis=0, keepdims=True))
+        k = n + len(seed_pos)
+        pos, scores = self._filtered_search(q, k, self.mask(filters)) if filters else self.index._search(q, k)
+        keep = (pos[0] >= 0) & ~np.isin(pos[0], seed_pos)
+        return pd.Series(scores[0][keep][:n], index=self.index.ids[pos[0][keep][:n]], name="score")
+
+    # --------------------------------------------------------
+    # Persistencia
+    # --------------------------------------------------------
+    def save(self, directory):
+        directory = self.index.save(directory)
+        if self.tags is not None:
+            self.tags.to_parquet(os.path.join(directory, "tags.parquet"))
+        return directory
+
+    @classmethod
+    def load(cls, directory, **kwargs):
+        index = open_index(directory, mmap=True)
+        tags_path = os.path.join(str(directory), "tags.parquet")
+        tags = pd.read_parquet(tags_path) if os.path.exists(tags_path) else None
+        return cls(index, tags, **kwargs)
+
+
+def benchmark(service, n_seeds=(1, 10, 100), k=10, repeats=20, seed=0):
+    """Latencia por lote de semillas, sin filtro y con un filtro por columna de etiqueta."""
+    rng = np.random.default_rng(seed)
+    filters = [None]
+    if service.tags is not None and service.tags.shape[1]:
+        column = service.tags.columns[0]
+        filters += [{column: float(service.tags[column].quantile(q))} for q in (0.5, 0.99)]
+    print(f"📊 {service!r}, k={k}")
+    print(f"{'semillas':>9} {'filtro':<40} {'ms/lote':>9} {'ms/semilla':>11}")
+    for f in filters:
+        for n in n_seeds:
+            batches = [service.index.ids[rng.choice(len(service), n, replace=False)] for _ in range(repeats)]
+            service.similar(batches[0], k, f)          # calienta caché de máscaras
+            t0 = time.perf_counter()
+            for b in batches:
+                service.similar(b, k, f)
+            ms = (time.perf_counter() - t0) / repeats * 1000
+            label = "-" if f is None else ", ".join(f"{c} >= {v:.2f}" for c, v in f.items())
+            print(f"{n:>9} {label:<40} {ms:>9.2f} {ms / n:>11.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pistas similares por semilla sobre embeddings de pista")
+    parser.add_argument("vectors", nargs="?", default="data/processed_for_modeling/tracks_umap_embedding.parquet",
+                        help="df_pca_components / tracks_umap_embedding (.parquet) o track_embeddings.npy")
+    parser.add_argument("--tracks", default="data/processed_for_modeling/df_processed_full.parquet",
+                        help="df_processed_full.parquet: track_id de las filas del .npy y columnas genre_*/mood_*")
+    parser.add_argument("--kind", default="hnsw", choices=sorted(INDEX_TYPES))
+    parser.add_argument("--metric", default="cosine", choices=("cosine", "l2"))
+    parser.add_argument("--output", default="data/processed_for_modeling/track_index")
+    parser.add_argument("--benchmark", action="store_true", help="Latencia de consultas por lote")
+    args = parser.parse_args()
+
+    tracks = args.tracks if os.path.exists(args.tracks) else None
+    t0 = time.perf_counter()
+    service = TrackSimilarity.build(args.vectors, tracks, kind=args.kind, metric=args.metric)
+    service.save(args.output)
+    print(f"✅ {service!r} → '{args.output}' ({time.perf_counter() - t0:.1f}s)")
+    if args.benchmark:
+        benchmark(TrackSimilarity.load(args.output))
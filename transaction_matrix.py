@@ -0,0 +1,234 @@
+"""
+transaction_matrix.py
+
+Matriz de transacciones playlist × pista dispersa (scipy CSR, bool) en vez
+del pd.crosstab denso de create_transaction_matrix_optimized
+(preprocessing.ipynb), que con ~10k playlists × ~66k pistas ocupa cientos
+de MB aunque solo ~1% de las celdas sean 1.
+
+  - Filas = pid ordenados, columnas = track_id (o id entero del vocabulario
+    de uri_vocab.py) ordenados: el mismo orden que pd.crosstab.
+  - Persistencia en .npz (indptr/indices + etiquetas, sin pickle).
+  - Conversiones para las etapas siguientes: DataFrame disperso de bools
+    (entrada de mlxtend), listas de transacciones (minería de reglas) y
+    CSR float32 normalizada por fila (similitud coseno con X @ X.T).
+
+Uso:
+    tm = TransactionMatrix.from_vocab(df_processed, UriVocabulary.load("data/processed/vocab"))
+    tm.save("data/processed_for_modeling/transactions_matrix.npz")
+    df_transactions = TransactionMatrix.load(...).to_sparse_frame()
+
+    python transaction_matrix.py data/processed_for_modeling/df_processed_full.parquet --benchmark
+"""
+
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+class TransactionMatrix:
+    """CSR bool playlist × ítem con las etiquetas de filas (pid) y columnas (ítems)."""
+
+    def __init__(self, matrix, pids, items):
+        self.matrix = matrix.tocsr()
+        self.pids = np.asarray(pids)
+        self.items = np.asarray(items)
+        self._csc = None
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def nnz(self):
+        return self.matrix.nnz
+
+    def memory_bytes(self):
+        m = self.matrix
+        return m.data.nbytes + m.indices.nbytes + m.indptr.nbytes
+
+    def __repr__(self):
+        n, m = self.shape
+        return (f"TransactionMatrix({n} playlists × {m} ítems, nnz={self.nnz}, "
+                f"densidad={self.nnz / max(n * m, 1):.4%}, {self.memory_bytes() / 1024**2:.2f} MB)")
+
+    # --------------------------------------------------------
+    # Construcción
+    # --------------------------------------------------------
+    @classmethod
+    def from_pairs(cls, pids, items):
+        """(pid, ítem) repetidos se cuentan una vez; filas y columnas ordenadas como en crosstab."""
+        row_labels, rows = np.unique(np.asarray(pids), return_inverse=True)
+        col_labels, cols = np.unique(np.asarray(items), return_inverse=True)
+        data = np.ones(len(rows), dtype=bool)
+        m = sp.csr_matrix((data, (rows.astype(np.int32), cols.astype(np.int32))),
+                          shape=(len(row_labels), len(col_labels)))
+        m.sum_duplicates()
+        m.data[:] = True         # la suma de bools duplicados sigue siendo True
+        return cls(m, row_labels, col_labels)
+
+    @classmethod
+    def from_frame(cls, df, row="pid", col="track_id"):
+        return cls.from_pairs(df[row].to_numpy(), df[col].to_numpy())
+
+    @classmethod
+    def from_interactions(cls, inter):
+        """Desde interactions.Interactions: columnas = ids enteros de pista del vocabulario."""
+        return cls.from_pairs(inter.pid, inter.track_idx)
+
+    @classmethod
+    def from_vocab(cls, df, vocab, row="pid", col="track_id", kind="track"):
+        """
+        Columnas = ids enteros de uri_vocab.UriVocabulary en vez de las cadenas
+        de `col`; las filas cuyo ítem no está en el vocabulario se descartan.
+        """
+        ids = vocab.encode(kind, df[col].to_numpy())
+        known = ids >= 0
+        dropped = int((~known).sum())
+        if dropped:
+            # Vocabulario desactualizado: esas filas no entran en las cestas
+            print(f"⚠️ {dropped:,} filas ({dropped / len(ids):.2%}) con {col} fuera del vocabulario "
+                  f"'{kind}' ({pd.unique(df[col].to_numpy()[~known]).size:,} distintos); se descartan.")
+        return cls.from_pairs(df[row].to_numpy()[known], ids[known])
+
+    # --------------------------------------------------------
+    # Selección
+    # --------------------------------------------------------
+    def csc(self):
+        """Copia CSC (acceso por columna/ítem), cacheada."""
+        if self._csc is None:
+            self._csc = self.matrix.tocsc()
+        return self._csc
+
+    def item_counts(self):
+        """Número de playlists que contienen cada ítem."""
+        return np.diff(self.csc().indptr)
+
+    def item_support(self):
+        return self.item_counts() / max(self.shape[0], 1)
+
+    def filter_items(self, min_count=1):
+        """Solo los ítems presentes en al menos min_count playlists."""
+        keep = np.flatnonzero(self.item_counts() >= min_count)
+        return TransactionMatrix(self.csc()[:, keep], self.pids, self.items[keep])
+
+    def select_rows(self, pids, drop_empty_items=True):
+        """Submatriz de esas playlists (p.ej. las de un cluster)."""
+        pids = np.unique(np.asarray(pids))
+        if len(self.pids):
+            pos = np.minimum(np.searchsorted(self.pids, pids), len(self.pids) - 1)
+            pos = pos[self.pids[pos] == pids]
+        else:                                   # matriz vacía: no hay nada que seleccionar
+            pos = np.empty(0, dtype=np.int64)
+        sub = TransactionMatrix(self.matrix[pos], self.pids[pos], self.items)
+        return sub.filter_items(1) if drop_empty_items else sub
+
+    # --------------------------------------------------------
+    # Conversiones
+    # --------------------------------------------------------
+    def to_sparse_frame(self):
+        """DataFrame de bools disperso (pid × ítem), aceptado por mlxtend apriori/fpgrowth."""
+        return pd.DataFrame.sparse.from_spmatrix(self.matrix, index=pd.Index(self.pids, name="pid"),
+                                                 columns=self.items)
+
+    def to_dense_frame(self):
+        """El DataFrame int8 que devolvía el crosstab (solo para matrices pequeñas)."""
+        return pd.DataFrame(self.matrix.toarray().astype(np.int8),
+                            index=pd.Index(self.pids, name="pid"), columns=self.items)
+
+    def item_labels(self, vocab, kind="track"):
+        """IDs legibles de las columnas (solo para mostrar) si son ids del vocabulario."""
+        return vocab.decode(kind, self.items)
+
+    def to_transactions(self):
+        """Lista de transacciones: ítems de cada playlist."""
+        m = self.matrix
+        return [self.items[m.indices[m.indptr[i]:m.indptr[i + 1]]].tolist() for i in range(m.shape[0])]
+
+    def to_float(self, normalize=True):
+        """CSR float32; con normalize, filas de norma L2 = 1 (X @ X.T = similitud coseno)."""
+        x = self.matrix.astype(np.float32)
+        if normalize:
+            norms = np.sqrt(np.asarray(x.sum(axis=1)).ravel())   # filas binarias: ‖x‖² = nnz
+            norms[norms == 0] = 1.0
+            x = sp.diags(1.0 / norms).astype(np.float32) @ x
+        return x.tocsr()
+
+    # --------------------------------------------------------
+    # Persistencia
+    # --------------------------------------------------------
+    def save(self, path):
+        """.npz sin pickle; los datos bool no se guardan (siempre True)."""
+        m = self.matrix
+        path = str(path)
+        tmp_path = path + ".tmp.npz"
+        items = self.items.astype(str) if self.items.dtype == object else self.items
+        np.savez_compressed(tmp_path, indptr=m.indptr, indices=m.indices,
+                            shape=np.array(m.shape, dtype=np.int64), pids=self.pids, items=items)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            indices, indptr = z["indices"], z["indptr"]
+            m = sp.csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr),
+                              shape=tuple(z["shape"]))
+            return cls(m, z["pids"], z["items"])
+
+
+# ------------------------------------------------------------
+# Benchmark contra create_transaction_matrix_optimized (crosstab)
+# ------------------------------------------------------------
+def crosstab_matrix(df, row="pid", col="track_id"):
+    """Lo que hacía la celda 3.6 de preprocessing.ipynb."""
+    df_subset = df[[row, col]].drop_duplicates()
+    return (pd.crosstab(df_subset[row], df_subset[col], dropna=False) > 0).astype('int8')
+
+
+def benchmark(df, row="pid", col="track_id"):
+    import tracemalloc
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    tm = TransactionMatrix.from_frame(df, row, col)
+    t_sparse = time.perf_counter() - t0
+    peak_sparse = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    dense = crosstab_matrix(df, row, col)
+    t_dense = time.perf_counter() - t0
+    peak_dense = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert dense.shape == tm.shape
+    assert (dense.columns.to_numpy() == tm.items).all() and (dense.index.to_numpy() == tm.pids).all()
+    assert np.array_equal(dense.to_numpy().nonzero()[1], tm.matrix.indices)
+
+    print(repr(tm))
+    print(f"   pd.crosstab denso:  {t_dense:7.2f}s  pico {peak_dense / 1024**2:8.1f} MB  "
+          f"resultado {dense.memory_usage(deep=True).sum() / 1024**2:8.1f} MB")
+    print(f"   CSR bool:           {t_sparse:7.2f}s  pico {peak_sparse / 1024**2:8.1f} MB  "
+          f"resultado {tm.memory_bytes() / 1024**2:8.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Matriz de transacciones playlist × pista dispersa")
+    parser.add_argument("input", nargs="?", default="data/processed_for_modeling/df_processed_full.parquet",
+                        help="Parquet con columnas pid y track_id")
+    parser.add_argument("--output", default="data/processed_for_modeling/transactions_matrix.npz")
+    parser.add_argument("--benchmark", action="store_true", help="Compara tiempo y memoria con pd.crosstab")
+    args = parser.parse_args()
+
+    df = pd.read_parquet(args.input, columns=["pid", "track_id"])
+    if args.benchmark:
+        benchmark(df)
+    else:
+        tm = TransactionMatrix.from_frame(df)
+        tm.save(args.output)
+        print(f"✅ {tm!r} → '{args.output}'")
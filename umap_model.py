@@ -0,0 +1,334 @@
+"""
+umap_model.py
+
+Reductor UMAP que se guarda junto con el índice kNN de sus datos de
+entrenamiento, para proyectar pistas / playlists nuevas sin re-ajustar
+(preprocessing.ipynb hoy hace fit_transform y descarta el reductor; un
+re-ajuste completo toma minutos, ver report.md).
+
+transform() sigue los pasos de UMAP.transform, por lotes:
+  1. vecinos de cada punto nuevo entre los de entrenamiento con el índice
+     guardado (HNSW de vector_index.py, el mismo que construyó el grafo de
+     knn_graph.py).
+  2. pesos difusos (smooth_knn_dist con local_connectivity - 1, como umap)
+     → posición inicial = promedio ponderado de los embeddings vecinos.
+  3. n_epochs de SGD solo sobre los puntos nuevos (atracción a sus vecinos,
+     repulsión con negative_sample_rate muestras), con el embedding de
+     entrenamiento fijo.
+Los pasos 1–3 son numpy: umap solo hace falta para fit(). from_embedding()
+arma el modelo a partir de un embedding ya guardado (p.ej.
+playlist_umap_embedding.parquet) sin re-ajustar.
+
+Directorio guardado: meta.json, ids.npy, embedding.npy, index/ (vector_index)
+y reducer.joblib (el umap.UMAP ajustado, si lo hay).
+
+Uso:
+    model = UMAPModel(n_components=2, random_state=42).fit(X, graph=playlist_graph)
+    model.save("data/processed_for_modeling/playlist_umap_model")
+    model = UMAPModel.load("data/processed_for_modeling/playlist_umap_model")
+    model.transform(X_new)                  # (n_new, 2)
+
+    python umap_model.py data/processed_for_modeling/playlist_for_clustering.parquet \\
+        --embedding data/processed_for_modeling/playlist_umap_embedding.parquet --benchmark
+"""
+
+import os
+import json
+import time
+import argparse
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.optimize import curve_fit
+
+from knn_graph import KNNGraph, METRICS
+from vector_index import INDEX_TYPES, load_vectors, open_index
+
+# Valores por defecto de umap.UMAP que usa transform()
+UMAP_DEFAULTS = {"min_dist": 0.1, "spread": 1.0, "local_connectivity": 1.0, "repulsion_strength": 1.0,
+                 "negative_sample_rate": 5, "learning_rate": 1.0}
+
+
+def find_ab_params(spread=1.0, min_dist=0.1):
+    """a, b de la curva 1 / (1 + a·d^(2b)) de UMAP (misma aproximación que umap.umap_.find_ab_params)."""
+    x = np.linspace(0, spread * 3, 300)
+    y = np.where(x < min_dist, 1.0, np.exp(-(x - min_dist) / spread))
+    (a, b), _ = curve_fit(lambda x, a, b: 1.0 / (1.0 + a * x ** (2 * b)), x, y)
+    return float(a), float(b)
+
+
+def fuzzy_weights(dist, n_neighbors, local_connectivity=0.0, n_iter=64, tol=1e-5):
+    """
+    Pesos exp(-(d - rho) / sigma) de smooth_knn_dist de umap, vectorizado por
+    filas: sigma por bisección para que la suma (sin la primera columna, como
+    umap) valga log2(n_neighbors).
+    """
+    dist = np.asarray(dist, dtype=np.float64)
+    n, k = dist.shape
+    if local_connectivity >= 1:
+        i = int(local_connectivity)
+        nonzero = np.where(dist > 0, dist, np.inf)
+        rho = np.sort(nonzero, axis=1)[:, i - 1]
+        rho = np.where(np.isfinite(rho), rho, 0.0)
+    else:
+        rho = np.zeros(n)
+    target = np.log2(n_neighbors)
+    lo, hi, mid = np.zeros(n), np.full(n, np.inf), np.ones(n)
+    d = dist[:, 1:] - rho[:, None]
+    for _ in range(n_iter):
+        psum = np.where(d > 0, np.exp(-np.maximum(d, 0) / mid[:, None]), 1.0).sum(axis=1)
+        if (np.abs(psum - target) < tol).all():
+            break
+        above = psum > target
+        hi = np.where(above, mid, hi)
+        lo = np.where(above, lo, mid)
+        mid = np.where(np.isinf(hi), mid * 2, (lo + hi) / 2)
+    floor = 1e-3 * np.where(rho > 0, dist.mean(axis=1), dist.mean())
+    sigma = np.maximum(mid, floor)
+    return np.where(dist - rho[:, None] > 0, np.exp(-(dist - rho[:, None]) / sigma[:, None]), 1.0)
+
+
+def optimize_new_points(Y, nbr, w, tail, a, b, n_epochs, initial_alpha=0.25, gamma=1.0,
+                        negative_sample_rate=5, seed=0):
+    """
+    SGD de UMAP (optimize_layout_euclidean, move_other=False) para las filas de
+    Y; `tail` (embedding de entrenamiento) queda fijo. Cada arista (i, nbr[i, j])
+    se muestrea cada wmax / w épocas y arrastra negative_sample_rate repulsiones.
+    """
+    rng = np.random.default_rng(seed)
+    Y = np.array(Y, dtype=np.float32)
+    other = tail[nbr]                                    # (n, k, dim)
+    with np.errstate(divide="ignore"):
+        every = np.where(w > 0, w.max() / w, np.inf)
+    next_sample = every.copy()
+    rows = np.arange(len(Y))
+    for epoch in range(n_epochs):
+        sampled = next_sample <= epoch
+        if not sampled.any():
+            continue
+        alpha = initial_alpha * (1.0 - epoch / n_epochs)
+        diff = Y[:, None, :] - other
+        d2 = np.maximum((diff ** 2).sum(axis=-1), 1e-12)
+        coef = -2.0 * a * b * d2 ** (b - 1.0) / (a * d2 ** b + 1.0)
+        Y += alpha * (np.clip(coef[..., None] * diff, -4, 4) * sampled[..., None]).sum(axis=1)
+        next_sample[sampled] += every[sampled]
+
+        n_neg = sampled.sum(axis=1) * negative_sample_rate
+        neg = tail[rng.integers(0, len(tail), (len(Y), n_neg.max()))]
+        diff = Y[:, None, :] - neg
+        d2 = (diff ** 2).sum(axis=-1)
+        coef = np.where(d2 > 0, 2.0 * gamma * b / ((0.001 + d2) * (a * np.maximum(d2, 1e-12) ** b + 1.0)), 0.0)
+        active = np.arange(neg.shape[1])[None, :] < n_neg[rows, None]
+        Y += alpha * (np.clip(coef[..., None] * diff, -4, 4) * active[..., None]).sum(axis=1)
+    return Y
+
+
+class UMAPModel:
+    """umap.UMAP ajustado + embedding + índice kNN de entrenamiento, con transform() por lotes."""
+
+    def __init__(self, n_neighbors=15, n_components=2, metric="euclidean", random_state=42,
+                 index_method="hnsw", **umap_kwargs):
+        self.n_neighbors = n_neighbors
+        self.n_components = n_components
+        self.metric = metric
+        self.random_state = random_state
+        self.index_method = index_method
+        self.umap_kwargs = umap_kwargs
+        self.params = {**UMAP_DEFAULTS, **{k: v for k, v in umap_kwargs.items() if k in UMAP_DEFAULTS}}
+        self.reducer_ = None
+        self.embedding_ = None
+        self.ids_ = None
+        self.index_ = None
+        self.a_, self.b_ = find_ab_params(self.params["spread"], self.params["min_dist"])
+
+    def __repr__(self):
+        n = 0 if self.embedding_ is None else len(self.embedding_)
+        return (f"UMAPModel({n:,} puntos de entrenamiento, n_neighbors={self.n_neighbors}, "
+                f"{self.n_components}D, {self.metric}, índice {self.index_method})")
+
+    # --------------------------------------------------------
+    # Ajuste
+    # --------------------------------------------------------
+    @staticmethod
+    def _matrix(X, ids=None):
+        if isinstance(X, pd.DataFrame):
+            ids = X.index.to_numpy() if ids is None else ids
+            X = X.select_dtypes(include=np.number).to_numpy()
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        return X, np.arange(len(X)) if ids is None else np.asarray(ids)
+
+    def fit(self, X, graph=None, ids=None):
+        """UMAP sobre X con el grafo kNN de knn_graph.py (se construye si no se pasa) y su índice."""
+        X, self.ids_ = self._matrix(X, ids)
+        if graph is None:
+            graph = KNNGraph.build(X, k=max(30, self.n_neighbors), metric=self.metric, method=self.index_method,
+                                   eval_size=0)
+        self.reducer_ = graph.umap(X, n_neighbors=self.n_neighbors, n_components=self.n_components,
+                                   random_state=self.random_state, **self.umap_kwargs)
+        self.embedding_ = np.asarray(self.reducer_.embedding_, dtype=np.float32)
+        self.a_, self.b_ = float(self.reducer_._a), float(self.reducer_._b)
+        same = graph.method == self.index_method and graph.metric == self.metric
+        self._set_index(X, graph.index if same else None)
+        return self
+
+    def fit_transform(self, X, graph=None, ids=None):
+        return self.fit(X, graph, ids).embedding_
+
+    @classmethod
+    def from_embedding(cls, X, embedding, ids=None, index=None, **params):
+        """Modelo para un embedding ya calculado (reductor descartado): solo índice + a, b."""
+        model = cls(n_components=np.shape(embedding)[1], **params)
+        aligned = ids is not None or isinstance(X, pd.DataFrame)
+        X, model.ids_ = model._matrix(X, ids)
+        if isinstance(embedding, pd.DataFrame):
+            # Con ids (índice de X o `ids`) se alinea por id; si no, por posición
+            embedding = (embedding.reindex(model.ids_) if aligned else embedding).select_dtypes(include=np.number)
+            embedding = embedding.to_numpy()
+        if len(embedding) != len(X) or np.isnan(embedding).any():
+            raise ValueError(f"El embedding no cubre las {len(X):,} filas de X")
+        model.embedding_ = np.ascontiguousarray(embedding, dtype=np.float32)
+        model._set_index(X, index)
+        return model
+
+    def _set_index(self, X, index=None):
+        if index is None:
+            index = INDEX_TYPES[self.index_method](METRICS[self.metric]).build(X)
+        self.index_ = index
+
+    # --------------------------------------------------------
+    # Puntos nuevos
+    # --------------------------------------------------------
+    def _default_epochs(self, n_new):
+        n_epochs = self.umap_kwargs.get("n_epochs")
+        if n_epochs is not None:
+            return int(n_epochs // 3)
+        return 100 if n_new <= 10_000 else 30
+
+    def _transform_batch(self, X, n_epochs, seed):
+        pos, scores = self.index_._search(self.index_._prepare(X), self.n_neighbors)
+        dist = KNNGraph._to_distance(scores, self.metric)
+        missing = pos < 0                   # huecos del IVF: sin vecino, peso 0
+        if missing.any():
+            pos = np.where(missing, 0, pos)
+            worst = np.max(np.where(missing, 0.0, dist), axis=1, keepdims=True)
+            dist = np.where(missing, worst, dist)
+        w = fuzzy_weights(dist, self.n_neighbors, max(0.0, self.params["local_connectivity"] - 1.0))
+        w[missing] = 0.0
+        with np.errstate(invalid="ignore"):     # fila sin ningún vecino → NaN
+            w /= w.sum(axis=1, keepdims=True)
+        Y = np.einsum("ij,ijd->id", w, self.embedding_[pos])
+        if n_epochs <= 0:
+            return Y.astype(np.float32)
+        # Como umap: se descartan aristas con peso < max / n_epochs
+        w = np.where(w < w.max() / n_epochs, 0.0, w)
+        return optimize_new_points(Y, pos, w, self.embedding_, self.a_, self.b_, n_epochs,
+                                   initial_alpha=self.params["learning_rate"] / 4.0,
+                                   gamma=self.params["repulsion_strength"],
+                                   negative_sample_rate=self.params["negative_sample_rate"], seed=seed)
+
+    def transform(self, X, batch_size=4096, n_epochs=None):
+        """Coordenadas UMAP de filas nuevas (n, n_components); n_epochs=0 = solo promedio ponderado."""
+        X, _ = self._matrix(X)
+        n_epochs = self._default_epochs(len(X)) if n_epochs is None else n_epochs
+        seed = 0 if self.random_state is None else self.random_state
+        out = np.empty((len(X), self.n_components), dtype=np.float32)
+        for start in range(0, len(X), batch_size):
+            out[start:start + batch_size] = self._transform_batch(X[start:start + batch_size], n_epochs, seed + start)
+        return out
+
+    def embedding_frame(self, embedding=None, ids=None):
+        """DataFrame UMAP_1..UMAP_n indexado por ids (el formato de *_umap_embedding.parquet)."""
+        embedding = self.embedding_ if embedding is None else embedding
+        ids = self.ids_ if ids is None else ids
+        return pd.DataFrame(embedding, index=ids, columns=[f"UMAP_{i + 1}" for i in range(embedding.shape[1])])
+
+    # --------------------------------------------------------
+    # Persistencia
+    # --------------------------------------------------------
+    def save(self, directory, reducer=True):
+        directory = str(directory)
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "embedding.npy"), self.embedding_)
+        np.save(os.path.join(directory, "ids.npy"), self.ids_.astype(str) if self.ids_.dtype == object else self.ids_)
+        self.index_.save(os.path.join(directory, "index"))
+        if reducer and self.reducer_ is not None:
+            joblib.dump(self.reducer_, os.path.join(directory, "reducer.joblib"))
+        meta = {"n_neighbors": self.n_neighbors, "n_components": self.n_components, "metric": self.metric,
+                "random_state": self.random_state, "index_method": self.index_method,
+                "umap_kwargs": self.umap_kwargs, "a": self.a_, "b": self.b_}
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True, reducer=False):
+        """Abre un modelo guardado; reducer=True carga también el umap.UMAP (requiere umap)."""
+        directory = str(directory)
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        model = cls(meta["n_neighbors"], meta["n_components"], meta["metric"], meta["random_state"],
+                    meta["index_method"], **meta["umap_kwargs"])
+        model.a_, model.b_ = meta["a"], meta["b"]
+        model.embedding_ = np.load(os.path.join(directory, "embedding.npy"), mmap_mode="r" if mmap else None)
+        model.ids_ = np.load(os.path.join(directory, "ids.npy"))
+        model.index_ = open_index(os.path.join(directory, "index"), mmap=mmap)
+        path = os.path.join(directory, "reducer.joblib")
+        if reducer and os.path.exists(path):
+            model.reducer_ = joblib.load(path)
+        return model
+
+
+def benchmark(model, X_new, n_single=200, batch_sizes=(100, 1000, 10_000), X_train=None):
+    """Latencia por punto de transform() (sola y por lotes) vs. re-ajuste completo con los puntos nuevos."""
+    X_new, _ = UMAPModel._matrix(X_new)
+    rows = []
+    single = []
+    for x in X_new[:n_single]:
+        t0 = time.perf_counter()
+        model.transform(x[None, :])
+        single.append(time.perf_counter() - t0)
+    single = np.array(single) * 1000
+    rows.append({"modo": "1 punto", "ms_por_punto": np.median(single), "p99_ms": np.percentile(single, 99)})
+    for size in batch_sizes:
+        batch = X_new[:size]
+        t0 = time.perf_counter()
+        model.transform(batch)
+        elapsed = time.perf_counter() - t0
+        rows.append({"modo": f"lote {len(batch):,}", "ms_por_punto": elapsed * 1000 / len(batch), "p99_ms": np.nan})
+    if X_train is not None:
+        X_train, _ = UMAPModel._matrix(X_train)
+        t0 = time.perf_counter()
+        UMAPModel(model.n_neighbors, model.n_components, model.metric, model.random_state, model.index_method,
+                  **model.umap_kwargs).fit(np.vstack([X_train, X_new]))
+        elapsed = time.perf_counter() - t0
+        rows.append({"modo": "re-ajuste completo", "ms_por_punto": elapsed * 1000, "p99_ms": np.nan})
+    print(f"📊 {model!r}")
+    print(pd.DataFrame(rows).set_index("modo").round(3).to_string())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="UMAP persistido con transform() por lotes para puntos nuevos")
+    parser.add_argument("input", nargs="?", default="data/processed_for_modeling/playlist_for_clustering.parquet",
+                        help="Features de entrenamiento (.parquet / .npy)")
+    parser.add_argument("--columns", nargs="*", default=None, help="Columnas de features (por defecto, numéricas)")
+    parser.add_argument("--embedding", default=None,
+                        help="Embedding ya calculado (.parquet); sin él se ajusta UMAP (requiere umap)")
+    parser.add_argument("--output", default=None, help="Directorio del modelo (por defecto <input>_umap_model)")
+    parser.add_argument("--n-neighbors", type=int, default=15)
+    parser.add_argument("--benchmark", action="store_true", help="Latencia de transform() vs. re-ajuste")
+    parser.add_argument("--refit", action="store_true", help="Incluir el re-ajuste completo en el benchmark")
+    args = parser.parse_args()
+
+    ids, X = load_vectors(args.input, columns=args.columns)
+    if args.embedding:
+        model = UMAPModel.from_embedding(X, pd.read_parquet(args.embedding), ids=ids, n_neighbors=args.n_neighbors)
+    else:
+        model = UMAPModel(n_neighbors=args.n_neighbors).fit(X, ids=ids)
+    output = args.output or os.path.splitext(args.input)[0] + "_umap_model"
+    model.save(output)
+    print(f"✅ {model!r} → '{output}'")
+    if args.benchmark:
+        rng = np.random.default_rng(0)
+        new = X[rng.choice(len(X), min(10_000, len(X)), replace=False)]
+        benchmark(UMAPModel.load(output), new, X_train=X if args.refit else None)
@@ -0,0 +1,121 @@
+"""
+uri_vocab.py
+
+Vocabulario global URI → id entero denso (int32) para pistas, artistas y
+álbumes de Spotify. Los artefactos (interacciones, matrices, reglas) guardan
+estos ids en vez de las URIs / track_id de 22 caracteres, y los textos se
+recuperan solo para mostrar.
+
+  - Acepta 'spotify:track:XYZ' o 'XYZ' (se guarda el ID sin prefijo).
+  - Ids estables: los nuevos se agregan al final (extensión incremental al
+    llegar nuevas playlists); un id nunca cambia de significado.
+  - encode/decode vectorizados (pandas Index / take de numpy).
+  - Persistencia: un .parquet por tipo con los IDs en orden de id.
+
+Uso:
+    vocab = UriVocabulary.load("data/processed/vocab")   # vacío si no existe
+    ids = vocab.add("track", df["track_uri"])            # agrega los nuevos
+    vocab.decode("track", ids[:5], uri=True)             # → 'spotify:track:…'
+    vocab.save("data/processed/vocab")
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+KINDS = ("track", "artist", "album")
+
+
+def strip_uri(uri):
+    """'spotify:track:XYZ' → 'XYZ' (sin cambios si ya es un ID)."""
+    return uri.rsplit(":", 1)[-1] if isinstance(uri, str) and ":" in uri else uri
+
+
+class UriVocabulary:
+    """Diccionario bidireccional ID de Spotify ↔ int32, uno por tipo (track/artist/album)."""
+
+    def __init__(self):
+        self._ids = {kind: {} for kind in KINDS}       # ID → int
+        self._keys = {kind: [] for kind in KINDS}      # int → ID
+        self._cache = {}                               # (tipo, "array"/"index") → caché
+
+    def __len__(self):
+        return len(self._keys["track"])
+
+    def size(self, kind):
+        return len(self._keys[kind])
+
+    # --------------------------------------------------------
+    # Codificación
+    # --------------------------------------------------------
+    def add_one(self, kind, uri):
+        """Id de una URI, agregándola si es nueva (para el bucle de lectura en streaming)."""
+        key = strip_uri(uri)
+        ids = self._ids[kind]
+        idx = ids.get(key)
+        if idx is None:
+            idx = ids[key] = len(ids)
+            self._keys[kind].append(key)
+            self._cache.pop((kind, "array"), None)
+            self._cache.pop((kind, "index"), None)
+        return idx
+
+    def add(self, kind, uris):
+        """Ids int32 de un lote de URIs; las desconocidas se agregan al final."""
+        add_one = self.add_one
+        return np.fromiter((add_one(kind, u) for u in uris), dtype=np.int32)
+
+    def encode(self, kind, uris):
+        """Ids int32 de un lote de URIs sin extender el vocabulario (-1 si no existe)."""
+        keys = pd.Series(uris, dtype=object).map(strip_uri)
+        index = self._cache.get((kind, "index"))
+        if index is None:
+            index = self._cache[kind, "index"] = pd.Index(self.keys(kind))
+        return index.get_indexer(keys).astype(np.int32)
+
+    # --------------------------------------------------------
+    # Búsqueda inversa
+    # --------------------------------------------------------
+    def keys(self, kind):
+        """Array de IDs (posición = id). Se cachea hasta la siguiente extensión."""
+        arr = self._cache.get((kind, "array"))
+        if arr is None:
+            arr = self._cache[kind, "array"] = np.array(self._keys[kind], dtype=object)
+        return arr
+
+    def decode(self, kind, ids, uri=False):
+        """IDs (o URIs completas con uri=True) de un lote de ids; None para -1."""
+        ids = np.asarray(ids, dtype=np.int64)
+        keys = self.keys(kind)
+        out = keys.take(np.where(ids >= 0, ids, 0)) if len(keys) else np.empty(len(ids), dtype=object)
+        if uri:
+            out = np.array([f"spotify:{kind}:{k}" for k in out], dtype=object)
+        out[ids < 0] = None
+        return out
+
+    # --------------------------------------------------------
+    # Persistencia
+    # --------------------------------------------------------
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for kind in KINDS:
+            path = os.path.join(directory, f"{kind}.parquet")
+            tmp_path = path + ".tmp"
+            pq.write_table(pa.table({"id": pa.array(self._keys[kind], type=pa.string())}), tmp_path)
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory):
+        """Carga el vocabulario de `directory`; vacío si no existe todavía."""
+        vocab = cls()
+        for kind in KINDS:
+            path = os.path.join(directory, f"{kind}.parquet")
+            if not os.path.exists(path):
+                continue
+            keys = pq.read_table(path).column("id").to_pylist()
+            vocab._keys[kind] = keys
+            vocab._ids[kind] = {k: i for i, k in enumerate(keys)}
+        return vocab
@@ -0,0 +1,455 @@
+"""
+vector_index.py
+
+Búsqueda de vecinos más cercanos sobre vectores de features (playlists o
+pistas): "qué playlists se parecen a la pid X" sin recorrer las N filas.
+
+  - BruteForceIndex: exacto, por lotes de consultas con una multiplicación
+    de matrices (BLAS) y argpartition. Es la referencia para medir recall.
+  - IVFIndex: aproximado, IVF-Flat propio (centroides con MiniBatchKMeans,
+    listas invertidas y `nprobe` listas por consulta); solo numpy/sklearn.
+  - HNSWIndex: aproximado, grafo HNSW con hnswlib (dependencia opcional).
+
+Métricas: "cosine" (similitud, mayor = más parecido) o "l2" (distancia
+euclídea al cuadrado, menor = más parecido). Todos se guardan en un
+directorio (meta.json + ids.npy + vectors.npy float32 que se abre con
+memory map) y se abren con open_index().
+
+Uso:
+    ids, X = load_vectors("data/processed_for_modeling/playlist_pca_components.parquet")
+    index = HNSWIndex(metric="cosine").build(X, ids)
+    index.save("data/processed_for_modeling/playlist_index")
+    nbr_ids, scores = open_index("data/processed_for_modeling/playlist_index").similar([pid], k=10)
+
+    python vector_index.py data/processed_for_modeling/playlist_pca_components.parquet --benchmark
+    python vector_index.py --check      # save → open_index → search/similar con ids de texto
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+METRICS = ("cosine", "l2")
+
+
+def load_vectors(path, columns=None, id_column=None):
+    """
+    (ids, matriz float32) desde un .parquet (índice o id_column = ids; columnas
+    numéricas o `columns`) o un .npy (ids = posición).
+    """
+    path = str(path)
+    if path.endswith(".npy"):
+        x = np.load(path, mmap_mode="r")
+        return np.arange(len(x)), np.ascontiguousarray(x, dtype=np.float32)
+    df = pd.read_parquet(path)
+    if id_column is not None:
+        df = df.set_index(id_column)
+    if columns is None:
+        columns = df.select_dtypes("number").columns
+    return df.index.to_numpy(), np.ascontiguousarray(df[list(columns)].to_numpy(dtype=np.float32))
+
+
+def _topk(scores, k, largest=True):
+    """Índices de las k mejores columnas por fila, ordenados."""
+    k = min(k, scores.shape[1])
+    s = -scores if largest else scores
+    part = np.argpartition(s, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(s, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+class _VectorIndex:
+    """Base común: ids, métrica, normalización y persistencia de los vectores."""
+
+    kind = None
+
+    def __init__(self, metric="cosine"):
+        if metric not in METRICS:
+            raise ValueError(f"metric debe ser uno de {METRICS}, no {metric!r}")
+        self.metric = metric
+        self.ids = None
+        self.vectors = None
+        self._position = None
+
+    def __len__(self):
+        return 0 if self.ids is None else len(self.ids)
+
+    def __repr__(self):
+        dim = None if self.vectors is None else self.vectors.shape[1]
+        return f"{type(self).__name__}({len(self)} vectores, dim={dim}, metric={self.metric})"
+
+    def _prepare(self, x):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        if self.metric == "cosine":
+            norms = np.linalg.norm(x, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            x = x / norms
+        return x
+
+    def _set_data(self, vectors, ids):
+        self.vectors = self._prepare(vectors)
+        self.ids = np.arange(len(vectors)) if ids is None else np.asarray(ids)
+        self._position = None
+        return self
+
+    @property
+    def largest(self):
+        """True si un score mayor es mejor (similitud coseno)."""
+        return self.metric == "cosine"
+
+    def positions(self, ids):
+        if self._position is None:
+            self._position = pd.Index(self.ids)
+        pos = self._position.get_indexer(np.asarray(ids))
+        if (pos < 0).any():
+            raise KeyError(f"ids no indexados: {np.asarray(ids)[pos < 0][:5].tolist()}")
+        return pos
+
+    # --- consultas ---
+    def _search(self, queries, k):
+        raise NotImplementedError
+
+    def _ids_at(self, pos):
+        """ids de las posiciones; -1 en los huecos (array object si los ids no son numéricos)."""
+        if not len(self.ids):
+            return pos
+        ids = self.ids[np.maximum(pos, 0)]
+        if np.issubdtype(ids.dtype, np.number):
+            return np.where(pos >= 0, ids, -1)
+        ids = ids.astype(object)            # p.ej. track_id '<U22' tras save()/open_index()
+        ids[pos < 0] = -1
+        return ids
+
+    def search(self, queries, k=10):
+        """(ids (nq, k), scores (nq, k)) de los k vecinos de cada vector de consulta."""
+        queries = self._prepare(np.atleast_2d(queries))
+        pos, scores = self._search(queries, k)
+        return self._ids_at(pos), scores
+
+    def similar(self, ids, k=10):
+        """Vecinos de elementos ya indexados, sin incluirse a sí mismos."""
+        pos = self.positions(ids)
+        found, scores = self._search(np.asarray(self.vectors[pos]), k + 1)
+        # Huecos (IVF con pocas listas sondeadas): id -1 y score ±inf, como en search()
+        out_pos = np.full((len(pos), k), -1, dtype=np.int64)
+        out_scores = np.full((len(pos), k), -np.inf if self.largest else np.inf, dtype=np.float32)
+        for r, p in enumerate(pos):
+            keep = (found[r] != p) & (found[r] >= 0)
+            sel = found[r][keep][:k]
+            out_pos[r, :len(sel)] = sel
+            out_scores[r, :len(sel)] = scores[r][keep][:k]
+        return self._ids_at(out_pos), out_scores
+
+    # --- persistencia ---
+    def _meta(self):
+        return {"kind": self.kind, "metric": self.metric}
+
+    def save(self, directory):
+        directory = str(directory)
+        os.makedirs(directory, exist_ok=True)
+        ids = self.ids.astype(str) if self.ids.dtype == object else self.ids
+        np.save(os.path.join(directory, "ids.npy"), ids)
+        np.save(os.path.join(directory, "vectors.npy"), np.asarray(self.vectors, dtype=np.float32))
+        self._save_extra(directory)
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self._meta(), f, indent=2)
+        return directory
+
+    def _save_extra(self, directory):
+        pass
+
+    def _load_extra(self, directory, meta):
+        pass
+
+    @classmethod
+    def _load(cls, directory, meta, mmap=True):
+        index = cls.__new__(cls)
+        _VectorIndex.__init__(index, meta["metric"])
+        index.ids = np.load(os.path.join(directory, "ids.npy"))
+        index.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r" if mmap else None)
+        index._load_extra(directory, meta)
+        return index
+
+
+# ------------------------------------------------------------
+# 1) Exacto
+# ------------------------------------------------------------
+class BruteForceIndex(_VectorIndex):
+    """Búsqueda exacta por lotes (producto matricial + argpartition)."""
+
+    kind = "brute"
+
+    def __init__(self, metric="cosine", batch_size=1024):
+        super().__init__(metric)
+        self.batch_size = batch_size
+        self._sq_norms = None
+
+    def build(self, vectors, ids=None):
+        self._set_data(vectors, ids)
+        self._sq_norms = None
+        return self
+
+    def _scores(self, q):
+        s = q @ np.asarray(self.vectors).T
+        if self.metric == "l2":
+            if self._sq_norms is None:
+                self._sq_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+            s = np.einsum("ij,ij->i", q, q)[:, None] - 2 * s + self._sq_norms[None, :]
+        return s
+
+    def _search(self, queries, k):
+        k = min(k, len(self))
+        pos = np.empty((len(queries), k), dtype=np.int64)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        for start in range(0, len(queries), self.batch_size):
+            s = self._scores(queries[start:start + self.batch_size])
+            top = _topk(s, k, self.largest)
+            pos[start:start + len(top)] = top
+            scores[start:start + len(top)] = np.take_along_axis(s, top, axis=1)
+        return pos, scores
+
+    def _meta(self):
+        return {**super()._meta(), "batch_size": self.batch_size}
+
+    def _load_extra(self, directory, meta):
+        self.batch_size = meta.get("batch_size", 1024)
+        self._sq_norms = None
+
+
+# ------------------------------------------------------------
+# 2) IVF-Flat (numpy)
+# ------------------------------------------------------------
+class IVFIndex(_VectorIndex):
+    """Listas invertidas por centroide; se revisan las `nprobe` listas más cercanas."""
+
+    kind = "ivf"
+
+    def __init__(self, metric="cosine", n_lists=None, nprobe=8, random_state=0):
+        super().__init__(metric)
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.random_state = random_state
+        self.centroids = None
+        self.order = None      # posiciones agrupadas por lista
+        self.offsets = None    # lista l = order[offsets[l]:offsets[l + 1]]
+
+    def build(self, vectors, ids=None):
+        from sklearn.cluster import MiniBatchKMeans
+
+        self._set_data(vectors, ids)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(self.vectors))))
+        km = MiniBatchKMeans(n_clusters=n_lists, random_state=self.random_state, n_init=3,
+                             batch_size=4096).fit(self.vectors)
+        self.centroids = self._prepare(km.cluster_centers_) if self.metric == "cosine" \
+            else km.cluster_centers_.astype(np.float32)
+        self.n_lists = n_lists
+        self._assign(self._nearest_lists(self.vectors, 1)[:, 0])
+        return self
+
+    def _assign(self, labels):
+        self.order = np.argsort(labels, kind="stable")
+        self.offsets = np.searchsorted(labels[self.order], np.arange(self.n_lists + 1))
+
+    def _nearest_lists(self, q, nprobe):
+        s = q @ self.centroids.T
+        if self.metric == "l2":
+            s = -2 * s + np.einsum("ij,ij->i", self.centroids, self.centroids)[None, :]
+            return _topk(s, nprobe, largest=False)
+        return _topk(s, nprobe, largest=True)
+
+    def _search(self, queries, k):
+        probes = self._nearest_lists(queries, min(self.nprobe, self.n_lists))
+        pos = np.full((len(queries), k), -1, dtype=np.int64)
+        fill = np.inf if self.metric == "l2" else -np.inf
+        scores = np.full((len(queries), k), fill, dtype=np.float32)
+        for r, q in enumerate(queries):
+            cand = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in probes[r]])
+            if not len(cand):
+                continue
+            x = np.asarray(self.vectors[cand])
+            s = x @ q
+            if self.metric == "l2":
+                s = np.einsum("ij,ij->i", x, x) - 2 * s + q @ q
+            top = _topk(s[None, :], k, self.largest)[0]
+            pos[r, :len(top)] = cand[top]
+            scores[r, :len(top)] = s[top]
+        return pos, scores
+
+    def _meta(self):
+        return {**super()._meta(), "n_lists": self.n_lists, "nprobe": self.nprobe}
+
+    def _save_extra(self, directory):
+        np.savez(os.path.join(directory, "ivf.npz"), centroids=self.centroids,
+                 order=self.order, offsets=self.offsets)
+
+    def _load_extra(self, directory, meta):
+        self.n_lists, self.nprobe = meta["n_lists"], meta["nprobe"]
+        self.random_state = 0
+        with np.load(os.path.join(directory, "ivf.npz")) as z:
+            self.centroids, self.order, self.offsets = z["centroids"], z["order"], z["offsets"]
+
+
+# ------------------------------------------------------------
+# 3) HNSW (hnswlib, opcional)
+# ------------------------------------------------------------
+class HNSWIndex(_VectorIndex):
+    """Grafo HNSW de hnswlib; etiquetas internas = posición del vector."""
+
+    kind = "hnsw"
+
+    def __init__(self, metric="cosine", M=16, ef_construction=200, ef=64, num_threads=-1):
+        super().__init__(metric)
+        self.M, self.ef_construction, self.ef = M, ef_construction, ef
+        self.num_threads = num_threads
+        self.graph = None
+
+    @staticmethod
+    def _hnswlib():
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("HNSWIndex requiere hnswlib (pip install hnswlib); "
+                              "sin él usa IVFIndex") from e
+        return hnswlib
+
+    def _space(self):
+        return "ip" if self.metric == "cosine" else "l2"   # vectores ya normalizados para coseno
+
+    def build(self, vectors, ids=None):
+        hnswlib = self._hnswlib()
+        self._set_data(vectors, ids)
+        self.graph = hnswlib.Index(space=self._space(), dim=self.vectors.shape[1])
+        self.graph.init_index(max_elements=len(self.vectors), ef_construction=self.ef_construction, M=self.M)
+        self.graph.add_items(self.vectors, np.arange(len(self.vectors)), num_threads=self.num_threads)
+        self.graph.set_ef(self.ef)
+        return self
+
+    def _search(self, queries, k):
+        self.graph.set_ef(max(self.ef, k))
+        labels, dist = self.graph.knn_query(queries, k=min(k, len(self)), num_threads=self.num_threads)
+        # hnswlib "ip" devuelve 1 - producto interno
+        scores = 1.0 - dist if self.metric == "cosine" else dist
+        return labels.astype(np.int64), scores.astype(np.float32)
+
+    def _meta(self):
+        return {**super()._meta(), "M": self.M, "ef_construction": self.ef_construction, "ef": self.ef}
+
+    def _save_extra(self, directory):
+        self.graph.save_index(os.path.join(directory, "hnsw.bin"))
+
+    def _load_extra(self, directory, meta):
+        hnswlib = self._hnswlib()
+        self.M, self.ef_construction, self.ef = meta["M"], meta["ef_construction"], meta["ef"]
+        self.num_threads = -1
+        self.graph = hnswlib.Index(space=self._space(), dim=self.vectors.shape[1])
+        self.graph.load_index(os.path.join(directory, "hnsw.bin"), max_elements=len(self.ids))
+        self.graph.set_ef(self.ef)
+
+
+INDEX_TYPES = {cls.kind: cls for cls in (BruteForceIndex, IVFIndex, HNSWIndex)}
+
+
+def open_index(directory, mmap=True):
+    """Abre un índice guardado con save() (el tipo se lee de meta.json)."""
+    directory = str(directory)
+    with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    return INDEX_TYPES[meta["kind"]]._load(directory, meta, mmap=mmap)
+
+
+# ------------------------------------------------------------
+# Evaluación: recall@k y QPS contra el exacto
+# ------------------------------------------------------------
+def evaluate(index, exact, queries, k=10):
+    """recall@k (fracción de los k vecinos exactos recuperados) y consultas por segundo."""
+    t0 = time.perf_counter()
+    approx_ids, _ = index.search(queries, k)
+    elapsed = time.perf_counter() - t0
+    true_ids, _ = exact.search(queries, k)
+    hits = sum(len(np.intersect1d(a, t)) for a, t in zip(approx_ids, true_ids))
+    return hits / true_ids.size, len(queries) / elapsed
+
+
+def check(n=2000, dim=16, k=10, seed=0):
+    """
+    save() → open_index() → search()/similar() con ids de texto (como track_id)
+    en cada tipo de índice, incluidos los huecos -1 del IVF con nprobe=1.
+    """
+    import tempfile
+
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, dim)).astype(np.float32)
+    ids = np.array([f"track{i:06d}" for i in range(n)], dtype=object)
+    configs = [("brute", lambda m: BruteForceIndex(m)), ("ivf", lambda m: IVFIndex(m, n_lists=64, nprobe=1))]
+    try:
+        HNSWIndex._hnswlib()
+        configs.append(("hnsw", lambda m: HNSWIndex(m)))
+    except ImportError:
+        print("   (hnswlib no instalado: se omite HNSW)")
+    for metric in METRICS:
+        for name, make in configs:
+            with tempfile.TemporaryDirectory() as directory:
+                make(metric).build(X, ids).save(directory)
+                index = open_index(directory)
+                found, _ = index.search(X[:5], k)
+                assert found[0, 0] == ids[0], (name, metric, found[0, 0])
+                nbr, _ = index.similar(ids[:5], k=3 * k)
+                assert not (nbr == ids[:5, None]).any(), (name, metric)
+                real = nbr[nbr != -1]
+                assert np.isin(real, ids).all(), (name, metric)
+                holes = (nbr == -1).sum()
+            print(f"✅ {name:<5} {metric:<6} save → open_index → search/similar con ids de texto "
+                  f"({holes} huecos -1)")
+
+
+def benchmark(ids, vectors, metric="cosine", k=10, n_queries=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)]
+    exact = BruteForceIndex(metric).build(vectors, ids)
+    print(f"📊 {len(vectors)} vectores × {vectors.shape[1]} dims, {len(queries)} consultas, k={k}, {metric}")
+    print(f"{'índice':<28} {'build':>8} {'recall@k':>9} {'QPS':>10}")
+
+    configs = [("brute", lambda: BruteForceIndex(metric))]
+    configs += [(f"ivf nprobe={p}", lambda p=p: IVFIndex(metric, nprobe=p)) for p in (1, 4, 16)]
+    try:
+        HNSWIndex._hnswlib()
+        configs += [(f"hnsw ef={ef}", lambda ef=ef: HNSWIndex(metric, ef=ef)) for ef in (16, 64, 256)]
+    except ImportError:
+        print("   (hnswlib no instalado: se omite HNSW)")
+
+    for name, make in configs:
+        t0 = time.perf_counter()
+        index = make().build(vectors, ids)
+        t_build = time.perf_counter() - t0
+        recall, qps = evaluate(index, exact, queries, k)
+        print(f"{name:<28} {t_build:>7.2f}s {recall:>9.3f} {qps:>10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice de vecinos más cercanos sobre vectores de playlists/pistas")
+    parser.add_argument("vectors", nargs="?", default="data/processed_for_modeling/playlist_pca_components.parquet",
+                        help=".parquet (índice = id, columnas numéricas) o .npy")
+    parser.add_argument("--kind", default="hnsw", choices=sorted(INDEX_TYPES))
+    parser.add_argument("--metric", default="cosine", choices=METRICS)
+    parser.add_argument("--output", default="data/processed_for_modeling/playlist_index")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--benchmark", action="store_true", help="recall@k y QPS de cada índice contra el exacto")
+    parser.add_argument("--check", action="store_true",
+                        help="Guardar/abrir/consultar cada índice con ids de texto (datos sintéticos)")
+    args = parser.parse_args()
+
+    if args.check:
+        check()
+        raise SystemExit
+    ids, X = load_vectors(args.vectors)
+    if args.benchmark:
+        benchmark(ids, X, args.metric, args.k)
+    else:
+        t0 = time.perf_counter()
+        index = INDEX_TYPES[args.kind](args.metric).build(X, ids)
+        index.save(args.output)
+        print(f"✅ {index!r} → '{args.output}' ({time.perf_counter() - t0:.1f}s)")